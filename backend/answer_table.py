@@ -0,0 +1,122 @@
+# Filename: answer_table.py
+import hashlib
+import itertools
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger("ssense_chatbot")
+
+# Queries enumerating the finite domain of each enum input argument from the KB facts.
+ARG_DOMAIN_QUERIES = {
+    'Region': "shipping_cost(ship, region(Value), _).",
+    'PhoneType': "phone_details(cc, Value, _, _).",
+    'UserType': "initiation_method(req, Value, _).",
+    'ItemType': "excluded_item_type(excl, Value, _).",
+}
+# Predicates whose input space is open-ended and therefore never materialized.
+NON_MATERIALIZED_PREDICATES = {'is_eligible'}
+
+
+def kb_fingerprint(kb_filename):
+    """Returns a content hash identifying one version of the KB file."""
+    with open(kb_filename, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def enumerate_arg_domains(prolog):
+    """Queries the KB for the distinct atoms each enum input argument can take."""
+    domains = {}
+    for arg_name, domain_query in ARG_DOMAIN_QUERIES.items():
+        values = {str(solution['Value']).strip("'") for solution in prolog.query(domain_query)}
+        domains[arg_name] = sorted(values)
+        logger.debug(f"Domain for {arg_name}: {domains[arg_name]}")
+    return domains
+
+
+def enumerate_query_pairs(predicate_input_args, arg_domains):
+    """Yields every (predicate, args) pair whose inputs all come from a finite domain."""
+    for predicate_name, input_arg_names in predicate_input_args.items():
+        if predicate_name in NON_MATERIALIZED_PREDICATES:
+            continue
+        if any(arg_name not in arg_domains for arg_name in input_arg_names):
+            logger.debug(f"Skipping {predicate_name}: no finite domain for all of {input_arg_names}")
+            continue
+        for values in itertools.product(*(arg_domains[arg_name] for arg_name in input_arg_names)):
+            yield predicate_name, dict(zip(input_arg_names, values))
+
+
+class AnswerTable:
+    """Precomputed answers for the finite (predicate, args) space, tagged with the KB version they came from."""
+
+    def __init__(self, path, predicate_input_args):
+        self.path = path
+        self.predicate_input_args = predicate_input_args
+        self.kb_version = None
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def key(self, predicate_name, args_dict):
+        input_arg_names = self.predicate_input_args.get(predicate_name)
+        if input_arg_names is None or any(arg_name not in args_dict for arg_name in input_arg_names):
+            return None
+        return json.dumps([predicate_name] + [args_dict[arg_name] for arg_name in input_arg_names])
+
+    def lookup(self, predicate_name, args_dict, kb_version):
+        """Returns the stored answer entry, or None on a miss or when the table is stale."""
+        if kb_version != self.kb_version:
+            return None
+        key = self.key(predicate_name, args_dict)
+        if key is None:
+            return None
+        return self.entries.get(key)
+
+    def load(self, kb_version):
+        """Loads the table from disk. Returns False if it is missing or was built from another KB version."""
+        if not os.path.exists(self.path):
+            logger.info(f"Answer table file '{self.path}' not found.")
+            return False
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('kb_version') != kb_version:
+            logger.info(f"Answer table '{self.path}' was built from another KB version; ignoring it.")
+            return False
+        with self._lock:
+            self.entries = data.get('entries', {})
+            self.kb_version = kb_version
+        logger.info(f"Loaded {len(self.entries)} materialized answers from '{self.path}'")
+        return True
+
+    def build(self, kb_version, query_pairs, answer_fn):
+        """
+        Materializes an entry for every pair with answer_fn(predicate, args), then swaps it in and saves it.
+        Pairs for which answer_fn returns None or raises are left out and go through the full pipeline.
+        """
+        entries = {}
+        for predicate_name, args_dict in query_pairs:
+            try:
+                entry = answer_fn(predicate_name, args_dict)
+            except Exception as e:
+                logger.error(f"Error materializing answer for {predicate_name} {args_dict}: {e}", exc_info=True)
+                continue
+            if entry is not None:
+                entries[self.key(predicate_name, args_dict)] = entry
+        with self._lock:
+            self.entries = entries
+            self.kb_version = kb_version
+        self.save()
+        logger.info(f"Built answer table with {len(entries)} entries for KB version {kb_version[:12]}")
+        return len(entries)
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'kb_version': self.kb_version, 'entries': self.entries}, f, indent=2, default=str)
+        os.replace(tmp_path, self.path)
+
+
+if __name__ == '__main__':
+    import app
+    app.create_app()
+    app.build_answer_table()
@@ -1,393 +1,1042 @@
 # Filename: app.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+import contextlib
+import hmac
 import json
 import os
 import logging
+import threading
 import time
 from openai import OpenAI
 from dotenv import load_dotenv
-from pyswip import Prolog, Atom, Variable, Functor
-
-KB_FILENAME = 'ssense_policy.pl'
-NLU_PROMPT_FILE = "nlu_prompt.txt"
-NLG_PROMPT_FILE = "nlg_prompt.txt"
-LOG_FILE = "ssense_debug.log"
-ALLOWED_PREDICATES = [
-    'is_eligible', 'get_return_window', 'get_shipping_cost',
-    'get_return_label_info', 'get_return_fee', 'is_item_excluded',
-    'get_initiation_method', 'can_exchange', 'get_contact_email',
-    'get_contact_chat_availability', 'get_phone_number',
-    'get_damaged_item_action', 'get_warranty_provider', 'is_warranty_by_ssense'
-]
-PREDICATE_OUTPUT_VARS = {
-    'get_return_window': {1: 'Days'},
-    'get_shipping_cost': {2: 'CostType'},
-    'get_return_label_info': {2: 'LabelInfo'},
-    'get_return_fee': {2: 'Amount', 3: 'Currency'},
-    'is_item_excluded': {2: 'ReasonStructure'},
-    'get_initiation_method': {2: 'Method'},
-    'can_exchange': {1: 'Result'},
-    'get_contact_email': {1: 'Email'},
-    'get_contact_chat_availability': {1: 'Availability'},
-    'get_phone_number': {2: 'Number', 3: 'Hours'},
-    'get_damaged_item_action': {1: 'Action'},
-    'get_warranty_provider': {1: 'Provider'},
-    'is_warranty_by_ssense': {1: 'Result'},
-    'is_eligible': {}
-}
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
+from kb_schema import ALLOWED_PREDICATES, PREDICATE_OUTPUT_VARS, PREDICATE_INPUT_ARGS
+from nlu_cache import create_nlu_cache, normalize_question
+from nlg_templates import render_answer
+from intent_router import IntentRouter
+from answer_table import AnswerTable, enumerate_arg_domains, enumerate_query_pairs, kb_fingerprint
+from prolog_pool import PrologPool, create_prolog_engine, precompile_kb
+from kb_reload import KBReloader, KnowledgeBase
+from metrics import NLU_ESCALATIONS, NLU_PROMPT_TOKENS, REGISTRY, RequestTimer, StartupTimer
+from log_config import LazyJSON, configure_logging, restart_listener
+from query_plans import QUERY_PLANS, load_explanations
+from eligibility_batch import check_eligibility_batch
+from chat_batch import parse_batch_questions, run_chat_batch
+from singleflight import SingleFlight, flight_key
+from llm_calls import HedgePolicy, LLMDeadlineExceeded, LLMStage, complete, nlu_output_problem, stream_completion
+from nlu_prompt_builder import NLUPromptBuilder
+from policy_index import PolicyIndexLoader
+from responses import COMPRESSIBLE_TYPES, accepted_encoding, compress, debug_flag, encode_json, strip_debug
+from session_store import (SessionStore, apply_filled_slots, build_slot_messages, conversation_id_or_new,
+                           fill_slots_locally, missing_slots, parse_slot_output)
+
+# .env is searched for from this file's directory up, and read before any setting below.
+load_dotenv()
+# Every file is resolved against this directory, so the app starts the same from any working directory.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+def backend_path(path):
+    return os.path.join(BASE_DIR, path)
+KB_FILENAME = backend_path('ssense_policy.pl')
+KB_PRECOMPILE = os.environ.get('KB_PRECOMPILE', 'true').lower() == 'true'
+NLU_PROMPT_FILE = backend_path("nlu_prompt.txt")
+NLG_PROMPT_FILE = backend_path("nlg_prompt.txt")
+SLOT_PROMPT_FILE = backend_path("slot_prompt.txt")
+LOG_FILE = backend_path(os.environ.get('LOG_FILE', "ssense_debug.log"))
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'DEBUG').upper()
+LOG_MODE = os.environ.get('LOG_MODE', 'sync')
+LOG_SAMPLE_RATES = os.environ.get('LOG_SAMPLE_RATES', '')
+NLU_CACHE_BACKEND = os.environ.get('NLU_CACHE_BACKEND', 'memory')
+NLU_CACHE_PATH = backend_path(os.environ.get('NLU_CACHE_PATH', 'nlu_cache.sqlite3'))
+NLU_CACHE_MAX_ENTRIES = int(os.environ.get('NLU_CACHE_MAX_ENTRIES', 1024))
+NLU_CACHE_TTL_SECONDS = int(os.environ.get('NLU_CACHE_TTL_SECONDS', 3600))
+ANSWER_TABLE_FILE = backend_path(os.environ.get('ANSWER_TABLE_FILE', 'answer_table.json'))
+ANSWER_TABLE_MODE = os.environ.get('ANSWER_TABLE_MODE', 'auto')
+NLG_ENGINE = os.environ.get('NLG_ENGINE', 'template')
+NLU_ROUTER_ENABLED = os.environ.get('NLU_ROUTER_ENABLED', 'true').lower() == 'true'
+NLU_ROUTER_THRESHOLD = float(os.environ.get('NLU_ROUTER_THRESHOLD', 0.85))
+NLU_ROUTER_TRAINING_FILE = backend_path("router_training.json")
+NLU_PROMPT_MODE = os.environ.get('NLU_PROMPT_MODE', 'full').lower()
+NLU_PROMPT_MAX_PREDICATES = int(os.environ.get('NLU_PROMPT_MAX_PREDICATES', 4))
+NLU_PROMPT_COVERAGE = float(os.environ.get('NLU_PROMPT_COVERAGE', 0.95))
+NLU_LOG_FILE = backend_path(os.environ['NLU_LOG_FILE']) if os.environ.get('NLU_LOG_FILE') else ''
+KB_SENTENCES_FILE = backend_path(os.path.join('..', 'tools', 'kb_sentences.json'))
+POLICY_CITATIONS = int(os.environ.get('POLICY_CITATIONS', 3))
+POLICY_CITATION_MIN_SCORE = float(os.environ.get('POLICY_CITATION_MIN_SCORE', 1.5))
+POLICY_FALLBACK_MIN_SCORE = float(os.environ.get('POLICY_FALLBACK_MIN_SCORE', 2.5))
+POLICY_INDEX_WATCH_INTERVAL_SECONDS = float(os.environ.get('POLICY_INDEX_WATCH_INTERVAL_SECONDS', 30))
+PROLOG_POOL_SIZE = int(os.environ.get('PROLOG_POOL_SIZE', 0))
+PROLOG_QUERY_TIMEOUT_SECONDS = float(os.environ.get('PROLOG_QUERY_TIMEOUT_SECONDS', 2))
+PROLOG_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('PROLOG_QUEUE_TIMEOUT_SECONDS', 5))
+PROLOG_MAX_QUERIES_PER_WORKER = int(os.environ.get('PROLOG_MAX_QUERIES_PER_WORKER', 0))
+KB_TEST_FILE = backend_path(os.path.join('..', 'tools', 'prolog_test.py'))
+KB_WATCH_INTERVAL_SECONDS = float(os.environ.get('KB_WATCH_INTERVAL_SECONDS', 0))
+KB_RELOAD_DRAIN_SECONDS = float(os.environ.get('KB_RELOAD_DRAIN_SECONDS', 30))
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+SESSION_MAX_ENTRIES = int(os.environ.get('SESSION_MAX_ENTRIES', 10000))
+SESSION_TTL_SECONDS = int(os.environ.get('SESSION_TTL_SECONDS', 900))
+SLOT_MODEL = os.environ.get('SLOT_MODEL', 'gpt-4o-mini')
+NLU_MODEL = os.environ.get('NLU_MODEL', 'gpt-4o-mini')
+NLU_ESCALATION_MODEL = os.environ.get('NLU_ESCALATION_MODEL', 'gpt-4o')
+NLG_MODEL = os.environ.get('NLG_MODEL', 'gpt-4o')
+NLU_TIMEOUT_SECONDS = float(os.environ.get('NLU_TIMEOUT_SECONDS', 15))
+NLG_TIMEOUT_SECONDS = float(os.environ.get('NLG_TIMEOUT_SECONDS', 20))
+LLM_HEDGE_ENABLED = os.environ.get('LLM_HEDGE_ENABLED', 'false').lower() == 'true'
+LLM_HEDGE_PERCENTILE = float(os.environ.get('LLM_HEDGE_PERCENTILE', 95))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get('LLM_HEDGE_MIN_SAMPLES', 20))
+LLM_HEDGE_INITIAL_DELAY_SECONDS = float(os.environ.get('LLM_HEDGE_INITIAL_DELAY_SECONDS', 3))
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.environ.get('LLM_HEDGE_MIN_DELAY_SECONDS', 0.25))
+CORS_ORIGINS = [o.strip() for o in os.environ.get('CORS_ORIGINS', r'http://localhost(:[0-9]+)?$,file://*,null').split(',') if o.strip()]
+RESPONSE_DEBUG = os.environ.get('RESPONSE_DEBUG', 'authorized').lower()
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', 512))
+ELIGIBILITY_BATCH_MAX_ITEMS = int(os.environ.get('ELIGIBILITY_BATCH_MAX_ITEMS', 5000))
+ELIGIBILITY_BATCH_TIMEOUT_SECONDS = float(os.environ.get('ELIGIBILITY_BATCH_TIMEOUT_SECONDS', 10))
+CHAT_BATCH_CONCURRENCY = int(os.environ.get('CHAT_BATCH_CONCURRENCY', 8))
+CHAT_BATCH_MAX_QUESTIONS = int(os.environ.get('CHAT_BATCH_MAX_QUESTIONS', 1000))
+SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+SINGLE_FLIGHT_TIMEOUT_SECONDS = float(os.environ.get('SINGLE_FLIGHT_TIMEOUT_SECONDS', 30))
+NLU_PARSE_FAILURE_ANSWER = "I'm having trouble understanding that. Could you please rephrase your question?"
+DEFAULT_CLARIFICATION = "Could you please provide some more details?"
+OFF_TOPIC_ANSWER = "I can only help with questions about the SSENSE return policy. Could you ask something related to returns, please?"
+UNEXPECTED_NLU_ANSWER = "I'm sorry, I encountered an unexpected issue understanding that request."
+POLICY_TEXT_ANSWER_INTRO = "I couldn't match that to a specific rule, but here is what the SSENSE return policy says:"
+NLG_FALLBACK_ANSWER = "I found the information based on the policy, but I'm having trouble phrasing the answer right now. Please try rephrasing your question."
+log_listener = configure_logging(LOG_FILE, LOG_LEVEL, LOG_MODE, LOG_SAMPLE_RATES)
+log_listener_pid = os.getpid()
 logger = logging.getLogger("ssense_chatbot")
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify() through orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return encode_json(obj).decode('utf-8')
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+# The only place CORS headers are set, preflight OPTIONS requests included.
 CORS(app,
      resources={r"/api/*": {
-         "origins": ["http://localhost:*", "file://*", "null"],
+         "origins": CORS_ORIGINS,
          "methods": ["GET", "POST", "OPTIONS"],
-         "allow_headers": ["Content-Type", "Authorization"]
+         "allow_headers": ["Content-Type", "Authorization", "X-Debug"],
+         "expose_headers": ["Server-Timing"]
      }},
      supports_credentials=True)
-load_dotenv()
-logger.info("Environment variables loaded")
-try:
-    client = OpenAI()
-    logger.info("OpenAI client initialized")
-except Exception as e:
-    logger.error(f"Error initializing OpenAI client: {e}", exc_info=True)
-    raise
-try:
-    with open(NLU_PROMPT_FILE) as f:
-        nlu_prompt = f.read()
-    with open(NLG_PROMPT_FILE) as f:
-        nlg_prompt = f.read()
-    logger.info("Prompt files loaded successfully")
-except Exception as e:
-    logger.error(f"Error loading prompt files from '{NLU_PROMPT_FILE}' or '{NLG_PROMPT_FILE}': {e}", exc_info=True)
-    raise
-try:
-    prolog = Prolog()
-    logger.info("Prolog engine initialized")
-    if not os.path.exists(KB_FILENAME):
-        logger.error(f"Prolog KB file '{KB_FILENAME}' not found.")
-        raise FileNotFoundError(f"Prolog KB file '{KB_FILENAME}' not found.")
-    prolog.consult(KB_FILENAME)
-    logger.info(f"Prolog policy file '{KB_FILENAME}' loaded successfully")
-except Exception as e:
-    logger.error(f"Error initializing Prolog or loading KB: {e}", exc_info=True)
-    raise
-def format_prolog_arg(value):
-    """Formats a Python value into a Prolog-compatible string representation."""
-    if isinstance(value, str):
-        if value.replace('_', '').isalnum() and value and value[0].islower() and value not in ['true', 'false']:
-              return value
-        else:
-              escaped_value = value.replace("'", "''")
-              return f"'{escaped_value}'"
-    elif isinstance(value, bool):
-        return str(value).lower()
-    elif isinstance(value, (int, float)):
-        return str(value)
-    elif value is None:
-         return '_'
-    else:
-        logger.warning(f"Unsupported type for Prolog formatting: {type(value)}. Using repr().")
-        repr_value = repr(value)
-        if "'" in repr_value:
-              escaped_repr = repr_value.replace("'", "''")
-              return f"'{escaped_repr}'"
-        return repr_value
+
+@app.after_request
+def compress_response(response):
+    """Compresses buffered JSON and text responses with br or gzip when the client accepts it."""
+    response.vary.add('Accept-Encoding')
+    if response.headers.get('Server-Timing'):
+        response.headers['Timing-Allow-Origin'] = request.headers.get('Origin') or '*'
+    if (response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES or (response.content_length or 0) < RESPONSE_COMPRESS_MIN_BYTES):
+        return response
+    encoding = accepted_encoding(request.headers.get('Accept-Encoding'))
+    if encoding:
+        response.set_data(compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def hedge_policy():
+    if not LLM_HEDGE_ENABLED:
+        return None
+    return HedgePolicy(LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_SAMPLES, LLM_HEDGE_INITIAL_DELAY_SECONDS, LLM_HEDGE_MIN_DELAY_SECONDS)
+nlu_stage = LLMStage('nlu', NLU_MODEL, NLU_TIMEOUT_SECONDS, hedge_policy())
+slot_stage = LLMStage('slot', SLOT_MODEL, NLU_TIMEOUT_SECONDS, hedge_policy())
+nlg_stage = LLMStage('nlg', NLG_MODEL, NLG_TIMEOUT_SECONDS, hedge_policy())
+# Streamed NLG is hedged on time to first token, so it keeps latencies apart from whole completions.
+nlg_stream_stage = LLMStage('nlg_stream', NLG_MODEL, NLG_TIMEOUT_SECONDS, hedge_policy())
+logger.info(f"LLM models: NLU {NLU_MODEL} (escalating to {NLU_ESCALATION_MODEL or 'none'}), slot {SLOT_MODEL}, NLG {NLG_MODEL}; hedging {'on' if LLM_HEDGE_ENABLED else 'off'}")
+# Filled in by create_app(): initialize_shared() sets what can be built once and inherited by
+# forked workers, initialize_worker() what each process must own (threads, sockets, SWI engines).
+nlu_prompt = nlg_prompt = slot_prompt = None
+intent_router = None
+nlu_prompt_builder = None
+policy_index = None
+client = None
+kb_reloader = None
+nlu_cache = None
+session_store = None
+nlu_flight = nlg_flight = None
+answer_table = AnswerTable(ANSWER_TABLE_FILE, PREDICATE_INPUT_ARGS)
+nlu_log_lock = threading.Lock()
+startup_timer = StartupTimer()
+startup_lock = threading.RLock()
+shared_ready = False
+shared_kb_version = None
+worker_pid = None
+def log_nlu_decision(user_question, nlu_json):
+    """Appends an LLM NLU decision to NLU_LOG_FILE, used to retrain and evaluate the local intent router."""
+    if not NLU_LOG_FILE:
+        return
+    try:
+        with nlu_log_lock, open(NLU_LOG_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'question': user_question, 'nlu': nlu_json}) + '\n')
+    except OSError as log_err:
+        logger.warning(f"Could not append NLU decision to '{NLU_LOG_FILE}': {log_err}")
+
+def resolve_nlu_locally(user_question):
+    """Returns NLU JSON from the NLU cache or the local intent router, or None if the LLM is needed."""
+    nlu_json = nlu_cache.get(user_question) if nlu_cache else None
+    if nlu_json is not None:
+        logger.info("Step 1: NLU cache hit, skipping NLU/Planning LLM call")
+        return nlu_json
+    nlu_json = intent_router.resolve(user_question) if intent_router else None
+    if nlu_json is not None:
+        logger.info(f"Step 1: Local intent router resolved question (confidence {nlu_json['confidence']}), skipping NLU/Planning LLM call")
+    return nlu_json
+
+def build_nlu_messages(user_question):
+    """Builds the chat messages for the NLU/Planning LLM call."""
+    system_prompt, prompt_info = nlu_prompt_builder.build(user_question, NLU_PROMPT_MODE)
+    NLU_PROMPT_TOKENS.observe(prompt_info['estimated_tokens'], prompt_info['mode'])
+    logger.debug(f"NLU prompt: {prompt_info['mode']}, ~{prompt_info['estimated_tokens']} tokens, predicates {prompt_info['predicates']}")
+    messages_for_nlu = [{"role": "system", "content": system_prompt}]
+    messages_for_nlu.append({"role": "user", "content": user_question})
+    return messages_for_nlu
+
+def parse_nlu_output(user_question, raw_nlu_output):
+    """Parses the NLU LLM output, caching and logging it. Returns None if it is not valid JSON."""
+    logger.debug(f"Raw NLU output: {raw_nlu_output}")
+    try:
+        nlu_json = json.loads(raw_nlu_output)
+        logger.debug("Parsed NLU JSON: %s", LazyJSON(nlu_json, indent=2))
+    except json.JSONDecodeError as json_e:
+        logger.error(f"Failed to parse NLU JSON output: {json_e}\nRaw output was: {raw_nlu_output}", exc_info=True)
+        return None
+
+    if nlu_cache and nlu_json.get("status") in ("success", "missing_info", "off_topic"):
+        nlu_cache.put(user_question, nlu_json)
+    log_nlu_decision(user_question, nlu_json)
+    return nlu_json
+
+def coalesce(flight, key, func, *args):
+    """Runs func through the single-flight group when coalescing is enabled."""
+    return flight.do(key, func, *args) if flight else func(*args)
+
+def timed(timer, stage):
+    return timer.stage(stage) if timer else contextlib.nullcontext()
+
+def resolve_nlu(user_question, timer=None):
+    """
+    Produces the NLU JSON for a question from the NLU cache, the local intent router or the NLU LLM call,
+    in that order. Returns (nlu_json, raw_nlu_output); nlu_json is None if the LLM output was not valid JSON.
+    """
+    nlu_json = resolve_nlu_locally(user_question)
+    if nlu_json is not None:
+        return nlu_json, None
+    return coalesce(nlu_flight, normalize_question(user_question), call_nlu_llm, user_question, timer)
+
+def nlu_escalation_reason(raw_nlu_output):
+    """Why output from NLU_MODEL must be redone on NLU_ESCALATION_MODEL (it failed schema validation), or None."""
+    if not NLU_ESCALATION_MODEL or NLU_ESCALATION_MODEL == NLU_MODEL:
+        return None
+    problem = nlu_output_problem(raw_nlu_output)
+    if problem:
+        logger.warning(f"NLU output from {NLU_MODEL} failed validation ({problem}); escalating to {NLU_ESCALATION_MODEL}")
+        NLU_ESCALATIONS.inc(1, NLU_MODEL, problem)
+    return problem
+
+def request_nlu(user_question, model, timer=None):
+    nlu_response = complete(
+        client, nlu_stage, model,
+        messages=build_nlu_messages(user_question),
+        temperature=0.1,
+        response_format={"type": "json_object"}
+    )
+    if timer:
+        timer.add_usage('nlu', nlu_response.usage)
+    return nlu_response.choices[0].message.content.strip()
+
+def call_nlu_llm(user_question, timer=None):
+    logger.info("Step 1: Running NLU/Planning LLM call")
+    raw_nlu_output = request_nlu(user_question, NLU_MODEL, timer)
+    if nlu_escalation_reason(raw_nlu_output):
+        raw_nlu_output = request_nlu(user_question, NLU_ESCALATION_MODEL, timer)
+    return parse_nlu_output(user_question, raw_nlu_output), raw_nlu_output
+
+def pending_clarification(conversation_id):
+    """Returns the conversation's pending clarification state, or None."""
+    return session_store.get(conversation_id) if session_store else None
+
+def remember_turn(conversation_id, question, nlu_json):
+    """Keeps a missing_info result as the conversation's pending clarification; any other result clears it."""
+    if not session_store:
+        return
+    predicate_name = (nlu_json or {}).get("predicate")
+    if nlu_json and nlu_json.get("status") == "missing_info" and predicate_name in ALLOWED_PREDICATES:
+        args_dict = {k: v for k, v in (nlu_json.get("args") or {}).items() if v is not None}
+        missing_args = missing_slots(PREDICATE_INPUT_ARGS[predicate_name], args_dict)
+        if missing_args:
+            session_store.put(conversation_id, {
+                'predicate': predicate_name,
+                'args': args_dict,
+                'missing_args': missing_args,
+                'clarification_question': nlu_json.get("clarification_question", DEFAULT_CLARIFICATION),
+                'question': question
+            })
+            return
+    session_store.pop(conversation_id)
+
+def complete_clarification(conversation_id, pending, reply, filled, source):
+    """
+    Merges the slots filled from a clarification reply into the pending state.
+    Returns (nlu_json, question), or None when the reply filled nothing and needs full NLU.
+    """
+    session_store.record_fill(source if filled else 'none')
+    if not filled:
+        logger.info("Clarification reply filled no pending slots; running full NLU on it")
+        session_store.pop(conversation_id)
+        return None
+    logger.info(f"Step 1: Filled {sorted(filled)} for pending {pending['predicate']} from the reply ({source}), skipping NLU/Planning LLM call")
+    nlu_json = apply_filled_slots(pending, filled, 'session')
+    question = f"{pending['question']} {reply}"
+    remember_turn(conversation_id, question, nlu_json)
+    return nlu_json, question
+
+def fill_pending_slots(conversation_id, pending, reply, timer=None):
+    """Fills a pending clarification from the reply: slot patterns first, the slot-only LLM call second."""
+    filled = fill_slots_locally(pending, reply)
+    source = 'local'
+    if not filled:
+        logger.info("Step 1: Running slot-only LLM call for pending clarification")
+        slot_response = complete(
+            client, slot_stage,
+            messages=build_slot_messages(slot_prompt, pending, reply),
+            temperature=0,
+            response_format={"type": "json_object"}
+        )
+        if timer:
+            timer.add_usage('slot', slot_response.usage)
+        filled = parse_slot_output(pending, slot_response.choices[0].message.content.strip())
+        source = 'llm'
+    return complete_clarification(conversation_id, pending, reply, filled, source)
+
+def resolve_turn(conversation_id, user_question, timer=None):
+    """
+    NLU for one conversation turn. A reply to a pending clarification only fills the missing slots;
+    anything else goes through resolve_nlu. Returns (nlu_json, raw_nlu_output, question for NLG).
+    """
+    pending = pending_clarification(conversation_id)
+    if pending is not None:
+        completed = fill_pending_slots(conversation_id, pending, user_question, timer)
+        if completed is not None:
+            nlu_json, question = completed
+            return nlu_json, None, question
+    nlu_json, raw_nlu_output = resolve_nlu(user_question, timer)
+    remember_turn(conversation_id, user_question, nlu_json)
+    return nlu_json, raw_nlu_output, user_question
 
 def construct_prolog_query(predicate_name, args_dict):
     """
-    Constructs a Prolog query string from a predicate name and named arguments.
-    Returns the query string and a list of output variable names.
+    Binds named arguments to the predicate's precompiled query plan.
+    Returns the query text (for logs, debug output and the NLG prompt) and the bound input values.
     """
     logger.debug(f"Constructing query for predicate: {predicate_name} with args: {args_dict}")
-    if predicate_name not in ALLOWED_PREDICATES:
+    plan = QUERY_PLANS.get(predicate_name)
+    if plan is None:
         raise ValueError(f"Predicate '{predicate_name}' is not allowed.")
+    input_values = plan.bind(args_dict)
+    query_string = plan.render(input_values)
+    logger.debug(f"Constructed query string: {query_string}, Output vars: {plan.output_var_names}")
+    return query_string, input_values
 
-    input_arg_order_map = {
-        'is_eligible': ['ItemType', 'Condition', 'Packaging', 'Tags', 'DaysSinceDelivery'],
-        'get_return_window': [],
-        'get_shipping_cost': ['Region'],
-        'get_return_label_info': ['Region'],
-        'get_return_fee': ['Region'],
-        'is_item_excluded': ['ItemType'],
-        'get_initiation_method': ['UserType'],
-        'can_exchange': [],
-        'get_contact_email': [],
-        'get_contact_chat_availability': [],
-        'get_phone_number': ['PhoneType'],
-        'get_damaged_item_action': [],
-        'get_warranty_provider': [],
-        'is_warranty_by_ssense': [],
+def execute_prolog_query(kb, predicate_name, input_values):
+    """Runs the predicate's query plan against one KB version and wraps the solutions into the kb_result structure."""
+    solutions = kb.engine.run_plan(predicate_name, input_values)
+    logger.debug("Prolog solutions: %s", solutions)
+
+    kb_result_data = {"success": bool(solutions), "solutions": solutions}
+    if not solutions:
+        logger.info(f"Prolog query yielded no results (interpreted as False/Fail for predicate {predicate_name}).")
+    elif solutions == [{}]:
+        logger.info(f"Prolog query succeeded with no variable bindings for predicate {predicate_name}.")
+    else:
+        logger.info(f"Prolog query succeeded. Solutions processed: {solutions}")
+    return kb_result_data
+
+def get_predicate_explanation(kb, predicate_name):
+    """Returns the user-facing explanation string for a predicate, or None."""
+    explanation_string = kb.explanations.get(predicate_name)
+    if explanation_string is None:
+        logger.info(f"No explanation found for predicate: {predicate_name}")
+    return explanation_string
+
+def policy_citations(user_question):
+    """Policy sentences that best match the question, attached to every answer as citations."""
+    if policy_index is None or POLICY_CITATIONS <= 0:
+        return []
+    return policy_index.current.search(user_question, POLICY_CITATIONS, POLICY_CITATION_MIN_SCORE)
+
+def off_topic_answer(citations):
+    """Quotes the policy when the question matches its text closely though no predicate applies, else the canned reply."""
+    quoted = [c['text'] for c in citations if c['score'] >= POLICY_FALLBACK_MIN_SCORE]
+    if not quoted:
+        return OFF_TOPIC_ANSWER
+    return POLICY_TEXT_ANSWER_INTRO + "\n" + "\n".join(f"- {text}" for text in quoted)
+
+def render_template_answer(predicate_name, args_dict, kb_result_data):
+    """Returns the template answer when NLG_ENGINE='template' and a template covers the result, else None."""
+    if NLG_ENGINE != 'template':
+        return None
+    output_var_names = list(PREDICATE_OUTPUT_VARS.get(predicate_name, {}).values())
+    final_answer = render_answer(predicate_name, args_dict, kb_result_data, output_var_names)
+    if final_answer is not None:
+        logger.info(f"Generated final answer from template: {final_answer}")
+    else:
+        logger.info(f"No template covers this {predicate_name} result; falling back to NLG LLM call")
+    return final_answer
+
+def build_nlg_messages(user_question, predicate_name, args_dict, query_string, kb_result_data):
+    """Builds the chat messages for the NLG LLM call."""
+    logger.info("Step 4: Preparing input for NLG LLM call")
+    nlg_input_context = {
+        "user_question": user_question,
+        "kb_query": {
+            "predicate_called": predicate_name,
+            "args_provided": args_dict,
+            "query_string": query_string,
+            "result": kb_result_data
+        }
     }
+    nlg_input_json = json.dumps(nlg_input_context, indent=2, default=str)
+    logger.debug("NLG Input Context: %s", nlg_input_json)
+    return [
+        {"role": "system", "content": nlg_prompt},
+        {"role": "user", "content": nlg_input_json}
+    ]
+
+def generate_answer(user_question, predicate_name, args_dict, query_string, kb_result_data, timer=None):
+    """
+    Turns a KB result into the final natural-language answer. With NLG_ENGINE='template' the
+    per-predicate templates are tried first and the LLM is only called for uncovered shapes.
+    Raises if the NLG call fails.
+    """
+    final_answer = render_template_answer(predicate_name, args_dict, kb_result_data)
+    if final_answer is not None:
+        return final_answer
+    return coalesce(nlg_flight, flight_key(predicate_name, args_dict, kb_result_data), call_nlg_llm,
+                    user_question, predicate_name, args_dict, query_string, kb_result_data, timer)
+
+def call_nlg_llm(user_question, predicate_name, args_dict, query_string, kb_result_data, timer=None):
+    logger.info("Step 5: Running NLG LLM call")
+    nlg_response = complete(
+        client, nlg_stage,
+        messages=build_nlg_messages(user_question, predicate_name, args_dict, query_string, kb_result_data),
+        temperature=0.3
+    )
+    if timer:
+        timer.add_usage('nlg', nlg_response.usage)
+    final_answer = nlg_response.choices[0].message.content.strip()
+    logger.info(f"Generated final answer: {final_answer}")
+    return final_answer
+
+def stream_answer(user_question, predicate_name, args_dict, query_string, kb_result_data, timer=None):
+    """
+    Yields the final answer in chunks: a template answer as one chunk, an LLM answer token by token.
+    Joins an identical in-flight NLG call, streamed or not, instead of starting another.
+    """
+    final_answer = render_template_answer(predicate_name, args_dict, kb_result_data)
+    if final_answer is not None:
+        yield final_answer
+        return
+    args = (user_question, predicate_name, args_dict, query_string, kb_result_data, timer)
+    if nlg_flight:
+        yield from nlg_flight.stream(flight_key(predicate_name, args_dict, kb_result_data), stream_nlg_llm, *args)
+    else:
+        yield from stream_nlg_llm(*args)
+
+def stream_nlg_llm(user_question, predicate_name, args_dict, query_string, kb_result_data, timer=None):
+    logger.info("Step 5: Running streamed NLG LLM call")
+    nlg_stream = stream_completion(
+        client, nlg_stream_stage,
+        messages=build_nlg_messages(user_question, predicate_name, args_dict, query_string, kb_result_data),
+        temperature=0.3,
+        stream_options={"include_usage": True}
+    )
+    for chunk in nlg_stream:
+        if timer and getattr(chunk, 'usage', None):
+            timer.add_usage('nlg', chunk.usage)
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def nlg_answer_or_fallback(user_question, predicate_name, args_dict, answer, timer=None):
+    """generate_answer() for a KB answer from query_kb(), or the canned fallback if NLG fails."""
+    try:
+        return generate_answer(user_question, predicate_name, args_dict, answer['prolog_query'], answer['prolog_result'], timer)
+    except Exception as nlg_err:
+        logger.error(f"Error during NLG LLM call: {nlg_err}", exc_info=True)
+        return NLG_FALLBACK_ANSWER
+
+def materialize_answer(kb, predicate_name, args_dict):
+    """Computes the answer-table entry for one (predicate, args) pair, or None if NLG fails."""
+    answer = query_kb(kb, predicate_name, args_dict, use_answer_table=False)
+    canonical_question = f"{predicate_name}({', '.join(f'{k}={v}' for k, v in args_dict.items())})"
+    try:
+        answer['response'] = generate_answer(canonical_question, predicate_name, args_dict,
+                                             answer['prolog_query'], answer['prolog_result'])
+    except Exception as nlg_err:
+        logger.error(f"Error during NLG LLM call while materializing {canonical_question}: {nlg_err}", exc_info=True)
+        return None
+    return answer
+
+def build_answer_table(kb=None):
+    """Enumerates the finite KB domain and materializes every answer for a KB version (default: the live one)."""
+    kb = kb or kb_reloader.current
+    arg_domains = enumerate_arg_domains(kb.engine)
+    query_pairs = list(enumerate_query_pairs(PREDICATE_INPUT_ARGS, arg_domains))
+    logger.info(f"Materializing {len(query_pairs)} answers for KB version {kb.version[:12]}")
+    return answer_table.build(kb.version, query_pairs, lambda pred, args: materialize_answer(kb, pred, args))
+
+def refresh_answer_table(kb):
+    """Called after a KB swap: entries tagged with the old version stop matching, so load or rebuild for the new one."""
+    if ANSWER_TABLE_MODE not in ('auto', 'load'):
+        return
+    if answer_table.load(kb.version) or ANSWER_TABLE_MODE != 'auto':
+        return
+
+    def rebuild():
+        try:
+            build_answer_table(kb)
+        except Exception as e:
+            logger.error(f"Error rebuilding answer table for KB version {kb.version[:12]}: {e}", exc_info=True)
+
+    threading.Thread(target=rebuild, name="answer-table-rebuild", daemon=True).start()
+
+
+def build_prolog_engine(pool_size=None):
+    """The KB engine with the configured pool size (unless overridden), timeouts and worker recycling."""
+    return create_prolog_engine(KB_FILENAME, PROLOG_POOL_SIZE if pool_size is None else pool_size,
+                                PROLOG_QUERY_TIMEOUT_SECONDS, PROLOG_QUEUE_TIMEOUT_SECONDS, PROLOG_MAX_QUERIES_PER_WORKER)
+
+
+def prepare_answer_table(version):
+    """
+    Loads the answer table for a KB version or, in 'auto' mode, builds it with a short-lived
+    one-worker pool and OpenAI client, so no SWI engine or open connection is ever inherited
+    by forked workers.
+    """
+    global client
+    if ANSWER_TABLE_MODE not in ('auto', 'load'):
+        return
+    if answer_table.load(version) or ANSWER_TABLE_MODE != 'auto':
+        return
+    engine = PrologPool(KB_FILENAME, 1, PROLOG_QUERY_TIMEOUT_SECONDS, PROLOG_QUEUE_TIMEOUT_SECONDS)
+    client = OpenAI()
+    try:
+        build_answer_table(KnowledgeBase(engine, load_explanations(engine), version))
+    finally:
+        client.close()
+        client = None
+        engine.close()
+
+def initialize_shared():
+    """
+    Startup work whose result is plain Python data: prompts, intent router, prompt builder, policy
+    index, answer table and the precompiled KB. Done once in a preforking master and inherited by
+    every worker.
+    """
+    global nlu_prompt, nlg_prompt, slot_prompt, intent_router, nlu_prompt_builder, policy_index, shared_ready, shared_kb_version
+    with startup_lock:
+        if shared_ready:
+            return
+        with startup_timer.step('shared', 'prompts'):
+            try:
+                with open(NLU_PROMPT_FILE) as f:
+                    nlu_prompt = f.read()
+                with open(NLG_PROMPT_FILE) as f:
+                    nlg_prompt = f.read()
+                with open(SLOT_PROMPT_FILE) as f:
+                    slot_prompt = f.read()
+                logger.info("Prompt files loaded successfully")
+            except Exception as e:
+                logger.error(f"Error loading prompt files from '{NLU_PROMPT_FILE}', '{NLG_PROMPT_FILE}' or '{SLOT_PROMPT_FILE}': {e}", exc_info=True)
+                raise
+        if not os.path.exists(KB_FILENAME):
+            logger.error(f"Prolog KB file '{KB_FILENAME}' not found.")
+            raise FileNotFoundError(f"Prolog KB file '{KB_FILENAME}' not found.")
+        if KB_PRECOMPILE:
+            with startup_timer.step('shared', 'kb_precompile'):
+                precompile_kb(KB_FILENAME)
+        with startup_timer.step('shared', 'intent_router'):
+            try:
+                intent_router = None
+                if NLU_ROUTER_ENABLED:
+                    intent_router = IntentRouter.from_files(
+                        NLU_ROUTER_TRAINING_FILE, PREDICATE_INPUT_ARGS, KB_SENTENCES_FILE, NLU_LOG_FILE, NLU_ROUTER_THRESHOLD)
+            except Exception as e:
+                logger.error(f"Error training local intent router, continuing with LLM NLU only: {e}", exc_info=True)
+                intent_router = None
+        with startup_timer.step('shared', 'nlu_prompt_builder'):
+            nlu_prompt_builder = NLUPromptBuilder(
+                nlu_prompt, ALLOWED_PREDICATES, PREDICATE_INPUT_ARGS, PREDICATE_OUTPUT_VARS,
+                intent_router.rank_predicates if intent_router else None, NLU_PROMPT_MAX_PREDICATES, NLU_PROMPT_COVERAGE)
+            logger.info(f"NLU prompt mode '{NLU_PROMPT_MODE}': ~{nlu_prompt_builder.full_prompt_tokens} tokens in full, ~{nlu_prompt_builder.prefix_tokens} of them a shared prefix")
+        with startup_timer.step('shared', 'policy_index'):
+            try:
+                policy_index = PolicyIndexLoader(KB_SENTENCES_FILE)
+            except Exception as e:
+                logger.error(f"Error building policy index, continuing without citations: {e}", exc_info=True)
+                policy_index = None
+        with startup_timer.step('shared', 'answer_table'):
+            try:
+                shared_kb_version = kb_fingerprint(KB_FILENAME)
+                prepare_answer_table(shared_kb_version)
+            except Exception as e:
+                logger.error(f"Error preparing answer table, serving without it: {e}", exc_info=True)
+        shared_ready = True
+
+def initialize_worker():
+    """
+    Per-process startup: OpenAI client, Prolog engine, NLU cache, sessions and the watcher threads.
+    Runs once in each process; a preforking server calls it in every worker right after the fork.
+    """
+    global client, kb_reloader, nlu_cache, session_store, nlu_flight, nlg_flight, log_listener, log_listener_pid, worker_pid
+    with startup_lock:
+        if worker_pid == os.getpid():
+            return
+        initialize_shared()
+        if log_listener is not None and log_listener_pid != os.getpid():
+            log_listener = restart_listener(log_listener)
+            log_listener_pid = os.getpid()
+        with startup_timer.step('worker', 'openai_client'):
+            try:
+                client = OpenAI()
+                logger.info("OpenAI client initialized")
+            except Exception as e:
+                logger.error(f"Error initializing OpenAI client: {e}", exc_info=True)
+                raise
+        with startup_timer.step('worker', 'prolog_engine'):
+            try:
+                kb_reloader = KBReloader(KB_FILENAME, build_prolog_engine, KB_TEST_FILE, KB_RELOAD_DRAIN_SECONDS)
+                logger.info(f"Prolog engine initialized ({'pool of ' + str(PROLOG_POOL_SIZE) if PROLOG_POOL_SIZE > 0 else 'in-process'})")
+                logger.info(f"Prolog policy file '{KB_FILENAME}' loaded successfully (version {kb_reloader.current.version[:12]})")
+            except Exception as e:
+                logger.error(f"Error initializing Prolog or loading KB: {e}", exc_info=True)
+                raise
+        with startup_timer.step('worker', 'nlu_cache'):
+            try:
+                nlu_cache = create_nlu_cache(NLU_CACHE_BACKEND, NLU_CACHE_MAX_ENTRIES, NLU_CACHE_TTL_SECONDS, NLU_CACHE_PATH)
+                logger.info(f"NLU cache initialized (backend: {NLU_CACHE_BACKEND or 'none'})")
+            except Exception as e:
+                logger.error(f"Error initializing NLU cache: {e}", exc_info=True)
+                raise
+        session_store = SessionStore(SESSION_MAX_ENTRIES, SESSION_TTL_SECONDS) if SESSION_MAX_ENTRIES > 0 else None
+        # Identical concurrent NLU calls (same normalized question) and NLG calls (same predicate, args and
+        # KB result) share one upstream request.
+        nlu_flight = SingleFlight('nlu', SINGLE_FLIGHT_TIMEOUT_SECONDS) if SINGLE_FLIGHT_ENABLED else None
+        nlg_flight = SingleFlight('nlg', SINGLE_FLIGHT_TIMEOUT_SECONDS) if SINGLE_FLIGHT_ENABLED else None
+        # The table was prepared for the KB file as it was when the shared phase ran.
+        if kb_reloader.current.version != shared_kb_version:
+            refresh_answer_table(kb_reloader.current)
+        kb_reloader.on_swap = refresh_answer_table
+        if KB_WATCH_INTERVAL_SECONDS > 0:
+            kb_reloader.watch(KB_WATCH_INTERVAL_SECONDS)
+        if policy_index and POLICY_INDEX_WATCH_INTERVAL_SECONDS > 0:
+            policy_index.watch(POLICY_INDEX_WATCH_INTERVAL_SECONDS)
+        worker_pid = os.getpid()
+        report = startup_timer.report()
+        logger.info(f"Worker {worker_pid} ready (shared {report['phase_ms'].get('shared', 0.0)} ms, worker {report['phase_ms'].get('worker', 0.0)} ms)")
+
+def create_app(prefork=False):
+    """
+    Application factory. Runs the shared startup phase, and unless prefork is set also the
+    per-worker phase; a preforking server (gunicorn.conf.py) runs that in each worker after the fork.
+    """
+    initialize_shared()
+    if not prefork:
+        initialize_worker()
+    return app
+
+@app.before_request
+def ensure_worker_initialized():
+    """Covers servers that import app:app without the factory or the post_fork hook."""
+    if worker_pid != os.getpid():
+        initialize_worker()
+
+
+def reply_without_kb(nlu_json, raw_nlu_output, citations, timer=None):
+    """
+    The reply to a turn that needs no KB query: unparseable NLU output, a clarification question,
+    an off-topic question or an unusable NLU result. None when the turn needs a KB query.
+    """
+    if nlu_json is None:
+        if timer:
+            timer.nlu_status = 'parse_error'
+        return {'response': NLU_PARSE_FAILURE_ANSWER, 'explanation': None,
+                'debug': {'error': 'NLU JSON Parsing Failed', 'raw_nlu': raw_nlu_output}}
+    if timer:
+        timer.label(nlu_json, ALLOWED_PREDICATES)
+    nlu_status = nlu_json.get("status")
+    predicate_name = nlu_json.get("predicate")
+    if nlu_status == "missing_info":
+        clarification = nlu_json.get("clarification_question", DEFAULT_CLARIFICATION)
+        logger.info(f"NLU status: missing_info. Sending clarification: {clarification}")
+        return {'response': clarification, 'explanation': None, 'debug': {'nlu': nlu_json}}
+    if nlu_status == "off_topic":
+        reason = nlu_json.get("off_topic_reason", "The question doesn't seem related to our return policy.")
+        logger.info(f"NLU status: off_topic. Reason: {reason}. Answering from the policy text or with the canned response.")
+        return {'response': off_topic_answer(citations), 'explanation': None, 'debug': {'nlu': nlu_json}}
+    if nlu_status != "success" or predicate_name not in ALLOWED_PREDICATES:
+        logger.error(f"Unusable NLU result (status {nlu_status}, predicate {predicate_name}). NLU JSON: {nlu_json}")
+        return {'response': UNEXPECTED_NLU_ANSWER, 'explanation': None, 'debug': {'nlu': nlu_json}}
+    logger.info(f"NLU status: success. Predicate: {predicate_name}. Args: {nlu_json.get('args', {})}")
+    return None
 
-    if predicate_name not in input_arg_order_map:
-         raise ValueError(f"Argument order mapping not defined for predicate: {predicate_name}")
+def query_kb(kb, predicate_name, args_dict, timer=None, use_answer_table=True):
+    """
+    The KB side of an answer: {'explanation', 'prolog_query', 'prolog_result'}, or the whole
+    answer-table entry (with 'response' and 'materialized': True) when the table has one.
+    Raises ValueError when the arguments don't fit the predicate's query plan.
+    """
+    if use_answer_table:
+        materialized = answer_table.lookup(predicate_name, args_dict, kb.version)
+        if materialized is not None:
+            logger.info(f"Serving materialized answer for {predicate_name} {args_dict}")
+            return dict(materialized, materialized=True)
+    with timed(timer, 'construct'):
+        query_string, input_values = construct_prolog_query(predicate_name, args_dict)
+    logger.info(f"Constructed Prolog query: {query_string}")
+    with timed(timer, 'prolog'):
+        kb_result_data = execute_prolog_query(kb, predicate_name, input_values)
+    with timed(timer, 'explanation'):
+        explanation_string = get_predicate_explanation(kb, predicate_name)
+    return {'explanation': explanation_string, 'prolog_query': query_string, 'prolog_result': kb_result_data}
 
-    positional_args_formatted = []
-    input_arg_names = input_arg_order_map[predicate_name]
+def kb_error_reply(kb_err):
+    """(status, payload) for a turn whose KB query could not be built or run."""
+    if isinstance(kb_err, ValueError):
+        logger.error(f"Error constructing Prolog query: {kb_err}", exc_info=True)
+        return 500, {'error': 'Internal error preparing KB query.'}
+    logger.error(f"Error executing Prolog query: {kb_err}", exc_info=True)
+    return 500, {'error': 'Internal error querying knowledge base.'}
 
-    for arg_name in input_arg_names:
-        if arg_name not in args_dict:
-            logger.error(f"Missing required argument '{arg_name}' for predicate '{predicate_name}' in args: {args_dict}")
-            raise ValueError(f"Internal Error: Missing required argument '{arg_name}' for predicate '{predicate_name}'.")
-        formatted_arg = format_prolog_arg(args_dict[arg_name])
-        positional_args_formatted.append(formatted_arg)
+def turn_payload(nlu_json, answer):
+    """The /api/chat payload for an answer from answer_query()."""
+    debug = {'nlu': nlu_json, 'prolog_query': answer['prolog_query'], 'prolog_result': answer['prolog_result']}
+    if answer.get('materialized'):
+        debug['materialized'] = True
+    return {'response': answer['response'], 'explanation': answer['explanation'], 'debug': debug}
 
-    output_vars_map = PREDICATE_OUTPUT_VARS.get(predicate_name, {})
-    output_var_names = list(output_vars_map.values())
-    total_arity = len(input_arg_names)
-    if output_vars_map:
-        max_output_pos = max(output_vars_map.keys()) if output_vars_map else 0
-        total_arity = max(len(input_arg_names), max_output_pos)
+def answer_query(kb, user_question, predicate_name, args_dict, timer=None):
+    """query_kb() plus NLG for one resolved question; the answer-table entry needs no NLG."""
+    answer = query_kb(kb, predicate_name, args_dict, timer)
+    if 'response' not in answer:
+        with timed(timer, 'nlg'):
+            answer['response'] = nlg_answer_or_fallback(user_question, predicate_name, args_dict, answer, timer)
+    return answer
 
-    current_len = len(positional_args_formatted)
+def answer_turn(kb, user_question, nlu_json, raw_nlu_output, citations, timer=None):
+    """
+    The reply to a resolved turn as (status, payload). /api/chat and the async app build every
+    reply here (the async app awaits its own NLG call); the stream and batch endpoints use the
+    same reply_without_kb() and query_kb() steps.
+    """
+    reply = reply_without_kb(nlu_json, raw_nlu_output, citations, timer)
+    if reply is not None:
+        return 200, reply
+    try:
+        answer = answer_query(kb, user_question, nlu_json['predicate'], nlu_json.get('args', {}), timer)
+    except Exception as kb_err:
+        return kb_error_reply(kb_err)
+    return 200, turn_payload(nlu_json, answer)
 
-    while current_len < total_arity:
-        positional_args_formatted.append("_")
-        current_len += 1
+def resolve_batch_question(user_question, timer=None):
+    """NLU for one batch question. Returns (nlu_json, payload); payload is the final reply when no KB query is needed."""
+    nlu_json, raw_nlu_output = resolve_nlu(user_question, timer)
+    reply = reply_without_kb(nlu_json, raw_nlu_output, policy_citations(user_question))
+    if reply is not None:
+        reply.pop('debug')
+    return nlu_json, reply
 
-    for pos, var_name in output_vars_map.items():
-        idx = pos - 1
-        if idx >= len(positional_args_formatted):
-             logger.error(f"Output variable position {pos} out of calculated bounds {len(positional_args_formatted)} for {predicate_name}")
-             raise ValueError(f"Internal configuration error for predicate {predicate_name}: PREDICATE_OUTPUT_VARS position mismatch.")
-        positional_args_formatted[idx] = var_name
+def prepare_chat_batch(data):
+    """Validates a batch chat body. Returns ([(id, question)], concurrency); raises ValueError when invalid."""
+    items = data.get('questions') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError("Request body must be JSON with a non-empty 'questions' list.")
+    if len(items) > CHAT_BATCH_MAX_QUESTIONS:
+        raise ValueError(f"Too many questions (limit {CHAT_BATCH_MAX_QUESTIONS}).")
+    try:
+        concurrency = int(data.get('concurrency') or CHAT_BATCH_CONCURRENCY)
+    except (TypeError, ValueError):
+        raise ValueError("'concurrency' must be an integer.")
+    return parse_batch_questions(items), max(1, min(concurrency, CHAT_BATCH_CONCURRENCY))
 
-    query_string = f"{predicate_name}({', '.join(positional_args_formatted)})."
-    logger.debug(f"Constructed query string: {query_string}, Output vars: {output_var_names}")
-    return query_string, output_var_names
+def chat_batch_lines(questions, concurrency, timer):
+    """NDJSON lines for a batch, in completion order, against the KB version live when the batch started."""
+    kb = kb_reloader.current
+    status = 200
+    try:
+        for line in run_chat_batch(
+                questions,
+                lambda question: resolve_batch_question(question, timer),
+                lambda question, pred, args: answer_query(kb, question, pred, args, timer),
+                concurrency):
+            if line['type'] == 'result':
+                line['citations'] = policy_citations(line['question'])
+            yield encode_json(line).decode('utf-8') + '\n'
+    except Exception as e:
+        status = 500
+        logger.error(f"Unhandled error in chat batch: {e}", exc_info=True)
+        yield json.dumps({'type': 'error', 'error': 'Batch aborted due to an unexpected internal error.'}) + '\n'
+    finally:
+        timer.finish(status)
 
 @app.route('/api/chat/welcome', methods=['GET'])
 def welcome_message():
-    origin = request.headers.get('Origin', '*')
-    headers = {
-        'Access-Control-Allow-Origin': origin,
-        'Access-Control-Allow-Headers': 'Content-Type,Authorization',
-        'Access-Control-Allow-Methods': 'GET,OPTIONS',
-        'Access-Control-Allow-Credentials': 'true'
-    }
     return jsonify({
         'message': 'Welcome to SSENSE support. How can I help you with your returns questions today?'
-    }), 200, headers
-
-@app.route('/api/chat', methods=['OPTIONS'])
-def handle_options():
-    logger.info("OPTIONS request received")
-    response = jsonify({'status': 'ok'})
-    origin = request.headers.get('Origin', '*')
-    response.headers.add('Access-Control-Allow-Origin', origin or '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-    response.headers.add('Access-Control-Allow-Credentials', 'true')
-    return response
+    }), 200
 
 
 @app.route('/api/chat', methods=['POST'])
 def process_message():
     start_time = time.time()
-    origin = request.headers.get('Origin', '*')
-    headers = {
-        'Access-Control-Allow-Origin': origin or '*',
-        'Access-Control-Allow-Credentials': 'true'
-    }
+    timer = RequestTimer('chat')
+    kb = kb_reloader.current
+    conversation_id = None
+    citations = None
+    include_debug = wants_debug()
+
+    def respond(payload, status=200):
+        if conversation_id:
+            payload['conversation_id'] = conversation_id
+        if citations is not None and 'response' in payload:
+            payload['citations'] = citations
+        with timer.stage('serialize'):
+            response = jsonify(strip_debug(payload, include_debug))
+        timer.finish(status)
+        return response, status, {'Server-Timing': timer.server_timing()}
 
     try:
-        data = request.json
+        with timer.stage('parse'):
+            data = request.json
         if data is None:
              logger.warning("Received request with no JSON body.")
-             return jsonify({'error': 'Request body must be JSON.'}), 400, headers
+             return respond({'error': 'Request body must be JSON.'}, 400)
         user_question = data.get('message', '')
         if not user_question:
             logger.warning("Received request with no message.")
-            return jsonify({'error': 'No message provided'}), 400, headers
+            return respond({'error': 'No message provided'}, 400)
+        conversation_id = conversation_id_or_new(data.get('conversation_id'))
         logger.info(f"Received user question: {user_question}")
     except Exception as req_err:
         logger.error(f"Error parsing request data: {req_err}", exc_info=True)
-        return jsonify({'error': 'Invalid request format.'}), 400, headers
+        return respond({'error': 'Invalid request format.'}, 400)
 
     try:
-        logger.info("Step 1: Running NLU/Planning LLM call")
-        messages_for_nlu = [{"role": "system", "content": nlu_prompt}]
-        messages_for_nlu.append({"role": "user", "content": user_question})
-
-        nlu_response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages_for_nlu,
-            temperature=0.1,
-            response_format={"type": "json_object"}
-        )
-        raw_nlu_output = nlu_response.choices[0].message.content.strip()
-        logger.debug(f"Raw NLU output: {raw_nlu_output}")
-
-        try:
-            nlu_json = json.loads(raw_nlu_output)
-            logger.debug(f"Parsed NLU JSON: {json.dumps(nlu_json, indent=2)}")
-        except json.JSONDecodeError as json_e:
-            logger.error(f"Failed to parse NLU JSON output: {json_e}\nRaw output was: {raw_nlu_output}", exc_info=True)
-            return jsonify({
-                'response': "I'm having trouble understanding that. Could you please rephrase your question?",
-                'debug': {'error': 'NLU JSON Parsing Failed', 'raw_nlu': raw_nlu_output}
-            }), 200, headers
-
-        nlu_status = nlu_json.get("status")
-        predicate_name = nlu_json.get("predicate")
-        args_dict = nlu_json.get("args", {})
-
-        if nlu_status == "missing_info":
-            clarification = nlu_json.get("clarification_question", "Could you please provide some more details?")
-            logger.info(f"NLU status: missing_info. Sending clarification: {clarification}")
-            return jsonify({
-                'response': clarification,
-                'explanation': None, 
-                'debug': {'nlu': nlu_json}
-            }), 200, headers
-
-        elif nlu_status == "off_topic":
-            reason = nlu_json.get("off_topic_reason", "The question doesn't seem related to our return policy.")
-            logger.info(f"NLU status: off_topic. Reason: {reason}. Generating canned response.")
-            final_answer = "I can only help with questions about the SSENSE return policy. Could you ask something related to returns, please?"
-            return jsonify({
-                'response': final_answer,
-                'explanation': None, 
-                'debug': {'nlu': nlu_json}
-            }), 200, headers
-
-        elif nlu_status == "success":
-            logger.info(f"NLU status: success. Predicate: {predicate_name}. Args: {args_dict}")
-            if not predicate_name:
-                 logger.error("NLU status was 'success' but no predicate name was provided.")
-                 raise ValueError("NLU Error: Missing predicate name in successful NLU response.")
-
-            try:
-                if predicate_name not in ALLOWED_PREDICATES:
-                      logger.error(f"NLU returned disallowed predicate: {predicate_name}")
-                      raise ValueError(f"Internal Error: Attempted to call disallowed predicate '{predicate_name}'.")
-                query_string, output_var_names = construct_prolog_query(predicate_name, args_dict)
-                logger.info(f"Constructed Prolog query: {query_string}")
-            except ValueError as construction_err:
-                 logger.error(f"Error constructing Prolog query: {construction_err}", exc_info=True)
-                 return jsonify({'error': 'Internal error preparing KB query.'}), 500, headers
-
-            try:
-                prolog_results_list = list(prolog.query(query_string))
-                logger.debug(f"Raw Prolog results list: {prolog_results_list}")
-            except Exception as prolog_err:
-                 logger.error(f"Error executing Prolog query '{query_string}': {prolog_err}", exc_info=True)
-                 return jsonify({'error': 'Internal error querying knowledge base.'}), 500, headers
-
-            kb_result_data = {}
-            if prolog_results_list is None:
-                 kb_result_data["success"] = False
-                 kb_result_data["solutions"] = None
-                 kb_result_data["error"] = "Prolog query execution failed."
-                 logger.error(f"Prolog query execution failed for: {query_string}")
-            elif not prolog_results_list:
-                kb_result_data["success"] = False
-                kb_result_data["solutions"] = []
-                logger.info(f"Prolog query yielded no results (interpreted as False/Fail for predicate {predicate_name}).")
-            else:
-                kb_result_data["success"] = True
-                solutions = []
-                if prolog_results_list == [{}]: 
-                      logger.info(f"Prolog query succeeded with no variable bindings for predicate {predicate_name}.")
-                      solutions.append({})
-                else:
-                      for solution in prolog_results_list:
-                            py_solution = {}
-                            for k, v in solution.items():
-                                if isinstance(v, Atom): py_solution[k] = str(v).strip("'")
-                                elif isinstance(v, Functor) and v.arity == 0: py_solution[k] = str(v).strip("'")
-                                else: py_solution[k] = v
-                            solutions.append(py_solution)
-                      logger.info(f"Prolog query succeeded. Solutions processed: {solutions}")
-                kb_result_data["solutions"] = solutions
-
-            explanation_string = None
-            try:
-                exp_query = f"predicate_explanation({predicate_name}, _, Explanation)."
-                explanation_results = list(prolog.query(exp_query))
-                if explanation_results:
-                    explanation_raw = explanation_results[0].get('Explanation', None)
-                    if explanation_raw is not None:
-                         explanation_string = str(explanation_raw).strip("'")
-                    logger.info(f"Retrieved explanation for {predicate_name}: {explanation_string}")
-                else:
-                    logger.info(f"No explanation found for predicate: {predicate_name}")
-            except Exception as exp_err:
-                logger.error(f"Error querying explanation for {predicate_name}: {exp_err}", exc_info=True)
-
-            logger.info("Step 4: Preparing input for NLG LLM call")
-            nlg_input_context = {
-                "user_question": user_question,
-                "kb_query": {
-                    "predicate_called": predicate_name,
-                    "args_provided": args_dict,
-                    "query_string": query_string,
-                    "result": kb_result_data
-                }
-            }
-            logger.debug(f"NLG Input Context: {json.dumps(nlg_input_context, indent=2, default=str)}")
-
-            logger.info("Step 5: Running NLG LLM call")
-            try:
-                nlg_response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": nlg_prompt},
-                        {"role": "user", "content": json.dumps(nlg_input_context, indent=2, default=str)}
-                    ],
-                    temperature=0.3
-                )
-                final_answer = nlg_response.choices[0].message.content.strip()
-                logger.info(f"Generated final answer: {final_answer}")
-            except Exception as nlg_err:
-                 logger.error(f"Error during NLG LLM call: {nlg_err}", exc_info=True)
-                 final_answer = "I found the information based on the policy, but I'm having trouble phrasing the answer right now. Please try rephrasing your question."
-
-            end_time = time.time()
-            logger.info(f"Total processing time: {end_time - start_time:.2f} seconds")
-
-            response_data = {
-                'response': final_answer,
-                'explanation': explanation_string, 
-                'debug': {
-                    'nlu': nlu_json,
-                    'prolog_query': query_string,
-                    'prolog_result': kb_result_data
-                }
-            }
-            return jsonify(response_data), 200, headers
-
-        else:
-            logger.error(f"Received unexpected NLU status: {nlu_status}. NLU JSON: {nlu_json}")
-            return jsonify({
-                'response': "I'm sorry, I encountered an unexpected issue understanding that request.",
-                 'explanation': None, 
-                 'debug': {'nlu': nlu_json}
-            }), 200, headers
+        with timer.stage('nlu'):
+            nlu_json, raw_nlu_output, user_question = resolve_turn(conversation_id, user_question, timer)
+        with timer.stage('retrieval'):
+            citations = policy_citations(user_question)
+        status, payload = answer_turn(kb, user_question, nlu_json, raw_nlu_output, citations, timer)
+        logger.info(f"Total processing time: {time.time() - start_time:.2f} seconds")
+        return respond(payload, status)
 
+    except LLMDeadlineExceeded as deadline_err:
+        logger.error(f"Error processing message: {deadline_err}")
+        return respond({'error': f'Timed out while processing message ({deadline_err.call}).'}, 504)
     except FileNotFoundError as fnf_err:
         logger.error(f"Configuration file not found: {fnf_err}", exc_info=True)
-        return jsonify({'error': 'Server configuration error (missing files).'}), 500, headers
+        return respond({'error': 'Server configuration error (missing files).'}, 500)
     except ValueError as val_err:
         logger.error(f"Data validation or processing error: {val_err}", exc_info=True)
-        return jsonify({'error': f'Failed to process message: {val_err}'}), 500, headers 
+        return respond({'error': f'Failed to process message: {val_err}'}, 500) 
     except Exception as e:
         logger.error(f"Unhandled error processing message: {str(e)}", exc_info=True)
-        return jsonify({
+        return respond({
             'error': 'Failed to process message due to an unexpected internal error.'
-        }), 500, headers
+        }, 500)
+
+def format_sse(event, data):
+    """Formats one Server-Sent Events frame with a JSON payload."""
+    return f"event: {event}\ndata: {encode_json(data).decode('utf-8')}\n\n"
+
+def stream_pipeline_events(user_question, start_time, timer, conversation_id, include_debug=False):
+    """Runs the chat pipeline and yields an SSE frame as each stage completes; nlu and prolog frames only with include_debug."""
+    kb = kb_reloader.current
+    yield format_sse('received', {'message': user_question, 'conversation_id': conversation_id})
+    with timer.stage('nlu'):
+        nlu_json, raw_nlu_output, user_question = resolve_turn(conversation_id, user_question, timer)
+    with timer.stage('retrieval'):
+        citations = policy_citations(user_question)
+    reply = reply_without_kb(nlu_json, raw_nlu_output, citations, timer)
+    if reply is not None:
+        if include_debug:
+            nlu_debug = reply['debug'].get('nlu')
+            yield format_sse('nlu', {'status': nlu_debug.get('status'), 'predicate': nlu_debug.get('predicate'),
+                                     'args': nlu_debug.get('args', {})} if nlu_debug
+                             else {'status': 'error', 'raw_nlu': raw_nlu_output})
+        yield format_sse('token', {'text': reply['response']})
+        yield format_sse('done', {'response': reply['response'], 'explanation': None, 'citations': citations})
+        return
+
+    predicate_name = nlu_json['predicate']
+    args_dict = nlu_json.get("args", {})
+    if include_debug:
+        yield format_sse('nlu', {'status': nlu_json['status'], 'predicate': predicate_name, 'args': args_dict})
+    answer = query_kb(kb, predicate_name, args_dict, timer)
+    if include_debug:
+        yield format_sse('prolog', {'query': answer['prolog_query'], 'result': answer['prolog_result']})
+    yield format_sse('explanation', {'explanation': answer['explanation']})
+
+    if 'response' in answer:
+        logger.info(f"Streaming materialized answer for {predicate_name} {args_dict}")
+        answer_chunks = [answer['response']]
+        yield format_sse('token', {'text': answer['response']})
+    else:
+        answer_chunks = []
+        try:
+            with timer.stage('nlg'):
+                for chunk in stream_answer(user_question, predicate_name, args_dict,
+                                           answer['prolog_query'], answer['prolog_result'], timer):
+                    answer_chunks.append(chunk)
+                    yield format_sse('token', {'text': chunk})
+        except Exception as nlg_err:
+            logger.error(f"Error during streamed NLG LLM call: {nlg_err}", exc_info=True)
+            if not answer_chunks:
+                answer_chunks.append(NLG_FALLBACK_ANSWER)
+                yield format_sse('token', {'text': NLG_FALLBACK_ANSWER})
+
+    final_answer = ''.join(answer_chunks).strip()
+    logger.info(f"Streamed final answer: {final_answer}")
+    logger.info(f"Total processing time: {time.time() - start_time:.2f} seconds")
+    yield format_sse('done', {'response': final_answer, 'explanation': answer['explanation'], 'citations': citations})
+
+def stream_events(user_question, start_time, timer, conversation_id, include_debug=False):
+    """stream_pipeline_events() for a streaming response: an error ends the stream with an error frame."""
+    status = 200
+    try:
+        yield from stream_pipeline_events(user_question, start_time, timer, conversation_id, include_debug)
+    except Exception as e:
+        status = 500
+        logger.error(f"Unhandled error streaming message: {str(e)}", exc_info=True)
+        yield format_sse('error', {'error': 'Failed to process message due to an unexpected internal error.'})
+    finally:
+        timer.finish(status)
+
+@app.route('/api/chat/stream', methods=['POST'])
+def stream_message():
+    start_time = time.time()
+    timer = RequestTimer('stream')
+    include_debug = wants_debug()
+
+    with timer.stage('parse'):
+        data = request.get_json(silent=True)
+    if data is None:
+        logger.warning("Received stream request with no JSON body.")
+        timer.finish(400)
+        return jsonify({'error': 'Request body must be JSON.'}), 400
+    user_question = data.get('message', '')
+    if not user_question:
+        logger.warning("Received stream request with no message.")
+        timer.finish(400)
+        return jsonify({'error': 'No message provided'}), 400
+    conversation_id = conversation_id_or_new(data.get('conversation_id'))
+    logger.info(f"Received streamed user question: {user_question}")
+
+    events = stream_events(user_question, start_time, timer, conversation_id, include_debug)
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """Answers many questions in one request; NDJSON lines are streamed back as each answer completes."""
+    timer = RequestTimer('chat_batch')
+    data = request.get_json(silent=True)
+    try:
+        questions, concurrency = prepare_chat_batch(data)
+    except ValueError as val_err:
+        timer.finish(400)
+        return jsonify({'error': str(val_err)}), 400
+    logger.info(f"Received chat batch of {len(questions)} questions (concurrency {concurrency})")
+    return Response(stream_with_context(chat_batch_lines(questions, concurrency, timer)),
+                    mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+
+def run_eligibility_batch(data, timer):
+    """Validates a batch eligibility body and checks its items. Returns (status_code, payload)."""
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return 400, {'error': "Request body must be JSON with an 'items' list."}
+    if len(items) > ELIGIBILITY_BATCH_MAX_ITEMS:
+        return 413, {'error': f'Too many items (limit {ELIGIBILITY_BATCH_MAX_ITEMS}).'}
+    kb = kb_reloader.current
+    timer.predicate = 'check_eligibility_batch'
+    try:
+        with timer.stage('prolog'):
+            results = check_eligibility_batch(kb.engine, items, ELIGIBILITY_BATCH_TIMEOUT_SECONDS)
+    except Exception as prolog_err:
+        logger.error(f"Error checking batch eligibility for {len(items)} items: {prolog_err}", exc_info=True)
+        return 500, {'error': 'Internal error querying knowledge base.'}
+    return 200, {
+        'results': results,
+        'eligible_count': sum(1 for r in results if r['eligible']),
+        'kb_version': kb.version
+    }
+
+@app.route('/api/eligibility/batch', methods=['POST'])
+def eligibility_batch():
+    """Checks return eligibility for every line of an order in one Prolog call."""
+    timer = RequestTimer('eligibility_batch')
+    with timer.stage('parse'):
+        data = request.get_json(silent=True)
+    status, payload = run_eligibility_batch(data, timer)
+    with timer.stage('serialize'):
+        response = jsonify(payload)
+    timer.finish(status)
+    return response, status, {'Server-Timing': timer.server_timing()}
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        'nlu_cache': nlu_cache.stats() if nlu_cache else None,
+        'sessions': session_store.stats() if session_store else None
+    }), 200
+
+@app.route('/api/prolog/stats', methods=['GET'])
+def prolog_stats():
+    kb = kb_reloader.current
+    stats = kb.engine.stats()
+    stats['kb'] = {'version': kb.version, 'loaded_at': kb.loaded_at, 'last_reload': kb_reloader.last_reload}
+    return jsonify(stats), 200
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    """Readiness probe: the live KB version and how long this worker took to start."""
+    kb = kb_reloader.current
+    return jsonify({'status': 'ok', 'pid': os.getpid(), 'kb_version': kb.version,
+                    'startup': startup_timer.report()}), 200
+
+def is_admin_request():
+    expected = f"Bearer {ADMIN_TOKEN}"
+    provided = request.headers.get('Authorization', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(provided.encode('utf-8'), expected.encode('utf-8'))
+
+def debug_allowed(requested, authorized):
+    """Whether a response carries its debug section. RESPONSE_DEBUG: 'off', 'authorized' (admin token) or 'any'."""
+    if not requested or RESPONSE_DEBUG == 'off':
+        return False
+    return RESPONSE_DEBUG == 'any' or authorized
+
+def wants_debug():
+    """Debug output is requested per call with an X-Debug: 1 header or ?debug=1."""
+    requested = debug_flag(request.headers.get('X-Debug')) or debug_flag(request.args.get('debug'))
+    return debug_allowed(requested, requested and is_admin_request())
+
+@app.route('/api/admin/reload-kb', methods=['POST'])
+def reload_kb():
+    """Consults the current KB file into a fresh engine, gates it on the prolog_test cases and swaps it in."""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    result = kb_reloader.reload(reason='admin')
+    return jsonify(result), 409 if result['status'] == 'rejected' else 200
 
 if __name__ == '__main__':
+    create_app()
     port = int(os.environ.get('PORT', 5001))
     logger.info(f"Starting SSENSE chatbot API on http://localhost:{port}")
     app.run(debug=False, host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,478 @@
+# Filename: asgi_app.py
+# Asyncio serving mode for the chat API. Run with: uvicorn --factory asgi_app:create_app --port 5001
+import asyncio
+import hmac
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from openai import AsyncOpenAI
+
+import app as chat_app
+from metrics import REGISTRY, RequestTimer
+from nlu_cache import normalize_question
+from session_store import build_slot_messages, conversation_id_or_new, fill_slots_locally, parse_slot_output
+from singleflight import AsyncSingleFlight, flight_key
+from llm_calls import LLMDeadlineExceeded, complete_async
+from responses import accepted_encoding, compile_origins, compress, debug_flag, encode_json, origin_allowed, strip_debug
+
+logger = logging.getLogger("ssense_chatbot")
+
+MAX_IN_FLIGHT = int(os.environ.get('MAX_IN_FLIGHT', 256))
+PROLOG_TIMEOUT_SECONDS = float(os.environ.get('PROLOG_TIMEOUT_SECONDS', 5))
+MAX_BODY_BYTES = 64 * 1024
+MAX_BATCH_BODY_BYTES = 2 * 1024 * 1024
+WELCOME_MESSAGE = 'Welcome to SSENSE support. How can I help you with your returns questions today?'
+CORS_ORIGIN_PATTERNS = compile_origins(chat_app.CORS_ORIGINS)
+
+# Set up by create_app(), so importing this module loads no KB and opens no clients.
+async_client = None
+prolog_executor = None
+nlu_flight = nlg_flight = None
+in_flight = 0
+
+
+def create_app():
+    """
+    ASGI application factory: runs the Flask app's startup (prompts, KB, caches, sync client) and
+    sets up the async client, the Prolog threads and the single-flight groups. Idempotent.
+    """
+    global async_client, prolog_executor, nlu_flight, nlg_flight
+    if async_client is not None:
+        return app
+    # KB work runs on executor threads, and a thread whose query missed the stage deadline can't be
+    # stopped from here. Pool workers are killed at PROLOG_QUERY_TIMEOUT_SECONDS, which frees the
+    # thread, so this mode always uses a pool, with one thread per worker.
+    if chat_app.PROLOG_POOL_SIZE < 1:
+        logger.info("ASGI mode needs killable Prolog workers; using a pool of 1 (set PROLOG_POOL_SIZE for more)")
+        chat_app.PROLOG_POOL_SIZE = 1
+    chat_app.create_app()
+    async_client = AsyncOpenAI()
+    prolog_executor = ThreadPoolExecutor(max_workers=chat_app.PROLOG_POOL_SIZE, thread_name_prefix="prolog")
+    # A coalesced call fails with the leader's StageTimeout, so waiters share its deadline too.
+    nlu_flight = AsyncSingleFlight('nlu') if chat_app.SINGLE_FLIGHT_ENABLED else None
+    nlg_flight = AsyncSingleFlight('nlg') if chat_app.SINGLE_FLIGHT_ENABLED else None
+    return app
+
+
+class StageTimeout(Exception):
+    """Raised when a pipeline stage exceeds its deadline."""
+
+    def __init__(self, stage):
+        super().__init__(f"{stage} stage timed out")
+        self.stage = stage
+
+
+async def run_stage(stage, awaitable, timeout):
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"{stage} stage exceeded {timeout:.1f}s deadline")
+        raise StageTimeout(stage)
+
+
+async def run_blocking(stage, func, *args):
+    """Runs blocking KB work on the Prolog thread with the Prolog stage deadline."""
+    loop = asyncio.get_running_loop()
+    return await run_stage(stage, loop.run_in_executor(prolog_executor, func, *args), PROLOG_TIMEOUT_SECONDS)
+
+
+async def complete_llm(stage, model=None, **request):
+    """One chat completion with the stage's model, deadline and hedging; a missed deadline is a StageTimeout."""
+    try:
+        return await complete_async(async_client, stage, model, **request)
+    except LLMDeadlineExceeded:
+        logger.error(f"{stage.call} stage exceeded {stage.deadline:.1f}s deadline")
+        raise StageTimeout(stage.call)
+
+
+async def coalesce_async(flight, key, factory):
+    return await (flight.do(key, factory) if flight else factory())
+
+
+async def resolve_nlu_async(user_question, timer=None):
+    """Async counterpart of app.resolve_nlu using the async OpenAI client."""
+    nlu_json = chat_app.resolve_nlu_locally(user_question)
+    if nlu_json is not None:
+        return nlu_json, None
+    return await coalesce_async(nlu_flight, normalize_question(user_question),
+                                lambda: call_nlu_llm_async(user_question, timer))
+
+
+async def request_nlu_async(user_question, model, timer=None):
+    nlu_response = await complete_llm(
+        chat_app.nlu_stage, model,
+        messages=chat_app.build_nlu_messages(user_question),
+        temperature=0.1,
+        response_format={"type": "json_object"}
+    )
+    if timer:
+        timer.add_usage('nlu', nlu_response.usage)
+    return nlu_response.choices[0].message.content.strip()
+
+
+async def call_nlu_llm_async(user_question, timer=None):
+    logger.info("Step 1: Running async NLU/Planning LLM call")
+    raw_nlu_output = await request_nlu_async(user_question, chat_app.NLU_MODEL, timer)
+    if chat_app.nlu_escalation_reason(raw_nlu_output):
+        raw_nlu_output = await request_nlu_async(user_question, chat_app.NLU_ESCALATION_MODEL, timer)
+    return chat_app.parse_nlu_output(user_question, raw_nlu_output), raw_nlu_output
+
+
+async def resolve_turn_async(conversation_id, user_question, timer=None):
+    """Async counterpart of app.resolve_turn."""
+    pending = chat_app.pending_clarification(conversation_id)
+    if pending is not None:
+        filled = fill_slots_locally(pending, user_question)
+        source = 'local'
+        if not filled:
+            logger.info("Step 1: Running async slot-only LLM call for pending clarification")
+            slot_response = await complete_llm(
+                chat_app.slot_stage,
+                messages=build_slot_messages(chat_app.slot_prompt, pending, user_question),
+                temperature=0,
+                response_format={"type": "json_object"}
+            )
+            if timer:
+                timer.add_usage('slot', slot_response.usage)
+            filled = parse_slot_output(pending, slot_response.choices[0].message.content.strip())
+            source = 'llm'
+        completed = chat_app.complete_clarification(conversation_id, pending, user_question, filled, source)
+        if completed is not None:
+            nlu_json, question = completed
+            return nlu_json, None, question
+    nlu_json, raw_nlu_output = await resolve_nlu_async(user_question, timer)
+    chat_app.remember_turn(conversation_id, user_question, nlu_json)
+    return nlu_json, raw_nlu_output, user_question
+
+
+async def generate_answer_async(user_question, predicate_name, args_dict, query_string, kb_result_data, timer=None):
+    """Async counterpart of app.generate_answer."""
+    final_answer = chat_app.render_template_answer(predicate_name, args_dict, kb_result_data)
+    if final_answer is not None:
+        return final_answer
+    return await coalesce_async(nlg_flight, flight_key(predicate_name, args_dict, kb_result_data), lambda: call_nlg_llm_async(
+        user_question, predicate_name, args_dict, query_string, kb_result_data, timer))
+
+
+async def call_nlg_llm_async(user_question, predicate_name, args_dict, query_string, kb_result_data, timer=None):
+    logger.info("Step 5: Running async NLG LLM call")
+    nlg_response = await complete_llm(
+        chat_app.nlg_stage,
+        messages=chat_app.build_nlg_messages(user_question, predicate_name, args_dict, query_string, kb_result_data),
+        temperature=0.3
+    )
+    if timer:
+        timer.add_usage('nlg', nlg_response.usage)
+    final_answer = nlg_response.choices[0].message.content.strip()
+    logger.info(f"Generated final answer: {final_answer}")
+    return final_answer
+
+
+async def process_message_async(user_question, timer, conversation_id):
+    """Runs the chat pipeline for one question. Returns (status_code, payload) like app.process_message."""
+    kb = chat_app.kb_reloader.current
+    with timer.stage('nlu'):
+        nlu_json, raw_nlu_output, user_question = await resolve_turn_async(conversation_id, user_question, timer)
+    with timer.stage('retrieval'):
+        citations = chat_app.policy_citations(user_question)
+    status, payload = await answer_turn_async(kb, user_question, nlu_json, raw_nlu_output, citations, timer)
+    if 'response' in payload:
+        payload['citations'] = citations
+    return status, payload
+
+
+async def answer_turn_async(kb, user_question, nlu_json, raw_nlu_output, citations, timer):
+    """Async counterpart of app.answer_turn: the same pipeline steps, with the KB work off the event loop and async NLG."""
+    reply = chat_app.reply_without_kb(nlu_json, raw_nlu_output, citations, timer)
+    if reply is not None:
+        return 200, reply
+    predicate_name = nlu_json['predicate']
+    args_dict = nlu_json.get('args', {})
+    try:
+        answer = await run_blocking('prolog', chat_app.query_kb, kb, predicate_name, args_dict, timer)
+    except StageTimeout:
+        raise
+    except Exception as kb_err:
+        return chat_app.kb_error_reply(kb_err)
+
+    if 'response' not in answer:
+        try:
+            with timer.stage('nlg'):
+                answer['response'] = await generate_answer_async(
+                    user_question, predicate_name, args_dict, answer['prolog_query'], answer['prolog_result'], timer)
+        except Exception as nlg_err:
+            logger.error(f"Error during async NLG LLM call: {nlg_err}", exc_info=True)
+            answer['response'] = chat_app.NLG_FALLBACK_ANSWER
+    return 200, chat_app.turn_payload(nlu_json, answer)
+
+
+async def read_body(receive, max_bytes=MAX_BODY_BYTES):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > max_bytes:
+            raise ValueError("Request body too large.")
+        if not message.get('more_body', False):
+            return body
+
+
+def request_header(scope, name):
+    for header_name, value in scope.get('headers', []):
+        if header_name == name:
+            return value.decode('latin-1')
+    return ''
+
+
+def is_admin(scope):
+    authorization = request_header(scope, b'authorization')
+    expected = f"Bearer {chat_app.ADMIN_TOKEN}"
+    return bool(chat_app.ADMIN_TOKEN) and hmac.compare_digest(authorization.encode('latin-1'), expected.encode('utf-8'))
+
+
+def wants_debug(scope):
+    """Async counterpart of app.wants_debug: X-Debug: 1 or ?debug=1, subject to RESPONSE_DEBUG."""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    requested = debug_flag(request_header(scope, b'x-debug')) or debug_flag((query.get('debug') or [''])[0])
+    return chat_app.debug_allowed(requested, requested and is_admin(scope))
+
+
+def with_cors(scope, send):
+    """Wraps send so every response start carries the CORS headers for an allowed Origin."""
+    origin = request_header(scope, b'origin')
+    if not origin or not origin_allowed(origin, CORS_ORIGIN_PATTERNS):
+        return send
+    cors = [
+        (b'access-control-allow-origin', origin.encode('latin-1')),
+        (b'access-control-allow-credentials', b'true'),
+        (b'access-control-expose-headers', b'Server-Timing'),
+        (b'vary', b'Origin'),
+    ]
+
+    async def send_with_cors(message):
+        if message['type'] == 'http.response.start':
+            message = dict(message, headers=list(message.get('headers', [])) + cors)
+        await send(message)
+
+    return send_with_cors
+
+
+async def send_json(send, scope, status, payload, extra_headers=(), timer=None):
+    if timer:
+        with timer.stage('serialize'):
+            body = encode_json(payload)
+        timer.finish(status)
+        extra_headers = list(extra_headers) + [(b'server-timing', timer.server_timing().encode('latin-1')),
+                                               (b'timing-allow-origin', b'*')]
+    else:
+        body = encode_json(payload)
+    headers = [(b'content-type', b'application/json'), (b'vary', b'Accept-Encoding')]
+    encoding = accepted_encoding(request_header(scope, b'accept-encoding'))
+    if encoding and len(body) >= chat_app.RESPONSE_COMPRESS_MIN_BYTES:
+        body = compress(body, encoding)
+        headers.append((b'content-encoding', encoding.encode()))
+    headers.append((b'content-length', str(len(body)).encode()))
+    headers.extend(extra_headers)
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def limit_in_flight(handler, scope, receive, send):
+    """Runs handler unless MAX_IN_FLIGHT requests are already being processed; a batch counts as one."""
+    global in_flight
+    if in_flight >= MAX_IN_FLIGHT:
+        logger.warning(f"Rejecting {scope['path']} request: {in_flight} requests in flight (limit {MAX_IN_FLIGHT})")
+        await send_json(send, scope, 503, {'error': 'Server is busy, please retry shortly.'}, [(b'retry-after', b'1')])
+        return
+    in_flight += 1
+    try:
+        await handler(scope, receive, send)
+    finally:
+        in_flight -= 1
+
+
+async def read_chat_request(scope, receive, send, timer):
+    """Parses a chat request body. Returns (user_question, conversation_id), or None after sending a 400."""
+    try:
+        body = await read_body(receive)
+        with timer.stage('parse'):
+            data = json.loads(body or b'null')
+    except ValueError as req_err:
+        logger.error(f"Error parsing request data: {req_err}", exc_info=True)
+        await send_json(send, scope, 400, {'error': 'Invalid request format.'}, timer=timer)
+        return None
+    if not isinstance(data, dict):
+        await send_json(send, scope, 400, {'error': 'Request body must be JSON.'}, timer=timer)
+        return None
+    user_question = data.get('message', '')
+    if not user_question:
+        await send_json(send, scope, 400, {'error': 'No message provided'}, timer=timer)
+        return None
+    return user_question, conversation_id_or_new(data.get('conversation_id'))
+
+
+async def handle_chat(scope, receive, send):
+    start_time = time.time()
+    timer = RequestTimer('chat')
+    chat_request = await read_chat_request(scope, receive, send, timer)
+    if chat_request is None:
+        return
+    user_question, conversation_id = chat_request
+    logger.info(f"Received user question: {user_question}")
+
+    try:
+        status, payload = await process_message_async(user_question, timer, conversation_id)
+        strip_debug(payload, wants_debug(scope))
+    except StageTimeout as timeout_err:
+        status, payload = 504, {'error': f'Timed out while processing message ({timeout_err.stage}).'}
+    except Exception as e:
+        logger.error(f"Unhandled error processing message: {str(e)}", exc_info=True)
+        status, payload = 500, {'error': 'Failed to process message due to an unexpected internal error.'}
+    payload['conversation_id'] = conversation_id
+    logger.info(f"Total processing time: {time.time() - start_time:.2f} seconds")
+    await send_json(send, scope, status, payload, timer=timer)
+
+
+async def pump_lines(send, lines):
+    """Sends the lines of a sync generator as response body chunks, pulling each on a default-executor thread."""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            line = await loop.run_in_executor(None, next, lines, None)
+            if line is None:
+                break
+            await send({'type': 'http.response.body', 'body': line.encode('utf-8'), 'more_body': True})
+    finally:
+        lines.close()
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def handle_chat_stream(scope, receive, send):
+    start_time = time.time()
+    timer = RequestTimer('stream')
+    chat_request = await read_chat_request(scope, receive, send, timer)
+    if chat_request is None:
+        return
+    user_question, conversation_id = chat_request
+    logger.info(f"Received streamed user question: {user_question}")
+
+    headers = [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+    # The stream runs the sync pipeline (sync client and single-flight groups), one stage per pulled frame.
+    await pump_lines(send, chat_app.stream_events(
+        user_question, start_time, timer, conversation_id, wants_debug(scope)))
+
+
+async def handle_eligibility_batch(scope, receive, send):
+    timer = RequestTimer('eligibility_batch')
+    try:
+        body = await read_body(receive, MAX_BATCH_BODY_BYTES)
+        with timer.stage('parse'):
+            data = json.loads(body or b'null')
+    except ValueError as req_err:
+        logger.error(f"Error parsing batch eligibility request: {req_err}", exc_info=True)
+        await send_json(send, scope, 400, {'error': 'Invalid request format.'}, timer=timer)
+        return
+    loop = asyncio.get_running_loop()
+    status, payload = await loop.run_in_executor(prolog_executor, chat_app.run_eligibility_batch, data, timer)
+    await send_json(send, scope, status, payload, timer=timer)
+
+
+async def handle_chat_batch(scope, receive, send):
+    timer = RequestTimer('chat_batch')
+    try:
+        body = await read_body(receive, MAX_BATCH_BODY_BYTES)
+        questions, concurrency = chat_app.prepare_chat_batch(json.loads(body or b'null'))
+    except ValueError as req_err:
+        timer.finish(400)
+        await send_json(send, scope, 400, {'error': str(req_err)})
+        return
+    logger.info(f"Received chat batch of {len(questions)} questions (concurrency {concurrency})")
+
+    headers = [(b'content-type', b'application/x-ndjson'), (b'cache-control', b'no-cache')]
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+    # The batch runs its own thread pool; its lines are sent as they complete.
+    await pump_lines(send, chat_app.chat_batch_lines(questions, concurrency, timer))
+
+
+async def handle_reload_kb(scope, send):
+    if not is_admin(scope):
+        await send_json(send, scope, 403, {'error': 'Forbidden'})
+        return
+    # Loading and gating the candidate KB blocks for a while; keep it off the event loop and the Prolog threads.
+    result = await asyncio.get_running_loop().run_in_executor(None, chat_app.kb_reloader.reload, 'admin')
+    await send_json(send, scope, 409 if result['status'] == 'rejected' else 200, result)
+
+
+async def handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Servers that load asgi_app:app instead of the factory initialize here.
+            create_app()
+            logger.info(f"ASGI app started (max in flight: {MAX_IN_FLIGHT})")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_client.close()
+            prolog_executor.shutdown(wait=False)
+            chat_app.kb_reloader.stop()
+            chat_app.kb_reloader.current.engine.close()
+            if chat_app.policy_index:
+                chat_app.policy_index.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await handle_lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    method, path = scope['method'], scope['path']
+    send = with_cors(scope, send)
+    if method == 'OPTIONS' and path.startswith('/api/'):
+        await send_json(send, scope, 200, {'status': 'ok'}, [
+            (b'access-control-allow-headers', b'Content-Type,Authorization,X-Debug'),
+            (b'access-control-allow-methods', b'GET,POST,OPTIONS'),
+        ])
+    elif method == 'POST' and path == '/api/chat':
+        await limit_in_flight(handle_chat, scope, receive, send)
+    elif method == 'POST' and path == '/api/chat/stream':
+        await limit_in_flight(handle_chat_stream, scope, receive, send)
+    elif method == 'GET' and path == '/api/chat/welcome':
+        await send_json(send, scope, 200, {'message': WELCOME_MESSAGE})
+    elif method == 'GET' and path == '/api/metrics':
+        body = REGISTRY.render().encode('utf-8')
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/plain; version=0.0.4'), (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+    elif method == 'GET' and path == '/api/cache/stats':
+        await send_json(send, scope, 200, {
+            'nlu_cache': chat_app.nlu_cache.stats() if chat_app.nlu_cache else None,
+            'sessions': chat_app.session_store.stats() if chat_app.session_store else None,
+            'in_flight': in_flight,
+            'max_in_flight': MAX_IN_FLIGHT,
+        })
+    elif method == 'GET' and path == '/api/prolog/stats':
+        kb = chat_app.kb_reloader.current
+        stats = kb.engine.stats()
+        stats['kb'] = {'version': kb.version, 'loaded_at': kb.loaded_at, 'last_reload': chat_app.kb_reloader.last_reload}
+        await send_json(send, scope, 200, stats)
+    elif method == 'GET' and path == '/api/health':
+        await send_json(send, scope, 200, {'status': 'ok', 'pid': os.getpid(), 'in_flight': in_flight,
+                                           'kb_version': chat_app.kb_reloader.current.version,
+                                           'startup': chat_app.startup_timer.report()})
+    elif method == 'POST' and path == '/api/chat/batch':
+        await limit_in_flight(handle_chat_batch, scope, receive, send)
+    elif method == 'POST' and path == '/api/eligibility/batch':
+        await limit_in_flight(handle_eligibility_batch, scope, receive, send)
+    elif method == 'POST' and path == '/api/admin/reload-kb':
+        await handle_reload_kb(scope, send)
+    else:
+        await send_json(send, scope, 404, {'error': 'Not found'})
@@ -0,0 +1,105 @@
+# Filename: chat_batch.py
+# Batch chat for offline jobs (prompt regression runs, cache pre-warming). NLU runs for many
+# questions concurrently; questions that resolve to the same (predicate, args) share a single
+# Prolog query and NLG generation. Results are yielded in completion order.
+import json
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger("ssense_chatbot")
+
+
+def answer_key(predicate_name, args_dict):
+    return predicate_name, json.dumps(args_dict, sort_keys=True, default=str)
+
+
+def parse_batch_questions(items):
+    """Accepts plain strings or {"id": ..., "message": ...} objects; returns [(id, question)] or raises ValueError."""
+    questions = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            question_id, question = index, item
+        elif isinstance(item, dict):
+            question_id, question = item.get('id', index), item.get('message')
+        else:
+            question_id, question = index, None
+        if not isinstance(question, str) or not question.strip():
+            raise ValueError(f"Question {index} has no message.")
+        questions.append((question_id, question))
+    return questions
+
+
+def run_chat_batch(questions, resolve_question, answer_query, concurrency):
+    """
+    Yields one result dict per (id, question), then a summary dict.
+    resolve_question(question) returns (nlu_json, payload), where payload is the final reply when no
+    KB query is needed; answer_query(question, predicate_name, args_dict) returns the answer payload
+    and is called once per distinct (predicate, args).
+    """
+    started = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="chat-batch")
+    pending = {}
+    groups = {}
+    counts = {'questions': len(questions), 'distinct_queries': 0, 'deduplicated': 0, 'errors': 0}
+
+    def result(index, nlu_json, payload, deduplicated=False):
+        question_id, question = questions[index]
+        nlu_json = nlu_json or {}
+        line = {'type': 'result', 'id': question_id, 'question': question,
+                'nlu': {k: nlu_json.get(k) for k in ('status', 'predicate', 'args')}}
+        line.update(payload)
+        if deduplicated:
+            line['deduplicated'] = True
+        return line
+
+    try:
+        for index, (_, question) in enumerate(questions):
+            pending[executor.submit(resolve_question, question)] = ('nlu', index)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, ref = pending.pop(future)
+                if kind == 'nlu':
+                    try:
+                        nlu_json, payload = future.result()
+                    except Exception as e:
+                        logger.error(f"Error during batch NLU for question {ref}: {e}", exc_info=True)
+                        counts['errors'] += 1
+                        yield result(ref, None, {'error': 'Failed to process message due to an unexpected internal error.'})
+                        continue
+                    if payload is not None:
+                        yield result(ref, nlu_json, payload)
+                        continue
+                    key = answer_key(nlu_json['predicate'], nlu_json.get('args', {}))
+                    group = groups.get(key)
+                    if group is None:
+                        group = groups[key] = {'nlu': [], 'answer': None}
+                        counts['distinct_queries'] += 1
+                        answer_future = executor.submit(
+                            answer_query, questions[ref][1], nlu_json['predicate'], nlu_json.get('args', {}))
+                        pending[answer_future] = ('answer', key)
+                    elif group['answer'] is not None:
+                        counts['errors' if 'error' in group['answer'] else 'deduplicated'] += 1
+                        yield result(ref, nlu_json, group['answer'], deduplicated=True)
+                        continue
+                    group['nlu'].append((ref, nlu_json))
+                else:
+                    group = groups[ref]
+                    try:
+                        group['answer'] = future.result()
+                    except Exception as e:
+                        logger.error(f"Error answering batch query {ref}: {e}", exc_info=True)
+                        counts['errors'] += len(group['nlu'])
+                        group['answer'] = {'error': 'Internal error querying knowledge base.'}
+                    for position, (index, nlu_json) in enumerate(group['nlu']):
+                        if position > 0 and 'error' not in group['answer']:
+                            counts['deduplicated'] += 1
+                        yield result(index, nlu_json, group['answer'], deduplicated=position > 0)
+                    group['nlu'] = []
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    counts['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(f"Chat batch finished: {counts}")
+    yield dict(type='summary', **counts)
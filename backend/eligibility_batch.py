@@ -0,0 +1,67 @@
+# Filename: eligibility_batch.py
+# Cart-level eligibility for /api/eligibility/batch. Order lines are validated here and then
+# checked together by one check_eligibility_batch/2 call, which reports the first failing
+# criterion per item, so the cost is one Prolog round-trip per order instead of one per line.
+import logging
+
+logger = logging.getLogger("ssense_chatbot")
+
+BATCH_PREDICATE = 'check_eligibility_batch'
+ELIGIBILITY_FIELDS = ('ItemType', 'Condition', 'Packaging', 'Tags', 'DaysSinceDelivery')
+
+
+def to_atom_text(value):
+    """'Final Sale Item' -> 'final_sale_item', matching the KB's atom spelling."""
+    return '_'.join(value.strip().lower().split())
+
+
+def validate_item(record):
+    """Returns ([ItemType, Condition, Packaging, Tags, DaysSinceDelivery], None), or (None, error message)."""
+    if not isinstance(record, dict):
+        return None, 'Item must be an object.'
+    missing = [field for field in ELIGIBILITY_FIELDS if record.get(field) in (None, '')]
+    if missing:
+        return None, f"Missing field(s): {', '.join(missing)}."
+    row = []
+    for field in ELIGIBILITY_FIELDS[:-1]:
+        if not isinstance(record[field], str):
+            return None, f"{field} must be a string."
+        row.append(to_atom_text(record[field]))
+    days = record['DaysSinceDelivery']
+    if isinstance(days, bool) or not isinstance(days, int) or days < 0:
+        return None, 'DaysSinceDelivery must be a non-negative integer.'
+    row.append(days)
+    return row, None
+
+
+def check_eligibility_batch(engine, records, timeout=None):
+    """
+    Checks every record with a single check_eligibility_batch/2 call. Returns one result per
+    record, in order; invalid records get failed_criterion 'invalid_item' and are not sent to Prolog.
+    """
+    results = [None] * len(records)
+    rows = []
+    positions = []
+    for index, record in enumerate(records):
+        row, error = validate_item(record)
+        if error:
+            results[index] = {'index': index, 'eligible': False, 'failed_criterion': 'invalid_item', 'detail': error}
+        else:
+            rows.append(row)
+            positions.append(index)
+
+    if rows:
+        solutions = engine.run_plan(BATCH_PREDICATE, [rows], timeout=timeout)
+        verdicts = solutions[0]['Verdicts'] if solutions else []
+        if len(verdicts) != len(rows):
+            raise RuntimeError(f"{BATCH_PREDICATE} returned {len(verdicts)} verdicts for {len(rows)} items.")
+        for index, (criterion, detail) in zip(positions, verdicts):
+            eligible = criterion == 'eligible'
+            results[index] = {
+                'index': index,
+                'eligible': eligible,
+                'failed_criterion': None if eligible else criterion,
+                'detail': None if detail == 'none' else detail,
+            }
+    logger.info(f"Checked eligibility for {len(records)} items ({len(rows)} valid) in one KB call")
+    return results
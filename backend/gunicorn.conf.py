@@ -0,0 +1,24 @@
+# Filename: gunicorn.conf.py
+# Preforking server mode. Run from any directory with: gunicorn -c backend/gunicorn.conf.py
+# The master runs the shared startup phase once (prompts, intent router, policy index, answer
+# table, precompiled KB) and forks; each worker then only opens its own OpenAI client, Prolog
+# engine and caches, so adding a worker costs the per-worker phase alone.
+import multiprocessing
+import os
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+wsgi_app = "app:create_app(prefork=True)"
+preload_app = True
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', 5001)}")
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+# Streamed answers keep a request open for the whole NLG call.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT_SECONDS', 60))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+
+def post_fork(server, worker):
+    import app
+    app.initialize_worker()
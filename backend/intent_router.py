@@ -0,0 +1,325 @@
+# Filename: intent_router.py
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+from nlu_cache import normalize_question
+
+logger = logging.getLogger("ssense_chatbot")
+
+OFF_TOPIC_LABEL = 'off_topic'
+OFF_TOPIC_NO_OVERLAP_CONFIDENCE = 0.9
+STOPWORDS = {
+    'a', 'an', 'the', 'i', 'me', 'my', 'is', 'are', 'do', 'does', 'can', 'to', 'for', 'of', 'it',
+    'in', 'on', 'and', 'or', 'this', 'that', 'you', 'your', 'be', 'if', 'what', 'whats', 'how',
+    'with', 'from', 'at', 'so', 'im', 'was', 'will', 'there', 'have', 'has', 'get', 'got',
+}
+
+# Keyword features: a hit votes for the predicate independently of the trained model.
+PREDICATE_KEYWORDS = {
+    'get_return_window': r"\b(how long|return window|how many days|how much time|deadline|time limit)\b",
+    'get_shipping_cost': r"\b(return shipping|shipping (cost|free)|pay for (return )?shipping|returns free|free returns?)\b",
+    'get_return_label_info': r"\b(label|prepaid|ppl|ra number)\b",
+    'get_return_fee': r"\b(return fee|transportation fee|fee|deduct(ed)?)\b",
+    'is_item_excluded': r"\b(excluded|exclusions?|returnable|final sale items?|cant be returned|non returnable)\b",
+    'get_initiation_method': r"\b(start|initiate|begin|request) (a |my )?return\b|\bsteps\b",
+    'can_exchange': r"\b(exchange|exchanges|swap)\b",
+    'get_contact_email': r"\b(email|e mail)\b",
+    'get_contact_chat_availability': r"\b(chat|live agent)\b",
+    'get_phone_number': r"\b(phone|call|toll free|number to call|telephone)\b",
+    'get_damaged_item_action': r"\b(arrived damaged|damaged on arrival|defective|broken on arrival|came damaged|received a damaged)\b",
+    'get_warranty_provider': r"\b(warranty (provider|claims?|repair)|who (provides|handles) (the )?warranty)\b",
+    'is_warranty_by_ssense': r"\b(ssense|you) (offer|provide|give)s? (a |the )?warranty\b|\bwarranty (provided|offered) by ssense\b",
+    'is_eligible': r"\b(eligible|can i (still )?return|send (it|them) back|accept a return)\b",
+}
+PREDICATE_KEYWORD_RES = {p: re.compile(pattern) for p, pattern in PREDICATE_KEYWORDS.items()}
+
+REGION_PATTERNS = [
+    ('hong_kong', r"\bhong kong\b"),
+    ('south_korea', r"\b(south )?korea\b"),
+    ('uk', r"\b(uk|united kingdom|england|britain|scotland|wales|london)\b"),
+    # Bare "us" is the pronoun far more often than the country; "u.s." normalizes to "u s".
+    ('usa', r"\b(usa|the us|u s|united states|america|american|new york|california)\b"),
+    ('canada', r"\b(canada|canadian|laval|quebec|montreal|toronto)\b"),
+    ('japan', r"\b(japan|tokyo)\b"),
+    ('australia', r"\b(australia|sydney|melbourne)\b"),
+    ('china', r"\bchina\b"),
+    ('other_international', r"\b(international|internationally|abroad|overseas|europe|france|germany|italy|spain|mexico|brazil|india)\b"),
+]
+PHONE_TYPE_PATTERNS = [
+    ('north_america_toll_free', r"\b(toll free|1 877|877)\b"),
+    ('quebec', r"\bquebec\b"),
+    ('local', r"\b(local|locally|montreal|514)\b"),
+]
+USER_TYPE_PATTERNS = [
+    ('guest', r"\b(guest|without an account|no account|dont have an account)\b"),
+    ('account_holder', r"\b(my account|account holder|logged in|have an account|order history)\b"),
+]
+ITEM_TYPE_PATTERNS = [
+    ('final_sale_item', r"\bfinal sale\b"),
+    ('face_mask', r"\b(face )?masks?\b"),
+    ('face_covering', r"\bface coverings?\b"),
+    ('sexual_wellness_toy', r"\b(sex toys?|vibrators?|sexual wellness toys?)\b"),
+    ('dangerous_good', r"\b(candles?|fragrances?|perfumes?|colognes?|oils?|aerosols?|pressurized cans?|batter(y|ies)|dangerous goods?)\b"),
+    ('swimwear', r"\b(swimwear|swimsuits?|bikinis?|bikini bottoms?|swim trunks)\b"),
+    ('intimate_apparel', r"\b(lingerie|underwear|bras?|hosiery|panties|boxers|intimates?)\b"),
+    ('self_care', r"\b(make up|makeup|skincare|skin care|cosmetics?|shampoo|lotion|face cream|cream|serum|lipstick)\b"),
+    ('sexual_wellness_non_toy', r"\b(condoms?|lubricants?|lube)\b"),
+    ('technology', r"\b(headphones?|earbuds?|laptop|tech|technology|electronics?|speaker|camera)\b"),
+    ('shoes', r"\b(shoes?|sneakers?|boots?|sandals?|heels|loafers?)\b"),
+    ('clothing', r"\b(clothing|clothes|sweaters?|jackets?|pants|shirts?|t shirts?|dress(es)?|coats?|jeans|hoodies?|skirts?|tops?|shorts)\b"),
+    ('accessory', r"\b(bags?|belts?|hats?|scarf|scarves|wallets?|sunglasses|jewelry|watch(es)?)\b"),
+]
+CONDITION_PATTERNS = [
+    ('damaged', r"(?<!arrived )\b(damaged|broken|torn|ripped|stained)\b"),
+    ('used', r"(?<!not )(?<!never )(?<!hasnt been )\b(used|worn|washed|wore)\b"),
+]
+PACKAGING_PATTERNS = [
+    ('sealed', r"\b(sealed|unopened|still in (the )?plastic)\b"),
+    ('opened', r"\b(opened|open box|opened the box|unsealed)\b"),
+    ('damaged', r"\b(damaged|torn|broken) (box|packaging)\b"),
+]
+TAGS_PATTERNS = [
+    ('hygienic_sticker_intact', r"\b(hygien(ic|e) (protection )?sticker)\b"),
+    ('removed', r"\b(removed|cut|took off|no|without)( the)? tags?\b|\btags? (removed|cut off|off)\b"),
+]
+DAYS_RE = re.compile(r"\b(\d+)\s*(day|week|month)s?\b")
+DAYS_SINGULAR_RE = re.compile(r"\b(a|an|1|last|this) (day|week|month)\b")
+DAYS_RELATIVE = {'today': 0, 'yesterday': 1}
+DAY_UNITS = {'day': 1, 'week': 7, 'month': 30}
+SLOT_PATTERNS = {
+    'Region': REGION_PATTERNS,
+    'PhoneType': PHONE_TYPE_PATTERNS,
+    'UserType': USER_TYPE_PATTERNS,
+    'ItemType': ITEM_TYPE_PATTERNS,
+    'Condition': CONDITION_PATTERNS,
+    'Packaging': PACKAGING_PATTERNS,
+    'Tags': TAGS_PATTERNS,
+}
+LOCATION_HINT_RE = re.compile(r"\b(?:in|from|to)\s+([A-Z][a-z]+)")
+
+PREDICATE_DEFAULTS = {
+    'is_eligible': {'Condition': 'original', 'Packaging': 'original_intact', 'Tags': 'intact'},
+    'get_shipping_cost': {'Region': 'canada'},
+    'get_return_label_info': {'Region': 'canada'},
+    'get_return_fee': {'Region': 'canada'},
+    'get_initiation_method': {'UserType': 'general'},
+}
+
+
+def tokenize(text):
+    """Unigram and bigram features over the normalized question, without stopword-only unigrams."""
+    words = normalize_question(text).split()
+    tokens = [w for w in words if w not in STOPWORDS]
+    tokens.extend(f"{a}_{b}" for a, b in zip(words, words[1:]))
+    return tokens
+
+
+def first_match(patterns, text):
+    for value, pattern in patterns:
+        if re.search(pattern, text):
+            return value
+    return None
+
+
+def extract_days(text):
+    """Converts relative delivery times to a day count (week -> 7, month -> 30), or None."""
+    match = DAYS_RE.search(text)
+    if match:
+        return int(match.group(1)) * DAY_UNITS[match.group(2)]
+    match = DAYS_SINGULAR_RE.search(text)
+    if match:
+        return DAY_UNITS[match.group(2)]
+    for word, days in DAYS_RELATIVE.items():
+        if re.search(rf"\b{word}\b", text):
+            return days
+    return None
+
+
+def extract_slot(arg_name, text, args=None):
+    """Value of one input argument found in normalized text, or None. Applies no defaults."""
+    if arg_name == 'DaysSinceDelivery':
+        return extract_days(text)
+    patterns = SLOT_PATTERNS.get(arg_name)
+    if patterns is None:
+        return None
+    value = first_match(patterns, text)
+    if value is None and arg_name == 'Tags' and (args or {}).get('ItemType') in ('swimwear', 'intimate_apparel'):
+        value = 'hygienic_sticker_intact'
+    return value
+
+
+class NaiveBayesIntentModel:
+    """Multinomial naive Bayes over question tokens, labels are predicates plus 'off_topic'."""
+
+    def __init__(self, alpha=0.5):
+        self.alpha = alpha
+        self.label_counts = Counter()
+        self.token_counts = defaultdict(Counter)
+        self.label_totals = Counter()
+        self.vocabulary = set()
+
+    def fit(self, examples):
+        for question, label in examples:
+            tokens = tokenize(question)
+            self.label_counts[label] += 1
+            self.token_counts[label].update(tokens)
+            self.label_totals[label] += len(tokens)
+            self.vocabulary.update(tokens)
+        return self
+
+    def predict_proba(self, question):
+        tokens = [t for t in tokenize(question) if t in self.vocabulary]
+        total_examples = sum(self.label_counts.values())
+        vocab_size = len(self.vocabulary)
+        log_scores = {}
+        for label, count in self.label_counts.items():
+            score = math.log(count / total_examples)
+            denominator = self.label_totals[label] + self.alpha * vocab_size
+            for token in tokens:
+                score += math.log((self.token_counts[label][token] + self.alpha) / denominator)
+            log_scores[label] = score
+        max_score = max(log_scores.values())
+        exp_scores = {label: math.exp(score - max_score) for label, score in log_scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: value / norm for label, value in exp_scores.items()}
+
+
+def load_training_examples(training_file, nlu_log_file=None):
+    """Reads seed (question, label) pairs plus any logged LLM NLU decisions."""
+    examples = []
+    with open(training_file, encoding='utf-8') as f:
+        for record in json.load(f):
+            examples.append((record['question'], record['predicate']))
+    if nlu_log_file and os.path.exists(nlu_log_file):
+        with open(nlu_log_file, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                nlu = record.get('nlu') or {}
+                if nlu.get('status') == 'off_topic':
+                    examples.append((record['question'], OFF_TOPIC_LABEL))
+                elif nlu.get('predicate'):
+                    examples.append((record['question'], nlu['predicate']))
+    return examples
+
+
+def load_policy_vocabulary(kb_sentences_file):
+    """Content words of the scraped policy text, used to spot questions with no policy overlap."""
+    if not kb_sentences_file or not os.path.exists(kb_sentences_file):
+        return set()
+    with open(kb_sentences_file, encoding='utf-8') as f:
+        sentences = json.load(f)
+    vocabulary = set()
+    for sentence in sentences:
+        vocabulary.update(w for w in normalize_question(sentence).split() if w not in STOPWORDS and len(w) > 2)
+    return vocabulary
+
+
+class IntentRouter:
+    """
+    Local classifier and slot extractor producing the same {"status", "predicate", "args"} JSON as the
+    NLU LLM call. route() returns (nlu_json, confidence); callers fall back to the LLM below threshold.
+    """
+
+    def __init__(self, model, policy_vocabulary, predicate_input_args, threshold=0.85):
+        self.model = model
+        self.policy_vocabulary = policy_vocabulary | {
+            t for label, counts in model.token_counts.items() if label != OFF_TOPIC_LABEL
+            for t in counts if '_' not in t}
+        self.predicate_input_args = predicate_input_args
+        self.threshold = threshold
+
+    @classmethod
+    def from_files(cls, training_file, predicate_input_args, kb_sentences_file=None, nlu_log_file=None, threshold=0.85):
+        examples = load_training_examples(training_file, nlu_log_file)
+        model = NaiveBayesIntentModel().fit(examples)
+        policy_vocabulary = load_policy_vocabulary(kb_sentences_file)
+        logger.info(f"Intent router trained on {len(examples)} examples ({len(model.vocabulary)} features)")
+        return cls(model, policy_vocabulary, predicate_input_args, threshold)
+
+    def classify(self, question):
+        """Returns (label, confidence) combining the model posterior with keyword agreement."""
+        text = normalize_question(question)
+        probabilities = self.model.predict_proba(question)
+        label = max(probabilities, key=probabilities.get)
+        confidence = probabilities[label]
+        keyword_hits = {p for p, pattern in PREDICATE_KEYWORD_RES.items() if pattern.search(text)}
+        overlap = [w for w in text.split() if w in self.policy_vocabulary and w not in STOPWORDS]
+
+        if not keyword_hits and not overlap:
+            # Nothing in the question appears in the policy text or the on-topic training data.
+            return OFF_TOPIC_LABEL, max(probabilities.get(OFF_TOPIC_LABEL, 0.0), OFF_TOPIC_NO_OVERLAP_CONFIDENCE)
+        if label == OFF_TOPIC_LABEL:
+            if keyword_hits or overlap:
+                confidence *= 0.5
+        elif label in keyword_hits:
+            if len(keyword_hits) == 1:
+                confidence = 1 - 0.25 * (1 - confidence)
+        elif keyword_hits:
+            confidence *= 0.5
+        else:
+            confidence *= 0.8
+        return label, confidence
+
+    def rank_predicates(self, question):
+        """
+        Every predicate as (name, probability, keyword_hit): keyword hits first, then by model posterior.
+        Probabilities are renormalized over the predicates, leaving out the off-topic label.
+        """
+        text = normalize_question(question)
+        probabilities = self.model.predict_proba(question)
+        keyword_hits = {p for p, pattern in PREDICATE_KEYWORD_RES.items() if pattern.search(text)}
+        norm = sum(probabilities.get(p, 0.0) for p in self.predicate_input_args) or 1.0
+        ranked = sorted(self.predicate_input_args, key=lambda p: (p not in keyword_hits, -probabilities.get(p, 0.0)))
+        return [(p, probabilities.get(p, 0.0) / norm, p in keyword_hits) for p in ranked]
+
+    def extract_args(self, predicate_name, question):
+        """Fills the predicate's input arguments from the question. Returns None if one can't be resolved."""
+        text = normalize_question(question)
+        args = dict(PREDICATE_DEFAULTS.get(predicate_name, {}))
+        for arg_name in self.predicate_input_args.get(predicate_name, []):
+            value = extract_slot(arg_name, text, args)
+            if value is None and arg_name == 'Region' and LOCATION_HINT_RE.search(question):
+                return None
+            if value is not None:
+                args[arg_name] = value
+            if args.get(arg_name) is None:
+                return None
+        return args
+
+    def route(self, question):
+        """Returns (nlu_json, confidence); nlu_json is None when the router can't produce a complete answer."""
+        label, confidence = self.classify(question)
+        if label == OFF_TOPIC_LABEL:
+            return {
+                'status': 'off_topic',
+                'predicate': None,
+                'args': {},
+                'off_topic_reason': 'Classified as unrelated to the return policy by the local router.',
+                'source': 'local_router',
+                'confidence': round(confidence, 4),
+            }, confidence
+        args = self.extract_args(label, question)
+        if args is None:
+            return None, confidence
+        return {
+            'status': 'success',
+            'predicate': label,
+            'args': args,
+            'source': 'local_router',
+            'confidence': round(confidence, 4),
+        }, confidence
+
+    def resolve(self, question):
+        """Returns the router's NLU JSON if it clears the confidence threshold, else None."""
+        nlu_json, confidence = self.route(question)
+        if nlu_json is None or confidence < self.threshold:
+            logger.debug(f"Intent router below threshold ({confidence:.3f} < {self.threshold}) for: {question}")
+            return None
+        return nlu_json
@@ -0,0 +1,137 @@
+# Filename: kb_reload.py
+# Hot reload of the policy KB. A candidate engine consults the new file, must pass the
+# tools/prolog_test.py cases, and only then replaces the live KnowledgeBase in one assignment.
+import importlib.util
+import logging
+import threading
+import time
+
+from answer_table import kb_fingerprint
+from prolog_pool import LocalPrologEngine
+from query_plans import load_explanations
+
+logger = logging.getLogger("ssense_chatbot")
+
+
+class KnowledgeBase:
+    """One loaded version of the KB: engine, preloaded explanations and content hash, swapped as a unit."""
+
+    def __init__(self, engine, explanations, version):
+        self.engine = engine
+        self.explanations = explanations
+        self.version = version
+        self.loaded_at = time.time()
+
+
+def load_gate_cases(test_file):
+    """Imports tools/prolog_test.py and returns its check function, or None when the file is missing."""
+    spec = importlib.util.spec_from_file_location("prolog_test", test_file)
+    if spec is None:
+        return None
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except FileNotFoundError:
+        return None
+    return module.check_test_cases
+
+
+class KBReloader:
+    """
+    Owns the live KnowledgeBase. reload() never pauses traffic: requests hold a reference to the
+    KnowledgeBase they started with, and a replaced pool is only closed after drain_seconds.
+    engine_factory builds an engine from the configured settings and accepts a pool_size override.
+    """
+
+    def __init__(self, kb_filename, engine_factory, gate_test_file, drain_seconds=30, on_swap=None):
+        self.kb_filename = kb_filename
+        self.engine_factory = engine_factory
+        self.gate_test_file = gate_test_file
+        self.drain_seconds = drain_seconds
+        self.on_swap = on_swap
+        self._reload_lock = threading.Lock()
+        self._watch_stop = threading.Event()
+        self.last_reload = None
+        self.rejected_version = None
+        engine = engine_factory()
+        # pyswip embeds one SWI engine per process, and reconsulting it would change the clauses
+        # under requests still on the old version. An in-process KB is therefore reloaded into a
+        # one-worker pool with the configured timeouts, which then serves that version.
+        self.embedded = isinstance(engine, LocalPrologEngine)
+        self.current = KnowledgeBase(engine, load_explanations(engine), kb_fingerprint(kb_filename))
+
+    def run_gate(self, engine):
+        check_test_cases = load_gate_cases(self.gate_test_file)
+        if check_test_cases is None:
+            logger.warning(f"KB gate test file '{self.gate_test_file}' not found; reloading without a gate")
+            return []
+        return check_test_cases(engine)
+
+    def reload(self, reason='manual'):
+        """Loads, gates and swaps in the KB file's current content. Returns a status dict."""
+        with self._reload_lock:
+            previous = self.current
+            version = kb_fingerprint(self.kb_filename)
+            if version == previous.version:
+                return self._record({'status': 'unchanged', 'version': version, 'reason': reason})
+
+            started = time.perf_counter()
+            logger.info(f"Reloading KB '{self.kb_filename}' ({reason}): {previous.version[:12]} -> {version[:12]}")
+            candidate = None
+            try:
+                candidate = self._load_candidate()
+                failures = self.run_gate(candidate)
+            except Exception as e:
+                logger.error(f"Error loading candidate KB version {version[:12]}: {e}", exc_info=True)
+                if candidate is not None:
+                    candidate.close()
+                self.rejected_version = version
+                return self._record({'status': 'rejected', 'version': version, 'reason': reason, 'error': str(e)})
+            if failures:
+                logger.error(f"KB version {version[:12]} failed {len(failures)} gate cases; keeping {previous.version[:12]}")
+                candidate.close()
+                self.rejected_version = version
+                return self._record({
+                    'status': 'rejected', 'version': version, 'reason': reason,
+                    'failures': [{'query': q, 'expected': e, 'problem': p} for q, e, p in failures]
+                })
+
+            self.current = KnowledgeBase(candidate, load_explanations(candidate), version)
+            threading.Timer(self.drain_seconds, previous.engine.close).start()
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            logger.info(f"KB version {version[:12]} is live (loaded and gated in {elapsed_ms:.0f} ms)")
+            if self.on_swap:
+                try:
+                    self.on_swap(self.current)
+                except Exception as e:
+                    logger.error(f"Error in KB swap callback: {e}", exc_info=True)
+            return self._record({'status': 'reloaded', 'version': version, 'previous_version': previous.version,
+                                 'reason': reason, 'elapsed_ms': round(elapsed_ms, 1)})
+
+    def _load_candidate(self):
+        if self.embedded:
+            return self.engine_factory(pool_size=1)
+        return self.engine_factory()
+
+    def _record(self, result):
+        result['at'] = time.time()
+        self.last_reload = result
+        return result
+
+    def watch(self, interval):
+        """Polls the KB file every interval seconds and reloads when its content changes."""
+        def loop():
+            while not self._watch_stop.wait(interval):
+                try:
+                    version = kb_fingerprint(self.kb_filename)
+                    if version not in (self.current.version, self.rejected_version):
+                        self.reload(reason='file_change')
+                except Exception as e:
+                    logger.error(f"Error watching KB file '{self.kb_filename}': {e}", exc_info=True)
+
+        threading.Thread(target=loop, name="kb-watch", daemon=True).start()
+        logger.info(f"Watching '{self.kb_filename}' for changes every {interval}s")
+
+    def stop(self):
+        self._watch_stop.set()
@@ -0,0 +1,49 @@
+# Filename: kb_schema.py
+# Predicates exposed to the NLU layer and the positions of their input and output arguments.
+ALLOWED_PREDICATES = [
+    'is_eligible', 'get_return_window', 'get_shipping_cost',
+    'get_return_label_info', 'get_return_fee', 'is_item_excluded',
+    'get_initiation_method', 'can_exchange', 'get_contact_email',
+    'get_contact_chat_availability', 'get_phone_number',
+    'get_damaged_item_action', 'get_warranty_provider', 'is_warranty_by_ssense'
+]
+PREDICATE_OUTPUT_VARS = {
+    'get_return_window': {1: 'Days'},
+    'get_shipping_cost': {2: 'CostType'},
+    'get_return_label_info': {2: 'LabelInfo'},
+    'get_return_fee': {2: 'Amount', 3: 'Currency'},
+    'is_item_excluded': {2: 'ReasonStructure'},
+    'get_initiation_method': {2: 'Method'},
+    'can_exchange': {1: 'Result'},
+    'get_contact_email': {1: 'Email'},
+    'get_contact_chat_availability': {1: 'Availability'},
+    'get_phone_number': {2: 'Number', 3: 'Hours'},
+    'get_damaged_item_action': {1: 'Action'},
+    'get_warranty_provider': {1: 'Provider'},
+    'is_warranty_by_ssense': {1: 'Result'},
+    'is_eligible': {}
+}
+PREDICATE_INPUT_ARGS = {
+    'is_eligible': ['ItemType', 'Condition', 'Packaging', 'Tags', 'DaysSinceDelivery'],
+    'get_return_window': [],
+    'get_shipping_cost': ['Region'],
+    'get_return_label_info': ['Region'],
+    'get_return_fee': ['Region'],
+    'is_item_excluded': ['ItemType'],
+    'get_initiation_method': ['UserType'],
+    'can_exchange': [],
+    'get_contact_email': [],
+    'get_contact_chat_availability': [],
+    'get_phone_number': ['PhoneType'],
+    'get_damaged_item_action': [],
+    'get_warranty_provider': [],
+    'is_warranty_by_ssense': [],
+}
+# Predicates called directly by API endpoints and never offered to the NLU layer.
+API_PREDICATES = ['check_eligibility_batch']
+API_PREDICATE_INPUT_ARGS = {
+    'check_eligibility_batch': ['Items'],
+}
+API_PREDICATE_OUTPUT_VARS = {
+    'check_eligibility_batch': {2: 'Verdicts'},
+}
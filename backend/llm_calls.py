@@ -0,0 +1,260 @@
+# Filename: llm_calls.py
+# Model tiers, deadlines and hedged requests for the OpenAI chat completion calls. Each call site
+# (nlu, nlg, slot) is an LLMStage with its own model and deadline. With hedging on, a second
+# identical request is sent when the first has not answered within the stage's recent p95 latency
+# (or at once if it failed), and the first good answer wins.
+import asyncio
+import collections
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+
+from openai import APITimeoutError
+
+from kb_schema import ALLOWED_PREDICATES, PREDICATE_INPUT_ARGS
+from metrics import LLM_CALL_OUTCOMES, LLM_REQUESTS, percentile
+
+logger = logging.getLogger("ssense_chatbot")
+
+LATENCY_WINDOW = 200
+NLU_STATUSES = ('success', 'missing_info', 'off_topic')
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """Raised when no attempt of an LLM call answered before the stage deadline."""
+
+    def __init__(self, call, deadline):
+        super().__init__(f"{call} LLM call exceeded its {deadline:.1f}s deadline")
+        self.call = call
+
+
+class HedgePolicy:
+    """Recent latencies per model; the hedge fires after their percentile, or initial_delay until min_samples are seen."""
+
+    def __init__(self, percentile=95, min_samples=20, initial_delay=3.0, min_delay=0.25):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self._latencies = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_WINDOW))
+        self._lock = threading.Lock()
+
+    def record(self, model, seconds):
+        with self._lock:
+            self._latencies[model].append(seconds)
+
+    def delay(self, model):
+        with self._lock:
+            samples = list(self._latencies[model])
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, percentile(samples, self.percentile))
+
+
+class LLMStage:
+    """One LLM call site: its default model, per-call deadline in seconds and optional HedgePolicy."""
+
+    def __init__(self, call, model, deadline, hedge=None):
+        self.call = call
+        self.model = model
+        self.deadline = deadline
+        self.hedge = hedge
+
+    def record(self, model, attempt, seconds):
+        # A hedge win only bounds the primary's latency from below; recording it keeps the percentile honest.
+        LLM_CALL_OUTCOMES.inc(1, self.call, f"{attempt}_won")
+        if self.hedge:
+            self.hedge.record(model, seconds)
+
+
+class StartedStream:
+    """A streamed completion whose first chunk has already arrived; iterating yields every chunk."""
+
+    def __init__(self, first_chunk, stream):
+        self.first_chunk = first_chunk
+        self.stream = stream
+
+    def __iter__(self):
+        try:
+            if self.first_chunk is not None:
+                yield self.first_chunk
+            yield from self.stream
+        finally:
+            self.close()
+
+    def close(self):
+        self.stream.close()
+
+
+def create_completion(client, model, timeout, request):
+    return client.chat.completions.create(model=model, timeout=timeout, **request)
+
+
+def open_completion_stream(client, model, timeout, request):
+    """Starts a streamed completion and waits for its first chunk, so a hedge races on time to first token."""
+    stream = client.chat.completions.create(model=model, timeout=timeout, stream=True, **request)
+    return StartedStream(next(iter(stream), None), stream)
+
+
+def close_result(future):
+    """Done callback for an abandoned attempt: closes a stream nobody will read."""
+    if not future.cancelled() and future.exception() is None and hasattr(future.result(), 'close'):
+        future.result().close()
+
+
+def complete(client, stage, model=None, **request):
+    """
+    Sync chat completion with the stage's deadline and hedging. The OpenAI client does not retry
+    (the hedge takes that role); a losing attempt cannot be interrupted and ends at its own timeout.
+    """
+    return run_hedged(client, stage, model, create_completion, request)
+
+
+def stream_completion(client, stage, model=None, **request):
+    """
+    Streamed counterpart of complete(): returns a StartedStream from the attempt whose first chunk
+    arrived first. The deadline and the hedge delay apply to that first chunk.
+    """
+    return run_hedged(client, stage, model, open_completion_stream, request)
+
+
+def run_hedged(client, stage, model, create, request):
+    model = model or stage.model
+    started = time.perf_counter()
+    deadline_at = started + stage.deadline
+    attempts = {}
+
+    def launch(attempt):
+        LLM_REQUESTS.inc(1, stage.call, model, attempt)
+        future = concurrent.futures.Future()
+        remaining = max(0.001, deadline_at - time.perf_counter())
+
+        def run():
+            try:
+                future.set_result(create(client, model, remaining, request))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name=f"llm-{stage.call}-{attempt}", daemon=True).start()
+        attempts[future] = attempt
+
+    if stage.hedge is None:
+        LLM_REQUESTS.inc(1, stage.call, model, 'primary')
+        try:
+            response = create(client.with_options(max_retries=0), model, stage.deadline, request)
+        except APITimeoutError:
+            LLM_CALL_OUTCOMES.inc(1, stage.call, 'deadline_exceeded')
+            raise LLMDeadlineExceeded(stage.call, stage.deadline)
+        except Exception:
+            LLM_CALL_OUTCOMES.inc(1, stage.call, 'error')
+            raise
+        stage.record(model, 'primary', time.perf_counter() - started)
+        return response
+
+    client = client.with_options(max_retries=0)
+    hedge_at = started + stage.hedge.delay(model)
+    hedged = False
+    error = None
+    launch('primary')
+    while True:
+        now = time.perf_counter()
+        if now >= deadline_at:
+            for other in attempts:
+                other.add_done_callback(close_result)
+            LLM_CALL_OUTCOMES.inc(1, stage.call, 'deadline_exceeded')
+            raise LLMDeadlineExceeded(stage.call, stage.deadline)
+        wake_at = deadline_at if hedged else min(deadline_at, hedge_at)
+        done, _ = concurrent.futures.wait(attempts, timeout=max(0, wake_at - now),
+                                          return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            attempt = attempts.pop(future)
+            if future.exception() is None:
+                stage.record(model, attempt, time.perf_counter() - started)
+                for other in attempts:
+                    logger.info(f"{stage.call} LLM call answered by the {attempt} request; abandoning the other")
+                    other.add_done_callback(close_result)
+                return future.result()
+            error = future.exception()
+            logger.warning(f"{stage.call} LLM {attempt} request failed: {error}")
+        if not hedged and (time.perf_counter() >= hedge_at or not attempts):
+            hedged = True
+            logger.info(f"Hedging {stage.call} LLM call on {model} after {time.perf_counter() - started:.2f}s")
+            launch('hedge')
+        elif not attempts:
+            LLM_CALL_OUTCOMES.inc(1, stage.call, 'error')
+            raise error
+
+
+async def complete_async(client, stage, model=None, **request):
+    """Async counterpart of complete(); the losing attempt is cancelled, which closes its connection."""
+    model = model or stage.model
+    client = client.with_options(max_retries=0)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline_at = started + stage.deadline
+    attempts = {}
+
+    def launch(attempt):
+        LLM_REQUESTS.inc(1, stage.call, model, attempt)
+        task = asyncio.ensure_future(client.chat.completions.create(model=model, **request))
+        attempts[task] = attempt
+
+    hedge_at = started + stage.hedge.delay(model) if stage.hedge else None
+    hedged = stage.hedge is None
+    error = None
+    launch('primary')
+    try:
+        while True:
+            now = loop.time()
+            if now >= deadline_at:
+                LLM_CALL_OUTCOMES.inc(1, stage.call, 'deadline_exceeded')
+                raise LLMDeadlineExceeded(stage.call, stage.deadline)
+            wake_at = deadline_at if hedged else min(deadline_at, hedge_at)
+            done, _ = await asyncio.wait(attempts, timeout=max(0, wake_at - now),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                attempt = attempts.pop(task)
+                if task.exception() is None:
+                    stage.record(model, attempt, loop.time() - started)
+                    return task.result()
+                error = task.exception()
+                logger.warning(f"{stage.call} LLM {attempt} request failed: {error}")
+            if not hedged and (loop.time() >= hedge_at or not attempts):
+                hedged = True
+                logger.info(f"Hedging {stage.call} LLM call on {model} after {loop.time() - started:.2f}s")
+                launch('hedge')
+            elif not attempts:
+                LLM_CALL_OUTCOMES.inc(1, stage.call, 'error')
+                raise error
+    finally:
+        for task in attempts:
+            task.cancel()
+
+
+def nlu_output_problem(raw_nlu_output):
+    """
+    Checks raw NLU output against the predicate schema. Returns None when it is usable, else a short
+    reason ('invalid_json', 'unknown_status', 'unknown_predicate', 'unknown_args' or 'missing_args').
+    """
+    try:
+        nlu_json = json.loads(raw_nlu_output)
+    except (TypeError, ValueError):
+        return 'invalid_json'
+    if not isinstance(nlu_json, dict):
+        return 'invalid_json'
+    status = nlu_json.get('status')
+    if status not in NLU_STATUSES:
+        return 'unknown_status'
+    if status == 'off_topic':
+        return None
+    predicate_name = nlu_json.get('predicate')
+    if predicate_name not in ALLOWED_PREDICATES:
+        return None if status == 'missing_info' and not predicate_name else 'unknown_predicate'
+    args_dict = nlu_json.get('args') or {}
+    if not isinstance(args_dict, dict) or set(args_dict) - set(PREDICATE_INPUT_ARGS[predicate_name]):
+        return 'unknown_args'
+    if status == 'success' and any(args_dict.get(name) in (None, '') for name in PREDICATE_INPUT_ARGS[predicate_name]):
+        return 'missing_args'
+    return None
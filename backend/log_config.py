@@ -0,0 +1,121 @@
+# Filename: log_config.py
+# Logging setup for the backend. LOG_MODE='sync' is the original synchronous file + stderr
+# output; LOG_MODE='async' hands records to a queue and writes one-line JSON from a
+# background thread, so chat requests never wait on disk I/O or record serialization.
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class LazyJSON:
+    """Defers json.dumps until a log record is actually emitted: logger.debug("NLU: %s", LazyJSON(obj))."""
+
+    def __init__(self, obj, **dumps_kwargs):
+        self.obj = obj
+        self.dumps_kwargs = dumps_kwargs
+
+    def __str__(self):
+        return json.dumps(self.obj, default=str, **self.dumps_kwargs)
+
+
+class JsonLineFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a configured fraction of records per level; levels without a rate are always kept."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        return rate is None or random.random() < rate
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that only merges the message arguments on the calling thread; the final
+    formatting (JSON encoding, tracebacks) happens on the listener thread.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_sample_rates(spec):
+    """'DEBUG=0.01,INFO=0.2' -> {10: 0.01, 20: 0.2}."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        level_name, _, rate = item.partition('=')
+        level = logging.getLevelName(level_name.strip().upper())
+        if not isinstance(level, int):
+            raise ValueError(f"Unknown log level in LOG_SAMPLE_RATES: {level_name}")
+        rates[level] = float(rate)
+    return rates
+
+
+def configure_logging(log_file, level='DEBUG', mode='sync', sample_rates=''):
+    """Installs the root handlers. Returns the QueueListener in async mode, else None."""
+    rates = parse_sample_rates(sample_rates)
+    handlers = [logging.FileHandler(log_file), logging.StreamHandler()]
+
+    if mode != 'async':
+        logging.basicConfig(level=level, format=LOG_FORMAT, handlers=handlers)
+        if rates:
+            for handler in handlers:
+                handler.addFilter(SamplingFilter(rates))
+        return None
+
+    formatter = JsonLineFormatter()
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    if rates:
+        queue_handler.addFilter(SamplingFilter(rates))
+    logging.basicConfig(level=level, handlers=[queue_handler])
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def restart_listener(listener):
+    """
+    A started QueueListener's thread does not survive fork(); call this in a forked worker to
+    drain the inherited queue with a fresh listener thread. Returns the new listener.
+    """
+    if listener is None:
+        return None
+    restarted = logging.handlers.QueueListener(listener.queue, *listener.handlers,
+                                               respect_handler_level=listener.respect_handler_level)
+    restarted.start()
+    atexit.register(restarted.stop)
+    return restarted
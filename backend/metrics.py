@@ -0,0 +1,204 @@
+# Filename: metrics.py
+# Per-stage latency histograms and token counters for the chat pipeline, rendered in the
+# Prometheus text exposition format and summarized per request as a Server-Timing header.
+import contextlib
+import logging
+import threading
+import time
+
+NLU_STATUSES = ('success', 'missing_info', 'off_topic')
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PROMPT_TOKEN_BUCKETS = (250, 500, 750, 1000, 1250, 1500, 2000, 3000, 5000)
+
+logger = logging.getLogger("ssense_chatbot")
+
+
+def percentile(values, pct):
+    """The pct-th percentile of values (nearest rank, any order); 0.0 when there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Histogram:
+    def __init__(self, name, documentation, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series['buckets']):
+                    lines.append(f"{self.name}_bucket{format_labels(self.label_names, label_values, [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, label_values, [('le', '+Inf')])} {series['count']}")
+                lines.append(f"{self.name}_sum{format_labels(self.label_names, label_values)} {series['sum']}")
+                lines.append(f"{self.name}_count{format_labels(self.label_names, label_values)} {series['count']}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def histogram(self, name, documentation, label_names, buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, label_names, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, label_names):
+        metric = Counter(name, documentation, label_names)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram(
+    'chat_stage_duration_seconds', 'Time spent in each chat pipeline stage.', ('endpoint', 'stage', 'predicate', 'nlu_status'))
+REQUEST_SECONDS = REGISTRY.histogram(
+    'chat_request_duration_seconds', 'End-to-end chat request latency.', ('endpoint', 'predicate', 'nlu_status', 'status'))
+OPENAI_TOKENS = REGISTRY.counter(
+    'openai_tokens_total', 'Tokens reported in the OpenAI usage field.', ('call', 'kind', 'predicate'))
+SINGLE_FLIGHT_CALLS = REGISTRY.counter(
+    'singleflight_calls_total', 'Coalesced upstream calls by role; each follower is an upstream call saved.', ('call', 'role'))
+LLM_REQUESTS = REGISTRY.counter(
+    'llm_requests_total', 'OpenAI requests sent, by attempt; hedge/primary is the hedge rate.', ('call', 'model', 'attempt'))
+LLM_CALL_OUTCOMES = REGISTRY.counter(
+    'llm_call_outcomes_total', 'LLM calls by outcome: primary_won, hedge_won, deadline_exceeded or error.', ('call', 'outcome'))
+NLU_ESCALATIONS = REGISTRY.counter(
+    'nlu_escalations_total', 'NLU calls retried on the escalation model after schema validation failed.', ('model', 'reason'))
+NLU_PROMPT_TOKENS = REGISTRY.histogram(
+    'nlu_prompt_estimated_tokens', 'Estimated size of the NLU system prompt sent, by prompt mode.', ('mode',),
+    PROMPT_TOKEN_BUCKETS)
+STARTUP_SECONDS = REGISTRY.histogram(
+    'app_startup_step_seconds', 'Time spent in each startup step; phase is shared (before fork) or worker.', ('phase', 'step'))
+
+
+class RequestTimer:
+    """Collects stage timings and token usage for one request, then records them once with its final labels."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages = []
+        self.usage = []
+        self.predicate = 'none'
+        self.nlu_status = 'none'
+        self.finished = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - started))
+
+    def add_usage(self, call, usage):
+        if usage is None:
+            return
+        self.usage.append((call, 'prompt', getattr(usage, 'prompt_tokens', 0) or 0))
+        self.usage.append((call, 'completion', getattr(usage, 'completion_tokens', 0) or 0))
+        details = getattr(usage, 'prompt_tokens_details', None)
+        self.usage.append((call, 'cached_prompt', getattr(details, 'cached_tokens', 0) or 0))
+
+    def label(self, nlu_json, allowed_predicates):
+        """Takes the predicate and NLU status labels from the NLU result, bounded to known values."""
+        nlu_status = nlu_json.get('status')
+        self.nlu_status = nlu_status if nlu_status in NLU_STATUSES else 'unknown'
+        predicate_name = nlu_json.get('predicate')
+        if predicate_name:
+            self.predicate = predicate_name if predicate_name in allowed_predicates else 'invalid'
+
+    def finish(self, status):
+        if self.finished:
+            return
+        self.finished = True
+        for name, seconds in self.stages:
+            STAGE_SECONDS.observe(seconds, self.endpoint, name, self.predicate, self.nlu_status)
+        for call, kind, tokens in self.usage:
+            OPENAI_TOKENS.inc(tokens, call, kind, self.predicate)
+        REQUEST_SECONDS.observe(time.perf_counter() - self.started, self.endpoint, self.predicate, self.nlu_status, str(status))
+
+    def server_timing(self):
+        """Server-Timing header value: one entry per stage plus the total, in milliseconds."""
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ', '.join(entries)
+
+
+class StartupTimer:
+    """Times the application startup steps of this process for the logs, /api/health and STARTUP_SECONDS."""
+
+    def __init__(self):
+        self.steps = []
+
+    @contextlib.contextmanager
+    def step(self, phase, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.steps.append((phase, name, seconds))
+            STARTUP_SECONDS.observe(seconds, phase, name)
+            logger.info(f"Startup step {phase}/{name} took {seconds * 1000:.1f} ms")
+
+    def report(self):
+        phases = {}
+        for phase, _, seconds in self.steps:
+            phases[phase] = phases.get(phase, 0.0) + seconds
+        return {
+            'steps': [{'phase': phase, 'step': name, 'ms': round(seconds * 1000, 1)} for phase, name, seconds in self.steps],
+            'phase_ms': {phase: round(seconds * 1000, 1) for phase, seconds in phases.items()},
+        }
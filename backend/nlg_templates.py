@@ -0,0 +1,175 @@
+# Filename: nlg_templates.py
+import logging
+import re
+
+logger = logging.getLogger("ssense_chatbot")
+
+# Human phrasing for KB atoms, per argument/output variable name.
+ATOM_PHRASES = {
+    'Region': {
+        'canada': 'Canada', 'usa': 'the USA', 'japan': 'Japan', 'australia': 'Australia',
+        'china': 'China', 'hong_kong': 'Hong Kong', 'south_korea': 'South Korea', 'uk': 'the UK',
+        'other_international': 'other international destinations',
+    },
+    'UserType': {
+        'account_holder': ' as an account holder', 'guest': ' as a guest', 'general': '',
+    },
+    'Method': {
+        'via_order_history': 'request it from the order history in your SSENSE account',
+        'create_account_same_email': 'create an SSENSE account with the same email used for the order',
+        'use_self_service_tool': 'use the online self-service return tool',
+        'contact_customer_care': 'contact Customer Care',
+    },
+    'PhoneType': {
+        'north_america_toll_free': 'North America toll-free', 'local': 'local', 'quebec': 'Quebec',
+    },
+    'ReasonStructure': {
+        'marked_final_sale': 'because they are marked Final Sale',
+        'hygiene': 'for hygiene reasons',
+        'health_and_safety': 'for health and safety reasons',
+    },
+}
+VALUE_FORMATTERS = {
+    'Currency': str.upper,
+}
+REASON_RE = re.compile(r"^reason\((\w+)\)$")
+INCLUDES_RE = re.compile(r"^includes\(\[(.*)\]\)$")
+# The KB names some item types *_item (final_sale_item), and the templates already say "items".
+ITEM_SUFFIX_RE = re.compile(r"_item$")
+
+# Per-predicate templates. A dict under 'success' is keyed on the value of the first output variable.
+TEMPLATES = {
+    'is_eligible': {
+        'success': "Yes, that item is eligible for a return, as long as you request it within the return window.",
+        'failure': "Unfortunately, that item doesn't meet SSENSE's return conditions, so it isn't eligible for a return.",
+    },
+    'get_return_window': {
+        'success': "You have {Days} calendar days from the delivery date to request a return.",
+    },
+    'get_shipping_cost': {
+        'success': {
+            'free': "Return shipping is free for orders from {Region}.",
+            'fee_deducted': "For orders from {Region}, a return transportation fee is deducted from your refund.",
+            'customer_pays': "For orders from {Region}, you arrange and pay for return shipping yourself.",
+        },
+        'failure': "I couldn't find return shipping details for {Region} in the policy.",
+    },
+    'get_return_label_info': {
+        'success': {
+            'ppl_via_email': "For returns from {Region}, SSENSE emails you a prepaid return label once your return is authorized.",
+            'ra_number_via_email': "For returns from {Region}, SSENSE emails you a Return Authorization (RA) number, and you ship the package yourself.",
+        },
+        'failure': "I couldn't find return label details for {Region} in the policy.",
+    },
+    'get_return_fee': {
+        'success': "The return transportation fee for {Region} is {Amount} {Currency}, deducted from your refund.",
+        'failure': "There is no specific return fee listed for {Region}.",
+    },
+    'is_item_excluded': {
+        'success': "No, {ItemType} items can't be returned {ReasonStructure}.",
+        'failure': "That item type ({ItemType}) isn't on the list of excluded items, so it can be returned as long as it meets the usual return conditions.",
+    },
+    'get_initiation_method': {
+        'success': "To start a return{UserType}, you can {Method}.",
+    },
+    'can_exchange': {
+        'success': {
+            'false': "SSENSE doesn't offer direct exchanges. To get a different item, return the original for a refund and place a new order.",
+            'true': "Yes, SSENSE offers direct exchanges.",
+        },
+    },
+    'get_contact_email': {
+        'success': "You can reach SSENSE Customer Care by email at {Email}.",
+    },
+    'get_contact_chat_availability': {
+        'success': "Customer Care chat support is available {Availability}.",
+    },
+    'get_phone_number': {
+        'success': "The {PhoneType} Customer Care number is {Number} (hours: {Hours}).",
+        'failure': "I couldn't find a phone number of that type. Customer Care has North America toll-free, local and Quebec numbers.",
+    },
+    'get_damaged_item_action': {
+        'success': {
+            'contact_customer_care': "If your item arrived damaged or defective, please contact Customer Care first so they can help.",
+        },
+    },
+    'get_warranty_provider': {
+        'success': {
+            'manufacturer': "Product warranties are provided by the manufacturer, not SSENSE. Check the product manual or contact the manufacturer directly.",
+        },
+    },
+    'is_warranty_by_ssense': {
+        'success': {
+            'false': "No, SSENSE doesn't provide product warranties. Warranties come from the manufacturer.",
+            'true': "Yes, SSENSE provides the warranty for this product.",
+        },
+    },
+}
+
+
+def humanize(value):
+    return str(value).replace('_', ' ')
+
+
+def phrase(var_name, value):
+    """Maps one KB value to its user-facing phrase."""
+    text = str(value).strip("'")
+    if var_name == 'ItemType':
+        text = ITEM_SUFFIX_RE.sub('', text)
+    if var_name == 'ReasonStructure':
+        reason_match = REASON_RE.match(text)
+        if reason_match:
+            reason = reason_match.group(1)
+            return ATOM_PHRASES['ReasonStructure'].get(reason, f"because of {humanize(reason)}")
+        includes_match = INCLUDES_RE.match(text)
+        if includes_match:
+            members = [humanize(m.strip()) for m in includes_match.group(1).split(',')]
+            return f"because dangerous goods (including {join_phrases(members, 'and')}) are excluded"
+    if var_name in VALUE_FORMATTERS:
+        return VALUE_FORMATTERS[var_name](text)
+    return ATOM_PHRASES.get(var_name, {}).get(text, humanize(text))
+
+
+def join_phrases(phrases, conjunction='or'):
+    if len(phrases) <= 1:
+        return ''.join(phrases)
+    if len(phrases) == 2:
+        return f"{phrases[0]} {conjunction} {phrases[1]}"
+    return f"{', '.join(phrases[:-1])}, {conjunction} {phrases[-1]}"
+
+
+def render_answer(predicate_name, args_dict, kb_result_data, output_var_names):
+    """
+    Renders the answer for a KB result from the predicate's template.
+    Returns None when no template covers the result shape, so the caller can fall back to the LLM.
+    """
+    templates = TEMPLATES.get(predicate_name)
+    if templates is None:
+        return None
+    solutions = kb_result_data.get("solutions")
+    template = templates.get('success' if kb_result_data.get("success") else 'failure')
+    if template is None or solutions is None:
+        return None
+
+    fields = {name: phrase(name, value) for name, value in args_dict.items()}
+    for var_name in output_var_names:
+        values = []
+        for solution in solutions:
+            if var_name in solution and str(solution[var_name]) not in values:
+                values.append(str(solution[var_name]))
+        if values:
+            fields[f"_{var_name}_raw"] = values[0]
+            fields[var_name] = join_phrases([phrase(var_name, v) for v in values])
+
+    if isinstance(template, dict):
+        if not output_var_names:
+            return None
+        template = template.get(str(fields.get(f"_{output_var_names[0]}_raw", '')).strip("'").lower())
+        if template is None:
+            return None
+    try:
+        answer = template.format(**fields)
+    except (KeyError, IndexError) as e:
+        logger.debug(f"No template field {e} for {predicate_name}; falling back to LLM NLG.")
+        return None
+    return answer[0].upper() + answer[1:]
@@ -0,0 +1,181 @@
+# Filename: nlu_cache.py
+import copy
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("ssense_chatbot")
+
+NUMBER_WORDS = {
+    'zero': 0, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
+    'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10,
+    'eleven': 11, 'twelve': 12, 'thirteen': 13, 'fourteen': 14, 'fifteen': 15,
+    'sixteen': 16, 'seventeen': 17, 'eighteen': 18, 'nineteen': 19,
+}
+TENS_WORDS = {
+    'twenty': 20, 'thirty': 30, 'forty': 40, 'fifty': 50,
+    'sixty': 60, 'seventy': 70, 'eighty': 80, 'ninety': 90,
+}
+APOSTROPHE_RE = re.compile(r"['’`]")
+PUNCTUATION_RE = re.compile(r"[^\w\s]")
+WHITESPACE_RE = re.compile(r"\s+")
+TENS_RE = re.compile(r"\b(" + "|".join(TENS_WORDS) + r")(?:[\s-](" + "|".join(
+    w for w in NUMBER_WORDS if ' ' not in w and 0 < NUMBER_WORDS[w] < 10) + r"))?\b")
+UNITS_RE = re.compile(r"\b(" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r")\b")
+
+
+def normalize_question(text):
+    """Normalizes a user question into a cache key (case, punctuation, whitespace, number words)."""
+    normalized = APOSTROPHE_RE.sub("", text.lower())
+    normalized = PUNCTUATION_RE.sub(" ", normalized)
+    normalized = TENS_RE.sub(
+        lambda m: str(TENS_WORDS[m.group(1)] + (NUMBER_WORDS[m.group(2)] if m.group(2) else 0)),
+        normalized)
+    normalized = UNITS_RE.sub(lambda m: str(NUMBER_WORDS[m.group(1)]), normalized)
+    return WHITESPACE_RE.sub(" ", normalized).strip()
+
+
+class NLUCache:
+    """Bounded LRU+TTL cache of parsed NLU JSON, keyed on the normalized question."""
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, question):
+        key = normalize_question(question)
+        with self._lock:
+            value = self._get(key, time.time())
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        logger.debug(f"NLU cache {'hit' if value is not None else 'miss'} for key: {key!r}")
+        return value
+
+    def put(self, question, nlu_json):
+        key = normalize_question(question)
+        with self._lock:
+            self.evictions += self._put(key, nlu_json, time.time())
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.backend_name,
+                'size': self._size(),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class MemoryNLUCache(NLUCache):
+    """In-process backend; each worker keeps its own entries."""
+    backend_name = 'memory'
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600):
+        super().__init__(max_entries, ttl_seconds)
+        self._entries = OrderedDict()
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def _put(self, key, value, now):
+        self._entries[key] = (now + self.ttl_seconds, copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        evicted = 0
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def _clear(self):
+        self._entries.clear()
+
+    def _size(self):
+        return len(self._entries)
+
+
+class SQLiteNLUCache(NLUCache):
+    """On-disk backend shared by every worker process pointing at the same file."""
+    backend_name = 'sqlite'
+
+    def __init__(self, path, max_entries=1024, ttl_seconds=3600):
+        super().__init__(max_entries, ttl_seconds)
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS nlu_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS nlu_cache_last_used ON nlu_cache(last_used)")
+
+    def _get(self, key, now):
+        row = self._conn.execute(
+            "SELECT value, expires_at FROM nlu_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at < now:
+            self._conn.execute("DELETE FROM nlu_cache WHERE key = ?", (key,))
+            return None
+        self._conn.execute("UPDATE nlu_cache SET last_used = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def _put(self, key, value, now):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO nlu_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + self.ttl_seconds, now))
+        evicted = self._conn.execute("DELETE FROM nlu_cache WHERE expires_at < ?", (now,)).rowcount
+        overflow = self._size() - self.max_entries
+        if overflow > 0:
+            evicted += self._conn.execute(
+                "DELETE FROM nlu_cache WHERE key IN ("
+                " SELECT key FROM nlu_cache ORDER BY last_used ASC LIMIT ?)", (overflow,)).rowcount
+        return evicted
+
+    def _clear(self):
+        self._conn.execute("DELETE FROM nlu_cache")
+
+    def _size(self):
+        return self._conn.execute("SELECT COUNT(*) FROM nlu_cache").fetchone()[0]
+
+
+def create_nlu_cache(backend, max_entries, ttl_seconds, path=None):
+    """Builds the configured NLU cache backend, or None when caching is disabled."""
+    if backend in ('', 'none', 'off'):
+        return None
+    if backend == 'memory':
+        return MemoryNLUCache(max_entries, ttl_seconds)
+    if backend == 'sqlite':
+        if not path:
+            raise ValueError("NLU cache backend 'sqlite' requires a database path.")
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        return SQLiteNLUCache(path, max_entries, ttl_seconds)
+    raise ValueError(f"Unknown NLU cache backend: {backend}")
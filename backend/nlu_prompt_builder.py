@@ -0,0 +1,148 @@
+# Filename: nlu_prompt_builder.py
+# Builds the NLU system prompt from the predicate schema. The hand-written instructions
+# (nlu_prompt.txt) and a one-line catalog of every predicate form a prefix that is identical on
+# every call, so provider-side prompt caching can reuse it. Argument values and examples follow,
+# either for every predicate ('full') or only for the few the local intent router ranks as
+# relevant to the question ('narrow').
+import json
+import re
+
+PREDICATE_DESCRIPTIONS = {
+    'is_eligible': "Checks full return eligibility.",
+    'get_return_window': "Gets the return period duration.",
+    'get_shipping_cost': "Gets shipping cost type.",
+    'get_return_label_info': "Gets how return label is provided.",
+    'get_return_fee': "Gets specific return fee. Will fail in Prolog if no fee exists for region.",
+    'is_item_excluded': "Checks if item type is excluded.",
+    'get_initiation_method': "Gets how to start return.",
+    'can_exchange': "Checks if direct exchanges are offered.",
+    'get_contact_email': "Gets customer care email.",
+    'get_contact_chat_availability': "Gets chat support availability.",
+    'get_phone_number': "Gets specific phone details.",
+    'get_damaged_item_action': "Gets action for damaged items.",
+    'get_warranty_provider': "Gets warranty provider.",
+    'is_warranty_by_ssense': "Checks if SSENSE provides warranty.",
+}
+ARG_GUIDANCE = {
+    'ItemType': "Atom (e.g., shoes, sweater, self_care, swimwear, final_sale_item, face_mask, dangerous_good). Infer general types like clothing if specific type unknown but not excluded.",
+    'Condition': "Atom (original, used, damaged). Default: original.",
+    'Packaging': "Atom (original_intact, sealed, damaged, opened). Default: original_intact. Use sealed if user mentions sealed state, especially for self_care, sexual_wellness_non_toy, technology_if_sealed.",
+    'Tags': "Atom (intact, removed, hygienic_sticker_intact). Default: intact. Use hygienic_sticker_intact if user mentions it or for swimwear/intimate_apparel.",
+    'DaysSinceDelivery': "Integer. No default - must be extracted or asked for.",
+    'Region': "Atom (canada, usa, japan, australia, china, hong_kong, south_korea, uk, other_international). Default: canada based on context if location implied.",
+    'UserType': "Atom (account_holder, guest, general). Assume general if unspecified.",
+    'PhoneType': "Atom (north_america_toll_free, local, quebec).",
+}
+NLU_EXAMPLES = [
+    ("How long do I have to return items?",
+     {"status": "success", "predicate": "get_return_window", "args": {}}),
+    ("Is return shipping free for me here?",
+     {"status": "success", "predicate": "get_shipping_cost", "args": {"Region": "canada"}}),
+    ("Can I return a final sale sweater bought 2 weeks ago? It's unworn.",
+     {"status": "success", "predicate": "is_eligible",
+      "args": {"ItemType": "final_sale_item", "Condition": "original", "Packaging": "original_intact",
+               "Tags": "intact", "DaysSinceDelivery": 14}}),
+    ("Can I return this jacket?",
+     {"status": "missing_info", "predicate": "is_eligible",
+      "args": {"ItemType": "clothing", "Condition": "original", "Packaging": "original_intact", "Tags": "intact"},
+      "missing_args": ["DaysSinceDelivery"],
+      "clarification_question": "To check if the jacket is eligible for return, could you please tell me roughly how many days ago it was delivered?"}),
+    ("What's the return fee for the UK?",
+     {"status": "success", "predicate": "get_return_fee", "args": {"Region": "uk"}}),
+    ("Are face masks returnable?",
+     {"status": "success", "predicate": "is_item_excluded", "args": {"ItemType": "face_mask"}}),
+    ("How do I start a return if I checked out as a guest?",
+     {"status": "success", "predicate": "get_initiation_method", "args": {"UserType": "guest"}}),
+    ("What's the toll-free number?",
+     {"status": "success", "predicate": "get_phone_number", "args": {"PhoneType": "north_america_toll_free"}}),
+]
+PROMPT_CLOSING = "Return only valid JSON. No markdown, commentary, or backticks."
+# BPE tokenizers average a little under one token per word or punctuation mark on this kind of text.
+TOKEN_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """Approximate token count (words plus punctuation marks); the exact count comes back in the API usage field."""
+    return len(TOKEN_PIECE_RE.findall(text))
+
+
+def predicate_signature(predicate_name, input_args, output_vars):
+    arity = len(input_args) + len(output_vars)
+    inputs = iter(input_args)
+    return f"{predicate_name}({', '.join(output_vars.get(i) or next(inputs) for i in range(1, arity + 1))})"
+
+
+class NLUPromptBuilder:
+    """
+    System prompts for the NLU call. ranker(question) returns [(predicate, probability, keyword_hit)]
+    best first (IntentRouter.rank_predicates); without one, every prompt is the full prompt.
+    """
+
+    def __init__(self, instructions, allowed_predicates, predicate_input_args, predicate_output_vars,
+                 ranker=None, max_predicates=4, coverage=0.95):
+        self.allowed_predicates = list(allowed_predicates)
+        self.predicate_input_args = predicate_input_args
+        self.ranker = ranker
+        self.max_predicates = max_predicates
+        self.coverage = coverage
+        catalog = []
+        for predicate_name in self.allowed_predicates:
+            input_args = predicate_input_args[predicate_name]
+            output_vars = predicate_output_vars.get(predicate_name, {})
+            line = f"{predicate_signature(predicate_name, input_args, output_vars)}: {PREDICATE_DESCRIPTIONS[predicate_name]}"
+            if output_vars:
+                line += f" (output {', '.join(output_vars[i] for i in sorted(output_vars))})"
+            line += f" Requires {', '.join(input_args)}." if input_args else " Requires no input arguments."
+            catalog.append(line)
+        self.prefix = (f"{instructions.strip()}\n\nKB Schema (Available Prolog Predicates):\n"
+                       + "\n".join(catalog) + "\n")
+        self.prefix_tokens = estimate_tokens(self.prefix)
+        # At most one entry per subset of up to max_predicates predicates.
+        self._prompts = {}
+        self.full_prompt, self.full_prompt_tokens = self.prompt_for(self.allowed_predicates)
+
+    def prompt_for(self, predicates):
+        """
+        (prompt, estimated tokens) for the prefix plus argument values and examples of the given
+        predicates, always in schema order so the same set gives the same text.
+        """
+        key = tuple(p for p in self.allowed_predicates if p in predicates)
+        cached = self._prompts.get(key)
+        if cached is None:
+            arg_names = []
+            for predicate_name in key:
+                for arg_name in self.predicate_input_args[predicate_name]:
+                    if arg_name not in arg_names:
+                        arg_names.append(arg_name)
+            parts = []
+            if arg_names:
+                parts.append("Argument Values:\n" + "\n".join(f"{a}: {ARG_GUIDANCE[a]}" for a in arg_names))
+            examples = [(q, output) for q, output in NLU_EXAMPLES if output['predicate'] in key]
+            if examples:
+                parts.append("Examples:\n" + "\n".join(
+                    f"User: {q}\nOutput: {json.dumps(output, indent=2)}" for q, output in examples))
+            parts.append(PROMPT_CLOSING)
+            prompt = self.prefix + "\n" + "\n\n".join(parts)
+            cached = self._prompts[key] = (prompt, estimate_tokens(prompt))
+        return cached
+
+    def candidates(self, question):
+        """Keyword hits, then the likeliest predicates until their probability reaches coverage, at most max_predicates."""
+        selected = []
+        cumulative = 0.0
+        for predicate_name, probability, keyword_hit in self.ranker(question):
+            if len(selected) >= self.max_predicates or (cumulative >= self.coverage and not keyword_hit):
+                break
+            selected.append(predicate_name)
+            cumulative += probability
+        return selected
+
+    def build(self, question, mode='full'):
+        """Returns (system_prompt, info) with info = {'mode', 'predicates', 'estimated_tokens'}."""
+        if mode == 'narrow' and self.ranker is not None:
+            predicates = self.candidates(question)
+            if predicates:
+                prompt, tokens = self.prompt_for(predicates)
+                return prompt, {'mode': 'narrow', 'predicates': predicates, 'estimated_tokens': tokens}
+        return self.full_prompt, {'mode': 'full', 'predicates': self.allowed_predicates,
+                                  'estimated_tokens': self.full_prompt_tokens}
@@ -0,0 +1,126 @@
+# Filename: policy_index.py
+# In-memory BM25 index over the scraped policy sentences (tools/kb_sentences.json). Answers are
+# returned with the sentences that best match the question as citations, and questions that map to
+# no predicate can be answered from the policy text directly instead of with a canned reply.
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import threading
+
+from intent_router import STOPWORDS
+from nlu_cache import normalize_question
+
+logger = logging.getLogger("ssense_chatbot")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Question phrasing that says nothing about which part of the policy is meant ('return' included:
+# the whole policy is about returns).
+QUERY_STOPWORDS = STOPWORDS | {
+    'return', 'does', 'did', 'happen', 'happens', 'work', 'works', 'tell', 'who', 'when', 'where', 'which',
+    'why', 'would', 'should', 'could', 'need', 'want', 'know', 'about', 'please', 'any', 'we', 'us', 'our', 'take',
+}
+# The scraper joins inline elements without a space ("ourPrivacy Policy"); split them back apart.
+CAMEL_BOUNDARY_RE = re.compile(r"(?<=[a-z])(?=[A-Z])")
+
+
+def index_terms(text):
+    terms = []
+    for word in normalize_question(CAMEL_BOUNDARY_RE.sub(' ', text)).split():
+        if word in QUERY_STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        if word not in QUERY_STOPWORDS and len(word) > 1:
+            terms.append(word)
+    return terms
+
+
+class PolicyIndex:
+    """BM25 inverted index; postings map each term to [(sentence id, term frequency)]. Repeated sentences are indexed once."""
+
+    def __init__(self, sentences, version=None):
+        self.sentences = list(dict.fromkeys(sentences))
+        self.version = version
+        self.postings = {}
+        lengths = []
+        for sentence_id, sentence in enumerate(self.sentences):
+            terms = index_terms(sentence)
+            lengths.append(len(terms))
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                self.postings.setdefault(term, []).append((sentence_id, count))
+        average_length = sum(lengths) / len(lengths) if lengths else 0
+        self.length_norms = [BM25_K1 * (1 - BM25_B + BM25_B * length / average_length) if average_length else BM25_K1
+                             for length in lengths]
+        self.idf = {term: math.log(1 + (len(self.sentences) - len(posting) + 0.5) / (len(posting) + 0.5))
+                    for term, posting in self.postings.items()}
+
+    @classmethod
+    def from_file(cls, sentences_file):
+        with open(sentences_file, encoding='utf-8') as f:
+            sentences = [s for s in json.load(f) if isinstance(s, str) and s.strip()]
+        return cls(sentences, sentences_file_version(sentences_file))
+
+    def search(self, question, k=3, min_score=0.0):
+        """Top-k [{'id', 'text', 'score'}] for the question, best first; only scores above min_score."""
+        scores = {}
+        for term in set(index_terms(question)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for sentence_id, count in self.postings[term]:
+                scores[sentence_id] = scores.get(sentence_id, 0.0) + idf * count * (BM25_K1 + 1) / (
+                    count + self.length_norms[sentence_id])
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [{'id': sentence_id, 'text': self.sentences[sentence_id], 'score': round(score, 3)}
+                for sentence_id, score in best if score > min_score]
+
+
+def sentences_file_version(sentences_file):
+    stat = os.stat(sentences_file)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class PolicyIndexLoader:
+    """Holds the live PolicyIndex and rebuilds it when the sentence file changes; an empty index if the file is missing."""
+
+    def __init__(self, sentences_file):
+        self.sentences_file = sentences_file
+        self.current = self.build()
+        self._watch_stop = threading.Event()
+
+    def build(self):
+        if not os.path.exists(self.sentences_file):
+            logger.warning(f"Policy sentence file '{self.sentences_file}' not found; citations are disabled")
+            return PolicyIndex([])
+        index = PolicyIndex.from_file(self.sentences_file)
+        logger.info(f"Policy index built over {len(index.sentences)} sentences ({len(index.postings)} terms)")
+        return index
+
+    def refresh(self):
+        """Rebuilds the index if the file changed since it was built. Returns True when it did."""
+        version = sentences_file_version(self.sentences_file) if os.path.exists(self.sentences_file) else None
+        if version == self.current.version:
+            return False
+        self.current = self.build()
+        return True
+
+    def watch(self, interval):
+        """Polls the sentence file every interval seconds and rebuilds the index when it changes."""
+        def loop():
+            while not self._watch_stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"Error rebuilding policy index from '{self.sentences_file}': {e}", exc_info=True)
+
+        threading.Thread(target=loop, name="policy-index-watch", daemon=True).start()
+
+    def stop(self):
+        self._watch_stop.set()
@@ -0,0 +1,361 @@
+# Filename: prolog_pool.py
+# Pool of SWI-Prolog engines in worker processes. pyswip drives a single embedded engine
+# that is not safe to share between threads, so concurrent requests each borrow a worker.
+import collections
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+from metrics import percentile
+from query_plans import (QUERY_PLANS, TIME_LIMIT_CLAUSE, TIME_LIMIT_ERROR, TIME_LIMIT_PREDICATE,
+                         build_value_converter)
+
+logger = logging.getLogger("ssense_chatbot")
+
+WORKER_SCRIPT = os.path.abspath(__file__)
+WORKER_START_TIMEOUT_SECONDS = 30
+LATENCY_WINDOW = 1000
+
+
+class PrologQueryError(Exception):
+    """Raised when the KB rejects a query (syntax error, unknown procedure, ...)."""
+
+
+class PrologTimeout(Exception):
+    """Raised when a query exceeds its deadline or no worker frees up in time."""
+
+
+class PrologWorkerCrashed(Exception):
+    """Raised when a worker process exits while answering a query."""
+
+
+def worker_main(kb_filename):
+    """Worker process loop: one JSON request per stdin line, one JSON response per stdout line."""
+    # Keep the protocol channel private so anything Prolog prints cannot corrupt it.
+    out = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    def reply(message):
+        out.write(json.dumps(message) + '\n')
+        out.flush()
+
+    engine = LocalPrologEngine(kb_filename)
+    reply({'status': 'ready', 'pid': os.getpid()})
+    for line in sys.stdin:
+        request = json.loads(line)
+        try:
+            if 'plan' in request:
+                solutions = engine.run_plan(request['plan'], request['args'])
+            else:
+                solutions = engine.query(request['query'])
+            reply({'status': 'ok', 'solutions': solutions})
+        except Exception as e:
+            reply({'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+
+
+class PrologWorker:
+    """Handle on one worker process; a reader thread turns its stdout into a response queue."""
+
+    def __init__(self, kb_filename):
+        self.process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT, kb_filename],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+        self.responses = queue.Queue()
+        self.queries = 0
+        threading.Thread(target=self._read, name=f"prolog-worker-{self.process.pid}", daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            self.responses.put(json.loads(line))
+        self.responses.put(None)
+
+    def receive(self, timeout):
+        try:
+            message = self.responses.get(timeout=timeout)
+        except queue.Empty:
+            raise PrologTimeout(f"Prolog worker pid={self.process.pid} did not answer within {timeout}s")
+        if message is None:
+            raise PrologWorkerCrashed(f"Prolog worker pid={self.process.pid} exited while answering")
+        return message
+
+    def send(self, request):
+        try:
+            self.process.stdin.write(json.dumps(request) + '\n')
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise PrologWorkerCrashed(f"Prolog worker pid={self.process.pid} is gone: {e}")
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+        try:
+            self.process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class PrologPool:
+    """
+    N Prolog worker processes, each with the KB consulted once, behind a request queue.
+    query() returns solution dicts like Prolog.query, so the pool is a drop-in engine.
+    Workers that time out or crash are killed and replaced in the background.
+    """
+
+    def __init__(self, kb_filename, size=2, query_timeout=5.0, queue_timeout=10.0, max_queries_per_worker=0):
+        self.kb_filename = os.path.abspath(kb_filename)
+        self.size = size
+        self.query_timeout = query_timeout
+        self.queue_timeout = queue_timeout
+        self.max_queries_per_worker = max_queries_per_worker
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.waiting = 0
+        self.busy = 0
+        self.counters = collections.Counter()
+        self.latencies_ms = collections.deque(maxlen=LATENCY_WINDOW)
+        self.queue_waits_ms = collections.deque(maxlen=LATENCY_WINDOW)
+        for _ in range(size):
+            self._idle.put(self._spawn())
+        logger.info(f"Prolog pool started with {size} workers for '{self.kb_filename}'")
+
+    def _spawn(self):
+        worker = PrologWorker(self.kb_filename)
+        try:
+            ready = worker.receive(WORKER_START_TIMEOUT_SECONDS)
+        except (PrologTimeout, PrologWorkerCrashed):
+            worker.stop(kill=True)
+            raise RuntimeError(f"Prolog worker failed to load '{self.kb_filename}'")
+        logger.debug(f"Prolog worker pid={ready.get('pid')} ready")
+        with self._lock:
+            self.counters['spawned'] += 1
+        return worker
+
+    def _recycle(self, worker, reason):
+        """Kills a worker and starts its replacement without blocking the caller."""
+        logger.warning(f"Recycling Prolog worker pid={worker.process.pid}: {reason}")
+        with self._lock:
+            self.counters[f'recycled_{reason}'] += 1
+
+        def respawn():
+            worker.stop(kill=reason != 'max_queries')
+            if self._closed:
+                return
+            try:
+                self._idle.put(self._spawn())
+            except Exception as e:
+                logger.error(f"Error starting replacement Prolog worker: {e}", exc_info=True)
+
+        threading.Thread(target=respawn, name="prolog-respawn", daemon=True).start()
+
+    def query(self, query_string, timeout=None):
+        return self._call({'query': query_string}, timeout)
+
+    def run_plan(self, predicate_name, input_values, timeout=None):
+        return self._call({'plan': predicate_name, 'args': input_values}, timeout)
+
+    def _call(self, request, timeout):
+        timeout = self.query_timeout if timeout is None else timeout
+        queued_at = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+        try:
+            worker = self._idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            with self._lock:
+                self.counters['queue_timeouts'] += 1
+            raise PrologTimeout(f"No Prolog worker became available within {self.queue_timeout}s")
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+        started = time.perf_counter()
+        with self._lock:
+            self.busy += 1
+            self.queue_waits_ms.append((started - queued_at) * 1000)
+        try:
+            try:
+                worker.send(request)
+                message = worker.receive(timeout)
+            except PrologTimeout:
+                self._recycle(worker, 'timeout')
+                raise
+            except PrologWorkerCrashed:
+                self._recycle(worker, 'crash')
+                raise
+
+            worker.queries += 1
+            if self.max_queries_per_worker and worker.queries >= self.max_queries_per_worker:
+                self._recycle(worker, 'max_queries')
+            else:
+                self._idle.put(worker)
+
+            if message['status'] == 'error':
+                with self._lock:
+                    self.counters['query_errors'] += 1
+                raise PrologQueryError(message['error'])
+            return message['solutions']
+        finally:
+            with self._lock:
+                self.busy -= 1
+                self.counters['queries'] += 1
+                self.latencies_ms.append((time.perf_counter() - started) * 1000)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'mode': 'pool',
+                'workers': self.size,
+                'idle': self._idle.qsize(),
+                'busy': self.busy,
+                'queue_depth': self.waiting,
+                'counters': dict(self.counters),
+                'latency_ms': summarize(self.latencies_ms),
+                'queue_wait_ms': summarize(self.queue_waits_ms),
+            }
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+def compiled_kb_path(kb_filename):
+    return os.path.splitext(os.path.abspath(kb_filename))[0] + '.qlf'
+
+
+def compiled_kb_is_fresh(kb_filename):
+    compiled_path = compiled_kb_path(kb_filename)
+    return os.path.exists(compiled_path) and os.path.getmtime(compiled_path) >= os.path.getmtime(kb_filename)
+
+
+def precompile_kb(kb_filename, swipl='swipl'):
+    """
+    Compiles the KB to a .qlf next to it unless that is already newer than the source, so every
+    engine started afterwards loads precompiled clauses instead of parsing the .pl. Returns the
+    .qlf path, or None if swipl is missing or the compile failed.
+    """
+    compiled_path = compiled_kb_path(kb_filename)
+    if compiled_kb_is_fresh(kb_filename):
+        return compiled_path
+    source = os.path.abspath(kb_filename).replace('\\', '/').replace("'", "\\'")
+    try:
+        result = subprocess.run([swipl, '-q', '-g', f"qcompile('{source}')", '-t', 'halt'],
+                                capture_output=True, text=True, timeout=WORKER_START_TIMEOUT_SECONDS)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Could not precompile '{kb_filename}', engines will consult the source: {e}")
+        return None
+    if result.returncode != 0 or not os.path.exists(compiled_path):
+        logger.warning(f"Precompiling '{kb_filename}' failed (exit {result.returncode}): {result.stderr.strip()}")
+        return None
+    logger.info(f"Precompiled '{kb_filename}' to '{compiled_path}'")
+    return compiled_path
+
+
+def consult_kb(prolog, kb_filename):
+    """Loads the precompiled .qlf when it is up to date with the source, else the .pl itself."""
+    if compiled_kb_is_fresh(kb_filename):
+        try:
+            prolog.consult(compiled_kb_path(kb_filename))
+            return
+        except Exception as e:
+            logger.warning(f"Could not load precompiled KB for '{kb_filename}', consulting the source: {e}")
+    prolog.consult(kb_filename)
+
+
+class LocalPrologEngine:
+    """
+    The in-process pyswip engine behind a lock, for when no pool is configured. A query that runs
+    past its deadline is aborted inside Prolog by kb_time_limit/2 and raises PrologTimeout, and so
+    does waiting longer than queue_timeout for the lock. None disables either limit.
+    """
+
+    def __init__(self, kb_filename, query_timeout=None, queue_timeout=None):
+        from pyswip import Prolog
+        self.kb_filename = kb_filename
+        self.query_timeout = query_timeout
+        self.queue_timeout = queue_timeout
+        self.prolog = Prolog()
+        consult_kb(self.prolog, kb_filename)
+        next(self.prolog.query(f"use_module(library(time)), ( current_predicate({TIME_LIMIT_PREDICATE}/2) -> true "
+                               f"; assertz(({TIME_LIMIT_CLAUSE})) )"))
+        self.convert = build_value_converter()
+        self._lock = threading.Lock()
+        self.latencies_ms = collections.deque(maxlen=LATENCY_WINDOW)
+
+    def query(self, query_string, timeout=None):
+        time_limit_ms = self._time_limit_ms(timeout)
+        if time_limit_ms:
+            goal = query_string.strip()
+            goal = goal[:-1] if goal.endswith('.') else goal
+            query_string = f"{TIME_LIMIT_PREDICATE}({time_limit_ms}, ({goal}))."
+        return self._call(lambda: [{k: self.convert(v) for k, v in solution.items()}
+                                   for solution in self.prolog.query(query_string)], time_limit_ms)
+
+    def run_plan(self, predicate_name, input_values, timeout=None):
+        plan = QUERY_PLANS[predicate_name]
+        time_limit_ms = self._time_limit_ms(timeout)
+        return self._call(lambda: plan.run(input_values, self.convert, time_limit_ms), time_limit_ms)
+
+    def _time_limit_ms(self, timeout):
+        timeout = self.query_timeout if timeout is None else timeout
+        return max(1, round(timeout * 1000)) if timeout else None
+
+    def _call(self, run, time_limit_ms):
+        if not self._lock.acquire(timeout=-1 if self.queue_timeout is None else self.queue_timeout):
+            raise PrologTimeout(f"The in-process Prolog engine did not free up within {self.queue_timeout}s")
+        try:
+            from pyswip.prolog import PrologError
+            started = time.perf_counter()
+            try:
+                solutions = run()
+            except PrologError as e:
+                if f"'{TIME_LIMIT_ERROR}'" in str(e):
+                    raise PrologTimeout(f"Prolog query did not finish within {time_limit_ms} ms") from e
+                raise
+            self.latencies_ms.append((time.perf_counter() - started) * 1000)
+            return solutions
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        return {'mode': 'in_process', 'workers': 1, 'latency_ms': summarize(self.latencies_ms)}
+
+    def close(self):
+        pass
+
+
+def summarize(latencies_ms):
+    latencies_ms = list(latencies_ms)
+    if not latencies_ms:
+        return {'count': 0}
+    summary = {'count': len(latencies_ms)}
+    for pct in (50, 95, 99):
+        summary[f'p{pct}'] = round(percentile(latencies_ms, pct), 3)
+    summary['max'] = round(max(latencies_ms), 3)
+    return summary
+
+
+def create_prolog_engine(kb_filename, pool_size, query_timeout, queue_timeout, max_queries_per_worker=0):
+    """Returns a PrologPool when pool_size > 0, else the locked in-process engine with the same deadlines."""
+    if pool_size > 0:
+        return PrologPool(kb_filename, pool_size, query_timeout, queue_timeout, max_queries_per_worker)
+    return LocalPrologEngine(kb_filename, query_timeout, queue_timeout)
+
+
+if __name__ == "__main__":
+    worker_main(sys.argv[1])
@@ -0,0 +1,210 @@
+# Filename: query_plans.py
+# Query plans compiled once per predicate from kb_schema. A plan knows which argument slot
+# each named input binds to and which slots are output variables, so a request is answered
+# by filling prebuilt term slots instead of formatting a query string for SWI to re-parse.
+import logging
+
+from kb_schema import (ALLOWED_PREDICATES, API_PREDICATE_INPUT_ARGS, API_PREDICATE_OUTPUT_VARS, API_PREDICATES,
+                       PREDICATE_INPUT_ARGS, PREDICATE_OUTPUT_VARS)
+
+logger = logging.getLogger("ssense_chatbot")
+
+EXPLANATIONS_QUERY = "predicate_explanation(Predicate, _, Explanation)."
+
+# kb_time_limit(Millis, Goal) runs Goal under a deadline like call_with_time_limit/2, but keeps
+# every solution instead of only the first. The in-process engine wraps its queries in it.
+TIME_LIMIT_PREDICATE = 'kb_time_limit'
+TIME_LIMIT_CLAUSE = ("kb_time_limit(Millis, Goal) :- Seconds is Millis / 1000, "
+                     "setup_call_cleanup(alarm(Seconds, throw(time_limit_exceeded), Id), Goal, remove_alarm(Id))")
+TIME_LIMIT_ERROR = 'time_limit_exceeded'
+
+
+def quote_atom(value):
+    """Prolog source text for a Python string, quoted unless it is already a plain atom."""
+    if value and value.replace('_', '').isalnum() and value[0].islower() and value not in ('true', 'false'):
+        return value
+    return "'" + value.replace("'", "''") + "'"
+
+
+def format_prolog_arg(value):
+    """Formats a Python value into a Prolog-compatible string representation."""
+    if isinstance(value, str):
+        return quote_atom(value)
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, (int, float)):
+        return str(value)
+    if value is None:
+        return '_'
+    if isinstance(value, list):
+        return '[' + ', '.join(format_prolog_arg(v) for v in value) + ']'
+    logger.warning(f"Unsupported type for Prolog formatting: {type(value)}. Using repr().")
+    return quote_atom(repr(value))
+
+
+class QueryPlan:
+    """Argument layout of one KB predicate: input slots, output variables and anonymous slots."""
+
+    def __init__(self, predicate_name, input_arg_names, output_vars_map):
+        self.predicate_name = predicate_name
+        self.input_arg_names = tuple(input_arg_names)
+        self.output_var_names = list(output_vars_map.values())
+        self.arity = max([len(self.input_arg_names)] + list(output_vars_map.keys()))
+
+        # Each slot is ('input', index into the bound values), ('output', variable name) or ('any', None).
+        self.slots = [('input', i) for i in range(len(self.input_arg_names))]
+        self.slots += [('any', None)] * (self.arity - len(self.slots))
+        for pos, var_name in output_vars_map.items():
+            self.slots[pos - 1] = ('output', var_name)
+
+        placeholders = ['{}' if kind == 'input' else (ref if kind == 'output' else '_') for kind, ref in self.slots]
+        self.text_template = f"{predicate_name}({', '.join(placeholders)})."
+        self._functor = None
+
+    def bind(self, args_dict):
+        """Returns the input values in slot order, raising ValueError when one is missing or can't be a term."""
+        missing = [name for name in self.input_arg_names if name not in args_dict]
+        if missing:
+            raise ValueError(f"Missing required argument(s) {missing} for predicate '{self.predicate_name}'.")
+        return [normalize_input(args_dict[name]) for name in self.input_arg_names]
+
+    def render(self, input_values):
+        """Prolog source text of the bound query, for logs, debug output and the NLG prompt."""
+        return self.text_template.format(*(format_prolog_arg(v) for v in input_values))
+
+    def run(self, input_values, convert, time_limit_ms=None):
+        """
+        Calls the predicate on the embedded engine with the bound values; returns converted solutions.
+        Attaches the calling thread to a Prolog engine first, as Prolog.query does, and builds the
+        terms in a foreign frame so their term refs are released with it. With time_limit_ms the call
+        runs under kb_time_limit/2. A Prolog exception is raised as PrologError, as Prolog.query does.
+        """
+        from pyswip import Functor, Prolog, Query, Variable, getTerm
+        from pyswip.core import PL_discard_foreign_frame, PL_exception, PL_open_foreign_frame
+        from pyswip.prolog import PrologError
+        Prolog._init_prolog_thread()
+        if self._functor is None:
+            self._functor = Functor(self.predicate_name, self.arity)
+        frame = PL_open_foreign_frame()
+        try:
+            terms = []
+            outputs = []
+            for kind, ref in self.slots:
+                if kind == 'input':
+                    terms.append(to_term(input_values[ref]))
+                else:
+                    variable = Variable()
+                    terms.append(variable)
+                    if kind == 'output':
+                        outputs.append((ref, variable))
+            goal = self._functor(*terms)
+            if time_limit_ms:
+                goal = Functor(TIME_LIMIT_PREDICATE, 2)(time_limit_ms, goal)
+            query = Query(goal)
+            solutions = []
+            try:
+                while query.nextSolution():
+                    solutions.append({name: convert(variable.value) for name, variable in outputs})
+                exception = PL_exception(Query.qid)
+                if exception:
+                    raise PrologError(f"Caused by: '{self.render(input_values)}'. Returned: '{convert(getTerm(exception))}'.")
+            finally:
+                query.closeQuery()
+            return solutions
+        finally:
+            PL_discard_foreign_frame(frame)
+
+
+def normalize_input(value):
+    """
+    An input value as a plan can pass it to pyswip, which puts str, int and lists but no floats:
+    a whole float becomes an int, any other float raises ValueError.
+    """
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(f"Non-integer number {value} can't be passed to the KB.")
+        return int(value)
+    if isinstance(value, list):
+        return [normalize_input(v) for v in value]
+    return value
+
+
+def to_term(value):
+    """
+    Python value -> a value pyswip's putTerm accepts, with the meaning format_prolog_arg gives it
+    in query text: a str is put as an atom, None as a fresh variable. Floats go through normalize_input.
+    """
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, (str, int)):
+        return value
+    if isinstance(value, float):
+        return normalize_input(value)
+    if value is None:
+        from pyswip import Variable
+        return Variable()
+    if isinstance(value, list):
+        return [to_term(v) for v in value]
+    return repr(value)
+
+
+def compile_query_plans(predicate_input_args, predicate_output_vars, predicate_names=ALLOWED_PREDICATES):
+    plans = {}
+    for predicate_name in predicate_names:
+        if predicate_name not in predicate_input_args:
+            raise ValueError(f"Argument order mapping not defined for predicate: {predicate_name}")
+        plans[predicate_name] = QueryPlan(
+            predicate_name, predicate_input_args[predicate_name], predicate_output_vars.get(predicate_name, {}))
+    return plans
+
+
+def build_value_converter():
+    """Returns one function mapping pyswip result values to plain JSON-serializable Python values."""
+    from pyswip import Atom, Functor
+
+    def atom_text(value):
+        return str(value).strip("'")
+
+    def functor_text(value):
+        if value.arity == 0:
+            return str(value).strip("'")
+        return f"{convert(value.name)}({', '.join(arg_text(a) for a in value.args)})"
+
+    def arg_text(value):
+        # Built here rather than with str(): pyswip prints list members inside a Functor by repr.
+        if isinstance(value, Functor):
+            return functor_text(value)
+        if isinstance(value, list):
+            return '[' + ', '.join(arg_text(v) for v in value) + ']'
+        return format_prolog_arg(convert(value))
+
+    def identity(value):
+        return value
+
+    def convert_list(value):
+        return [convert(v) for v in value]
+
+    handlers = {Atom: atom_text, Functor: functor_text, str: identity, int: identity, float: identity,
+                bool: identity, type(None): identity, list: convert_list}
+    base_handlers = tuple(handlers.items())
+
+    def convert(value):
+        handler = handlers.get(type(value))
+        if handler is None:
+            handler = next((h for t, h in base_handlers if isinstance(value, t)), str)
+            handlers[type(value)] = handler
+        return handler(value)
+
+    return convert
+
+
+def load_explanations(engine):
+    """Reads every predicate_explanation/3 fact once; returns {predicate name: explanation}."""
+    explanations = {}
+    for solution in engine.query(EXPLANATIONS_QUERY):
+        explanations.setdefault(str(solution['Predicate']), str(solution['Explanation']))
+    return explanations
+
+
+QUERY_PLANS = compile_query_plans(PREDICATE_INPUT_ARGS, PREDICATE_OUTPUT_VARS)
+QUERY_PLANS.update(compile_query_plans(API_PREDICATE_INPUT_ARGS, API_PREDICATE_OUTPUT_VARS, API_PREDICATES))
@@ -0,0 +1,66 @@
+# Filename: responses.py
+# Response encoding shared by the Flask and ASGI apps: orjson serialization, Content-Encoding
+# negotiation (br, then gzip), CORS origin matching and the opt-in debug section of chat payloads.
+import gzip
+import re
+
+import brotli
+import orjson
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/plain')
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+DEBUG_FLAG_VALUES = ('1', 'true', 'yes')
+REGEX_CHARS = set('*\\]?$^[]()')
+
+
+def encode_json(payload):
+    """Serializes a payload to UTF-8 JSON bytes; values orjson does not know become strings."""
+    return orjson.dumps(payload, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+def accepted_encoding(accept_encoding):
+    """'br' or 'gzip' when the Accept-Encoding header allows it, else None."""
+    weights = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        if name.strip():
+            weights[name.strip().lower()] = weight
+    for encoding in ('br', 'gzip'):
+        if weights.get(encoding, weights.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def compile_origins(origins):
+    """Origin patterns as flask-cors reads them: anything with regex characters is a regex, the rest exact."""
+    return [re.compile(o, re.IGNORECASE) if REGEX_CHARS & set(o) else o.lower() for o in origins]
+
+
+def origin_allowed(origin, patterns):
+    origin = origin.lower()
+    return any(p.match(origin) if hasattr(p, 'match') else p == origin for p in patterns)
+
+
+def debug_flag(value):
+    return (value or '').strip().lower() in DEBUG_FLAG_VALUES
+
+
+def strip_debug(payload, include_debug):
+    """Drops the debug section unless the caller asked for it and is allowed to see it."""
+    if not include_debug:
+        payload.pop('debug', None)
+    return payload
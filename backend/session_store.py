@@ -0,0 +1,153 @@
+# Filename: session_store.py
+# Conversation state for clarification turns. When NLU answers missing_info, the pending
+# predicate and the arguments already extracted are kept under the conversation id, so the
+# user's reply only has to fill the missing slots instead of going through full NLU again.
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from intent_router import extract_slot
+from nlu_cache import normalize_question
+
+MAX_CONVERSATION_ID_LENGTH = 64
+CONVERSATION_ID_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+BARE_DAYS_RE = re.compile(r"^(?:about|around|roughly|maybe|like|only|just)?\s*(\d+)$")
+SLOT_QUESTIONS = {
+    'ItemType': "What type of item is it?",
+    'Condition': "What condition is the item in (unworn, used or damaged)?",
+    'Packaging': "Is the item still in its original packaging?",
+    'Tags': "Are the tags still attached?",
+    'DaysSinceDelivery': "Roughly how many days ago was the item delivered?",
+    'Region': "Which country or region are you returning from?",
+    'PhoneType': "Which number do you need: North America toll-free, local or Quebec?",
+    'UserType': "Are you ordering with an account or as a guest?",
+}
+
+
+def conversation_id_or_new(conversation_id):
+    """Returns the client's conversation id if it is well-formed, else a fresh one."""
+    if (isinstance(conversation_id, str) and 0 < len(conversation_id) <= MAX_CONVERSATION_ID_LENGTH
+            and CONVERSATION_ID_RE.match(conversation_id)):
+        return conversation_id
+    return uuid.uuid4().hex
+
+
+def missing_slots(input_arg_names, args_dict):
+    return [name for name in input_arg_names if args_dict.get(name) is None]
+
+
+def fill_slots_locally(pending, reply):
+    """Extracts the pending missing arguments from the reply with the router's slot patterns."""
+    text = normalize_question(reply)
+    filled = {}
+    for arg_name in pending['missing_args']:
+        value = extract_slot(arg_name, text, pending['args'])
+        if value is None and arg_name == 'DaysSinceDelivery':
+            match = BARE_DAYS_RE.match(text)
+            value = int(match.group(1)) if match else None
+        if value is not None:
+            filled[arg_name] = value
+    return filled
+
+
+def build_slot_messages(slot_prompt, pending, reply):
+    """Chat messages for the slot-only LLM call: just the pending state and the reply."""
+    context = {
+        'predicate': pending['predicate'],
+        'known_args': pending['args'],
+        'missing_args': pending['missing_args'],
+        'clarification_question': pending['clarification_question'],
+        'reply': reply,
+    }
+    return [{"role": "system", "content": slot_prompt}, {"role": "user", "content": json.dumps(context)}]
+
+
+def parse_slot_output(pending, raw_slot_output):
+    """Keeps the values the slot LLM returned for arguments that are actually missing."""
+    try:
+        values = json.loads(raw_slot_output).get('args') or {}
+    except (json.JSONDecodeError, AttributeError):
+        return {}
+    filled = {}
+    for arg_name in pending['missing_args']:
+        value = values.get(arg_name) if isinstance(values, dict) else None
+        if arg_name == 'DaysSinceDelivery' and value is not None:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                value = None
+        if isinstance(value, (str, int)) and value != '':
+            filled[arg_name] = value
+    return filled
+
+
+def apply_filled_slots(pending, filled, source):
+    """Merges filled slots into the pending state; returns NLU JSON like the NLU call would."""
+    args_dict = dict(pending['args'], **filled)
+    remaining = [name for name in pending['missing_args'] if name not in filled]
+    nlu_json = {'status': 'success', 'predicate': pending['predicate'], 'args': args_dict, 'source': source}
+    if remaining:
+        nlu_json.update({
+            'status': 'missing_info',
+            'missing_args': remaining,
+            'clarification_question': ' '.join(SLOT_QUESTIONS.get(name, f"What is the {name}?") for name in remaining),
+        })
+    return nlu_json
+
+
+class SessionStore:
+    """Bounded LRU+TTL map of conversation id -> pending clarification, shared by the request threads."""
+
+    def __init__(self, max_entries=10000, ttl_seconds=900):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+        self.expirations = 0
+        self.fills = Counter()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return None
+            expires_at, pending = entry
+            if expires_at < now:
+                del self._entries[conversation_id]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(conversation_id)
+            return pending
+
+    def put(self, conversation_id, pending):
+        with self._lock:
+            self._entries[conversation_id] = (time.time() + self.ttl_seconds, pending)
+            self._entries.move_to_end(conversation_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, conversation_id):
+        with self._lock:
+            self._entries.pop(conversation_id, None)
+
+    def record_fill(self, source):
+        """Counts how a clarification reply was resolved: 'local', 'llm' or 'none'."""
+        with self._lock:
+            self.fills[source] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'fills': dict(self.fills),
+            }
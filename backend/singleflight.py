@@ -0,0 +1,130 @@
+# Filename: singleflight.py
+# In-flight request coalescing. While a call for a key is running, identical calls wait for its
+# outcome instead of issuing their own upstream request; its exception is re-raised to every
+# waiter. Nothing is cached once the call finishes.
+import asyncio
+import concurrent.futures
+import copy
+import json
+import logging
+import threading
+
+from metrics import SINGLE_FLIGHT_CALLS
+
+logger = logging.getLogger("ssense_chatbot")
+
+
+def flight_key(*parts):
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+class SingleFlightAbandoned(Exception):
+    """Raised to waiters when the call they joined was cancelled before finishing."""
+
+
+class SingleFlight:
+    """Thread-based coalescing for the Flask app. Waiters give up after timeout seconds with TimeoutError."""
+
+    def __init__(self, name, timeout=30):
+        self.name = name
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = concurrent.futures.Future()
+        if not leader:
+            return self._wait(call)
+
+        SINGLE_FLIGHT_CALLS.inc(1, self.name, 'leader')
+        try:
+            result = func(*args)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stream(self, key, func, *args):
+        """
+        do() for a func returning an iterator of text chunks. The leader's chunks are yielded as they
+        arrive and waiters, streaming or not, get the stripped concatenation as their result; a waiter
+        that streams receives it as one chunk.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = concurrent.futures.Future()
+        if not leader:
+            yield self._wait(call)
+            return
+
+        SINGLE_FLIGHT_CALLS.inc(1, self.name, 'leader')
+        chunks = []
+        try:
+            for chunk in func(*args):
+                chunks.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            call.set_exception(SingleFlightAbandoned(f"In-flight {self.name} call was abandoned by its client."))
+            raise
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(''.join(chunks).strip())
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def _wait(self, call):
+        try:
+            result = call.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            SINGLE_FLIGHT_CALLS.inc(1, self.name, 'timeout')
+            logger.warning(f"Timed out after {self.timeout}s waiting for in-flight {self.name} call")
+            raise
+        SINGLE_FLIGHT_CALLS.inc(1, self.name, 'follower')
+        return copy.deepcopy(result)
+
+
+class AsyncSingleFlight:
+    """asyncio coalescing for the ASGI app. Callers bound the wait with their own stage deadline."""
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+
+    async def do(self, key, factory):
+        call = self._calls.get(key)
+        if call is not None:
+            result = await asyncio.shield(call)
+            SINGLE_FLIGHT_CALLS.inc(1, self.name, 'follower')
+            return copy.deepcopy(result)
+
+        call = self._calls[key] = asyncio.get_running_loop().create_future()
+        # Mark the outcome as retrieved so a failed call with no waiters isn't reported as unhandled.
+        call.add_done_callback(lambda f: f.cancelled() or f.exception())
+        SINGLE_FLIGHT_CALLS.inc(1, self.name, 'leader')
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            call.set_exception(SingleFlightAbandoned(f"In-flight {self.name} call was cancelled."))
+            raise
+        except Exception as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            self._calls.pop(key, None)
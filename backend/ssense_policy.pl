@@ -282,6 +282,46 @@ check_category_specific_rules(technology, _Condition, _Packaging, _Tags) :-
 check_category_specific_rules(ItemType, _Condition, _Packaging, _Tags) :-
     \+ applies_rule(crit, ItemType, _). % Default: passes if no specific rule applies
     
+% --- Batch Eligibility ---
+% Checks every line of an order in one call (used by the /api/eligibility/batch endpoint).
+% Items: list of [ItemType, Condition, Packaging, Tags, DaysSinceDelivery].
+% Verdicts: one [Criterion, Detail] per item, in the same order. Criterion is eligible (Detail none)
+% or the first check the item fails: window_exceeded (Detail = window days), excluded (Detail = reason
+% structure), condition, packaging or tags (Detail = the given value), category_rule (Detail = rule).
+check_eligibility_batch(Items, Verdicts) :-
+    maplist(eligibility_verdict, Items, Verdicts).
+
+eligibility_verdict([ItemType, Condition, Packaging, Tags, DaysSinceDelivery], Verdict) :-
+    (   is_eligible(ItemType, Condition, Packaging, Tags, DaysSinceDelivery)
+    ->  Verdict = [eligible, none]
+    ;   eligibility_failure(ItemType, Condition, Packaging, Tags, DaysSinceDelivery, Criterion, Detail)
+    ->  Verdict = [Criterion, Detail]
+    ;   Verdict = [unknown, none]
+    ).
+
+% First failing check, in the order is_eligible/5 applies them.
+eligibility_failure(_, _, _, _, DaysSinceDelivery, window_exceeded, MaxDays) :-
+    get_return_window(MaxDays),
+    DaysSinceDelivery > MaxDays, !.
+eligibility_failure(ItemType, _, _, _, _, excluded, ReasonStructure) :-
+    is_item_excluded(ItemType, ReasonStructure), !.
+eligibility_failure(_, Condition, _, _, _, condition, Condition) :-
+    requires(crit, item_condition, RequiredCondition),
+    Condition \== RequiredCondition, !.
+eligibility_failure(ItemType, _, Packaging, _, _, packaging, Packaging) :-
+    (   Packaging == sealed
+    ->  \+ member(ItemType, [self_care, sexual_wellness_non_toy, technology_if_sealed])
+    ;   requires(crit, item_packaging, RequiredPackaging),
+        Packaging \== RequiredPackaging
+    ), !.
+eligibility_failure(_, _, _, Tags, _, tags, Tags) :-
+    requires(crit, ssense_security_tag_condition, RequiredTagState),
+    Tags \== RequiredTagState,
+    Tags \== hygienic_sticker_intact, !.
+eligibility_failure(ItemType, Condition, Packaging, Tags, _, category_rule, Rule) :-
+    \+ check_category_specific_rules(ItemType, Condition, Packaging, Tags),
+    ( applies_rule(crit, ItemType, Rule) -> true ; Rule = ItemType ).
+
 % --- Predicate Explanations ---
 % Defines user-friendly explanations for key predicates used by the LLM.
 % Format: predicate_explanation(PredicateName, Arity, ExplanationString).
@@ -1,4 +1,7 @@
 const API_URL = 'http://localhost:5001/api/chat';
+const STREAM_API_URL = `${API_URL}/stream`;
+// Sent back with every message so a reply to a clarification question only fills the missing details.
+let conversationId = null;
 
 const explanationPanel = document.getElementById('explanationPanel');
 const explanationContent = document.getElementById('explanationContent');
@@ -182,44 +185,32 @@ async function sendMessage(event) {
 
   try {
     const controller = new AbortController();
-    const timeoutId = setTimeout(() => controller.abort(), 10000);
+    let timeoutId = setTimeout(() => controller.abort(), 10000);
 
-    console.log('sendMessage: Fetching API response...');
-    const response = await fetch(API_URL, {
+    console.log('sendMessage: Fetching streamed API response...');
+    const response = await fetch(STREAM_API_URL, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ message: userMessage }), 
+      headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+      body: JSON.stringify({ message: userMessage, conversation_id: conversationId }),
       mode: 'cors',
       signal: controller.signal
     });
-
-    clearTimeout(timeoutId);
-    hideTypingIndicator(); 
     console.log('sendMessage: Response status:', response.status);
 
-
     if (!response.ok) {
+      clearTimeout(timeoutId);
+      hideTypingIndicator();
       throw new Error(`API error: ${response.status} ${response.statusText}`);
     }
 
-    const data = await response.json(); 
-    console.log('sendMessage: Received data:', data);
-
-    addBotMessage(data.response);
-
-    const explanationText = data.explanation || null;
-
-    if (explanationText && explanationPanel && explanationContent) {
-        console.log('sendMessage: Explanation found. Updating content and showing panel.');
-        explanationContent.textContent = explanationText; 
-        explanationPanel.style.display = 'flex'; 
-        console.log('sendMessage: Panel display set to flex.');
-    } else {
-        console.log('sendMessage: No explanation found or elements missing. Ensuring panel is hidden.');
-        if (explanationPanel) {
-            explanationPanel.style.display = 'none';
-        }
-    }
+    // Each event resets the timeout, so only a stalled stream is aborted.
+    await readEventStream(response, (event, data) => {
+      clearTimeout(timeoutId);
+      timeoutId = setTimeout(() => controller.abort(), 10000);
+      handleStreamEvent(event, data);
+    });
+    clearTimeout(timeoutId);
+    hideTypingIndicator();
 
   } catch (error) {
     hideTypingIndicator();
@@ -245,3 +236,91 @@ async function sendMessage(event) {
     statusIndicator.style.opacity = '1'; 
   }
 }
+
+let streamingBubble = null;
+
+function startBotMessage() {
+  const chatMessages = document.getElementById("chatMessages");
+  const messageContainer = document.createElement("div");
+  messageContainer.className = "message bot-message";
+
+  const bubbleElement = document.createElement("div");
+  bubbleElement.className = "message-bubble bot-bubble";
+  messageContainer.appendChild(bubbleElement);
+
+  chatMessages.appendChild(messageContainer);
+  return bubbleElement;
+}
+
+function showExplanation(explanationText) {
+  if (explanationText && explanationPanel && explanationContent) {
+    console.log('showExplanation: Explanation found. Updating content and showing panel.');
+    explanationContent.textContent = explanationText;
+    explanationPanel.style.display = 'flex';
+  } else if (explanationPanel) {
+    console.log('showExplanation: No explanation found. Ensuring panel is hidden.');
+    explanationPanel.style.display = 'none';
+  }
+}
+
+function handleStreamEvent(event, data) {
+  console.log(`handleStreamEvent: ${event}`, data);
+  switch (event) {
+    case 'received':
+      if (data.conversation_id) conversationId = data.conversation_id;
+      break;
+    case 'explanation':
+      showExplanation(data.explanation);
+      break;
+    case 'token':
+      if (!streamingBubble) {
+        hideTypingIndicator();
+        streamingBubble = startBotMessage();
+      }
+      streamingBubble.textContent += data.text;
+      scrollToBottom();
+      break;
+    case 'done':
+      if (!streamingBubble) {
+        hideTypingIndicator();
+        streamingBubble = startBotMessage();
+      }
+      streamingBubble.textContent = data.response;
+      showExplanation(data.explanation);
+      streamingBubble = null;
+      scrollToBottom();
+      break;
+    case 'error':
+      streamingBubble = null;
+      throw new Error(`API error: ${data.error}`);
+    default:
+      break;
+  }
+}
+
+async function readEventStream(response, onEvent) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  streamingBubble = null;
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let frameEnd;
+    while ((frameEnd = buffer.indexOf('\n\n')) !== -1) {
+      const frame = buffer.slice(0, frameEnd);
+      buffer = buffer.slice(frameEnd + 2);
+
+      let event = 'message';
+      const dataLines = [];
+      for (const line of frame.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+      }
+      if (dataLines.length) onEvent(event, JSON.parse(dataLines.join('\n')));
+    }
+  }
+}
@@ -0,0 +1,19 @@
+# Shared test setup: the backend modules are flat and imported by name, as the app and tools do.
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+KB_FILENAME = os.path.join(BACKEND_DIR, 'ssense_policy.pl')
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture(scope='session')
+def engine():
+    """The in-process Prolog engine on the shipped KB; tests using it skip where SWI-Prolog isn't installed."""
+    try:
+        from prolog_pool import LocalPrologEngine
+        return LocalPrologEngine(KB_FILENAME)
+    except Exception as e:
+        pytest.skip(f"SWI-Prolog engine unavailable: {e}")
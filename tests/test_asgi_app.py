@@ -0,0 +1,36 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from prolog_pool import PrologPool
+
+KB_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'ssense_policy.pl')
+
+
+@pytest.fixture
+def pool():
+    """A one-worker pool with a short query timeout; skips where SWI-Prolog isn't installed."""
+    try:
+        pool = PrologPool(KB_FILENAME, size=1, query_timeout=0.5)
+    except Exception as e:
+        pytest.skip(f"Prolog pool unavailable: {e}")
+    yield pool
+    pool.close()
+
+
+def test_timed_out_query_does_not_block_the_next(pool, monkeypatch):
+    pytest.importorskip('flask')
+    pytest.importorskip('openai')
+    import asgi_app
+    monkeypatch.setattr(asgi_app, 'prolog_executor', ThreadPoolExecutor(max_workers=pool.size))
+
+    async def scenario():
+        monkeypatch.setattr(asgi_app, 'PROLOG_TIMEOUT_SECONDS', 0.2)
+        with pytest.raises(asgi_app.StageTimeout):
+            await asgi_app.run_blocking('prolog', pool.query, "repeat, fail.")
+        monkeypatch.setattr(asgi_app, 'PROLOG_TIMEOUT_SECONDS', 10)
+        return await asgi_app.run_blocking('prolog', pool.query, "get_return_window(Days).")
+
+    assert asyncio.run(scenario()) == [{'Days': 30}]
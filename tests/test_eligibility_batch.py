@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from eligibility_batch import ELIGIBILITY_FIELDS, check_eligibility_batch, to_atom_text, validate_item
+
+ITEMS = [
+    {'ItemType': 'clothing', 'Condition': 'original', 'Packaging': 'original_intact', 'Tags': 'intact',
+     'DaysSinceDelivery': 10},
+    {'ItemType': 'clothing', 'Condition': 'original', 'Packaging': 'original_intact', 'Tags': 'intact',
+     'DaysSinceDelivery': 400},
+    {'ItemType': 'Final Sale Item', 'Condition': 'original', 'Packaging': 'original_intact', 'Tags': 'intact',
+     'DaysSinceDelivery': 3},
+    {'ItemType': 'shoes', 'Condition': 'used', 'Packaging': 'original_intact', 'Tags': 'intact',
+     'DaysSinceDelivery': 3},
+    {'ItemType': 'swimwear', 'Condition': 'original', 'Packaging': 'original_intact',
+     'Tags': 'hygienic_sticker_intact', 'DaysSinceDelivery': 3},
+    {'ItemType': 'accessory', 'Condition': 'original', 'Packaging': 'opened', 'Tags': 'removed',
+     'DaysSinceDelivery': 0},
+]
+
+
+def test_validate_item():
+    row, error = validate_item(dict(ITEMS[2]))
+    assert error is None and row == ['final_sale_item', 'original', 'original_intact', 'intact', 3]
+    assert validate_item({'ItemType': 'shoes'})[1].startswith('Missing field(s)')
+    assert validate_item(dict(ITEMS[0], DaysSinceDelivery=2.5))[1] == 'DaysSinceDelivery must be a non-negative integer.'
+    assert validate_item(dict(ITEMS[0], DaysSinceDelivery=True))[1] == 'DaysSinceDelivery must be a non-negative integer.'
+    assert validate_item(dict(ITEMS[0], Condition=3))[1] == 'Condition must be a string.'
+    assert validate_item([])[1] == 'Item must be an object.'
+
+
+def single_item_verdict(engine, item):
+    row = [to_atom_text(item[field]) for field in ELIGIBILITY_FIELDS[:-1]] + [item['DaysSinceDelivery']]
+    return bool(engine.run_plan('is_eligible', row))
+
+
+def test_batch_verdicts_match_is_eligible(engine):
+    results = check_eligibility_batch(engine, ITEMS + [{'ItemType': 'shoes'}])
+    assert [r['index'] for r in results] == list(range(len(ITEMS) + 1))
+    assert [r['eligible'] for r in results[:-1]] == [single_item_verdict(engine, item) for item in ITEMS]
+    assert any(r['eligible'] for r in results) and not all(r['eligible'] for r in results)
+    assert results[1]['failed_criterion'] == 'window_exceeded'
+    assert results[2]['failed_criterion'] == 'excluded'
+    assert results[3]['failed_criterion'] == 'condition'
+    assert results[-1]['failed_criterion'] == 'invalid_item'
+
+
+def test_batch_endpoint(engine, monkeypatch):
+    pytest.importorskip('flask')
+    import app as chat_app
+    from kb_reload import KnowledgeBase
+    from query_plans import load_explanations
+    monkeypatch.setattr(chat_app, 'worker_pid', os.getpid())
+    monkeypatch.setattr(chat_app, 'kb_reloader', type('Reloader', (), {
+        'current': KnowledgeBase(engine, load_explanations(engine), 'test')})())
+
+    response = chat_app.app.test_client().post('/api/eligibility/batch', json={'items': ITEMS})
+
+    assert response.status_code == 200
+    payload = response.get_json()
+    verdicts = [single_item_verdict(engine, item) for item in ITEMS]
+    assert [r['eligible'] for r in payload['results']] == verdicts
+    assert payload['eligible_count'] == sum(verdicts)
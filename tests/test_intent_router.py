@@ -0,0 +1,65 @@
+import json
+import os
+
+import pytest
+
+from intent_router import IntentRouter, extract_days, extract_slot
+from kb_schema import PREDICATE_INPUT_ARGS
+from nlu_cache import normalize_question
+
+TRAINING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'router_training.json')
+
+
+@pytest.fixture(scope='module')
+def router():
+    return IntentRouter.from_files(TRAINING_FILE, PREDICATE_INPUT_ARGS)
+
+
+@pytest.mark.parametrize('question, region', [
+    ("Is shipping free for returns from the US?", 'usa'),
+    ("Do returns from the U.S. cost anything?", 'usa'),
+    ("I live in the United States", 'usa'),
+    ("I'm in Montreal", 'canada'),
+    ("What about Hong Kong?", 'hong_kong'),
+    ("Is return shipping free for us?", None),
+    ("Can you tell us the return fee?", None),
+    ("Is return shipping free for me here?", None),
+    ("Is it free in my country?", None),
+])
+def test_extract_region(question, region):
+    assert extract_slot('Region', normalize_question(question)) == region
+
+
+@pytest.mark.parametrize('question, days', [
+    ("It arrived 10 days ago", 10),
+    ("Delivered two weeks ago", 14),
+    ("I got it last month", 30),
+    ("It came yesterday", 1),
+    ("It arrived a few days ago", None),
+    ("I've had it a couple of weeks", None),
+])
+def test_extract_days(question, days):
+    assert extract_days(normalize_question(question)) == days
+
+
+def test_region_defaults_when_the_question_names_none(router):
+    assert router.extract_args('get_shipping_cost', "Is return shipping free for us?") == {'Region': 'canada'}
+
+
+def test_region_abstains_on_an_unknown_place(router):
+    assert router.extract_args('get_return_fee', "What's the return fee in Narnia?") is None
+
+
+def test_labelled_training_cases(router):
+    with open(TRAINING_FILE, encoding='utf-8') as f:
+        labelled = [item for item in json.load(f) if 'args' in item]
+    assert labelled
+    for item in labelled:
+        nlu_json = router.resolve(item['question'])
+        assert nlu_json is not None, item['question']
+        assert (nlu_json['predicate'], nlu_json['args']) == (item['predicate'], item['args'])
+
+
+def test_off_topic(router):
+    nlu_json, _ = router.route("What's the weather like in Paris tomorrow?")
+    assert nlu_json['status'] == 'off_topic'
@@ -0,0 +1,38 @@
+import os
+
+from kb_reload import load_gate_cases
+from query_plans import QUERY_PLANS
+
+GATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools', 'prolog_test.py')
+
+
+class BrokenPlanEngine:
+    """Fails every run_plan call the way pyswip rejects a term type it can't put."""
+
+    def query(self, query_string, timeout=None):
+        return []
+
+    def run_plan(self, predicate_name, input_values, timeout=None):
+        raise Exception("Not implemented for type: <class 'pyswip.easy.Atom'>")
+
+
+def test_gate_passes_on_the_shipped_kb(engine):
+    assert load_gate_cases(GATE_FILE)(engine) == []
+
+
+def test_gate_blocks_a_broken_plan_path():
+    failures = load_gate_cases(GATE_FILE)(BrokenPlanEngine())
+    failed_plans = {query.split(': ', 1)[1].split('(')[0] for query, _, _ in failures if query.startswith('run_plan: ')}
+    assert failed_plans == set(QUERY_PLANS)
+
+
+class HandleLeakEngine(BrokenPlanEngine):
+    """Returns the compound binding with atom handles in place of names, as str() on a pyswip Functor does."""
+
+    def run_plan(self, predicate_name, input_values, timeout=None):
+        return [{'ReasonStructure': "includes([Atom('1234'), Atom('1235')])"}]
+
+
+def test_gate_checks_compound_plan_results():
+    failures = load_gate_cases(GATE_FILE)(HandleLeakEngine())
+    assert any(query.startswith('run_plan: is_item_excluded(') for query, _, _ in failures)
@@ -0,0 +1,61 @@
+import pytest
+
+import prolog_pool
+from kb_reload import KBReloader
+from prolog_pool import LocalPrologEngine, create_prolog_engine
+
+
+class FakeEngine:
+    def __init__(self, kb_filename, size=1, query_timeout=5.0, queue_timeout=10.0, max_queries_per_worker=0):
+        with open(kb_filename, encoding='utf-8') as f:
+            self.clauses = f.read()
+        self.closed = False
+        self.settings = (size, query_timeout, queue_timeout, max_queries_per_worker)
+
+    def query(self, query_string, timeout=None):
+        return [{'Predicate': 'can_exchange', 'Explanation': self.clauses}]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeLocalEngine(FakeEngine, LocalPrologEngine):
+    pass
+
+
+def fake_engine_factory(kb_file, monkeypatch, pool_size):
+    """A factory shaped like app.build_prolog_engine over fake pool and in-process engines."""
+    monkeypatch.setattr(prolog_pool, 'PrologPool', FakeEngine)
+    monkeypatch.setattr(prolog_pool, 'LocalPrologEngine', FakeLocalEngine)
+    return lambda pool_size=pool_size: create_prolog_engine(str(kb_file), pool_size, 1.5, 3.0, 200)
+
+
+def test_in_process_reload_swaps_in_a_fresh_engine(tmp_path, monkeypatch):
+    kb_file = tmp_path / 'kb.pl'
+    kb_file.write_text('v1', encoding='utf-8')
+    reloader = KBReloader(str(kb_file), fake_engine_factory(kb_file, monkeypatch, 0), str(tmp_path / 'missing_gate.py'),
+                          drain_seconds=0)
+    previous = reloader.current
+
+    kb_file.write_text('v2', encoding='utf-8')
+    result = reloader.reload()
+
+    assert result['status'] == 'reloaded'
+    assert reloader.current.engine is not previous.engine
+    assert reloader.current.explanations == {'can_exchange': 'v2'}
+    assert previous.engine.clauses == 'v1'
+    assert reloader.reload()['status'] == 'unchanged'
+
+
+@pytest.mark.parametrize('pool_size, reloaded_size', [(0, 1), (3, 3)])
+def test_reloaded_engine_keeps_the_configured_settings(tmp_path, monkeypatch, pool_size, reloaded_size):
+    kb_file = tmp_path / 'kb.pl'
+    kb_file.write_text('v1', encoding='utf-8')
+    reloader = KBReloader(str(kb_file), fake_engine_factory(kb_file, monkeypatch, pool_size),
+                          str(tmp_path / 'missing_gate.py'), drain_seconds=0)
+
+    kb_file.write_text('v2', encoding='utf-8')
+    assert reloader.reload()['status'] == 'reloaded'
+
+    assert type(reloader.current.engine) is FakeEngine
+    assert reloader.current.engine.settings == (reloaded_size, 1.5, 3.0, 200)
@@ -0,0 +1,23 @@
+import pytest
+
+from metrics import RequestTimer, percentile
+
+
+@pytest.mark.parametrize('values, pct, expected', [
+    ([], 95, 0.0),
+    ([7], 99, 7),
+    ([5, 1, 3], 50, 3),
+    (list(range(1, 101)), 95, 95),
+    (list(range(1, 101)), 100, 100),
+])
+def test_percentile(values, pct, expected):
+    assert percentile(values, pct) == expected
+
+
+def test_server_timing_lists_each_stage_and_the_total():
+    timer = RequestTimer('chat')
+    with timer.stage('nlu'):
+        pass
+    header = timer.server_timing()
+    assert header.startswith('nlu;dur=')
+    assert ', total;dur=' in header
@@ -0,0 +1,73 @@
+import pytest
+
+from nlg_templates import join_phrases, phrase, render_answer
+
+
+@pytest.mark.parametrize('var_name, value, expected', [
+    ('Region', 'usa', 'the USA'),
+    ('Region', "'hong_kong'", 'Hong Kong'),
+    ('Region', 'mars_colony', 'mars colony'),
+    ('Currency', 'cad', 'CAD'),
+    ('ItemType', 'final_sale_item', 'final sale'),
+    ('ItemType', 'face_mask', 'face mask'),
+    ('ReasonStructure', 'reason(hygiene)', 'for hygiene reasons'),
+    ('ReasonStructure', 'reason(odd_shape)', 'because of odd shape'),
+    ('ReasonStructure', 'includes([lithium_batteries, aerosols])',
+     'because dangerous goods (including lithium batteries and aerosols) are excluded'),
+])
+def test_phrase(var_name, value, expected):
+    assert phrase(var_name, value) == expected
+
+
+@pytest.mark.parametrize('phrases, expected', [
+    ([], ''),
+    (['local'], 'local'),
+    (['local', 'Quebec'], 'local or Quebec'),
+    (['a', 'b', 'c'], 'a, b, or c'),
+])
+def test_join_phrases(phrases, expected):
+    assert join_phrases(phrases) == expected
+
+
+def test_render_success_template():
+    answer = render_answer('get_return_window', {}, {'success': True, 'solutions': [{'Days': 30}]}, ['Days'])
+    assert answer == "You have 30 calendar days from the delivery date to request a return."
+
+
+def test_render_failure_template():
+    answer = render_answer('get_return_fee', {'Region': 'usa'}, {'success': False, 'solutions': []},
+                           ['Amount', 'Currency'])
+    assert answer == "There is no specific return fee listed for the USA."
+
+
+def test_render_excluded_item_names_the_type_once():
+    answer = render_answer('is_item_excluded', {'ItemType': 'final_sale_item'},
+                           {'success': True, 'solutions': [{'ReasonStructure': 'reason(marked_final_sale)'}]},
+                           ['ReasonStructure'])
+    assert answer == "No, final sale items can't be returned because they are marked Final Sale."
+
+
+def test_render_keyed_template_uses_first_output_value():
+    answer = render_answer('get_shipping_cost', {'Region': 'canada'},
+                           {'success': True, 'solutions': [{'Cost': "'free'"}]}, ['Cost'])
+    assert answer == "Return shipping is free for orders from Canada."
+
+
+def test_render_joins_distinct_solutions():
+    result = {'success': True, 'solutions': [
+        {'Method': 'via_order_history'}, {'Method': 'contact_customer_care'}, {'Method': 'via_order_history'}]}
+    answer = render_answer('get_initiation_method', {'UserType': 'general'}, result, ['Method'])
+    assert answer == ("To start a return, you can request it from the order history in your SSENSE account"
+                      " or contact Customer Care.")
+
+
+@pytest.mark.parametrize('predicate_name, args_dict, result, output_var_names', [
+    ('no_such_predicate', {}, {'success': True, 'solutions': [{}]}, []),
+    ('get_return_window', {}, {'success': True}, ['Days']),
+    ('get_return_window', {}, {'success': False, 'solutions': []}, ['Days']),
+    ('get_shipping_cost', {'Region': 'usa'}, {'success': True, 'solutions': [{'Cost': 'unknown'}]}, ['Cost']),
+    ('get_phone_number', {'PhoneType': 'local'}, {'success': True, 'solutions': [{'Number': '1'}]}, ['Number']),
+])
+def test_render_returns_none_without_a_matching_template(predicate_name, args_dict, result, output_var_names):
+    assert render_answer(predicate_name, args_dict, result, output_var_names) is None
+
@@ -0,0 +1,96 @@
+import pytest
+
+import nlu_cache
+from nlu_cache import MemoryNLUCache, SQLiteNLUCache, create_nlu_cache, normalize_question
+
+NLU_JSON = {'status': 'success', 'predicate': 'get_return_window', 'args': {}}
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(nlu_cache.time, 'time', fake)
+    return fake
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def cache(request, tmp_path, clock):
+    if request.param == 'memory':
+        return MemoryNLUCache(max_entries=2, ttl_seconds=60)
+    return SQLiteNLUCache(str(tmp_path / 'nlu_cache.sqlite3'), max_entries=2, ttl_seconds=60)
+
+
+@pytest.mark.parametrize('question, key', [
+    ("What's the Return   Window?", "whats the return window"),
+    ("Bought it twenty-one days ago", "bought it 21 days ago"),
+    ("Delivered TWO weeks ago!", "delivered 2 weeks ago"),
+    ("I’m in Canada", "im in canada"),
+])
+def test_normalize_question(question, key):
+    assert normalize_question(question) == key
+
+
+def test_vague_quantities_keep_their_own_key():
+    assert normalize_question("after a few days") == "after a few days"
+    assert normalize_question("after a couple of weeks") == "after a couple of weeks"
+    assert normalize_question("after a few days") != normalize_question("after 3 days")
+
+
+def test_hit_on_equivalent_question(cache):
+    cache.put("How long is the return window?", NLU_JSON)
+    assert cache.get("how long is the return window") == NLU_JSON
+    assert cache.get("How long is the exchange window?") is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['size']) == (1, 1, 1)
+
+
+def test_returned_value_is_a_copy(cache):
+    cache.put("return window", NLU_JSON)
+    cache.get("return window")['args']['Region'] = 'uk'
+    assert cache.get("return window") == NLU_JSON
+
+
+def test_entries_expire_after_ttl(cache, clock):
+    cache.put("return window", NLU_JSON)
+    clock.now += 59
+    assert cache.get("return window") == NLU_JSON
+    clock.now += 2
+    assert cache.get("return window") is None
+
+
+def test_least_recently_used_entry_is_evicted(cache, clock):
+    cache.put("first", NLU_JSON)
+    clock.now += 1
+    cache.put("second", NLU_JSON)
+    clock.now += 1
+    assert cache.get("first") == NLU_JSON
+    clock.now += 1
+    cache.put("third", NLU_JSON)
+    assert cache.get("second") is None
+    assert cache.get("first") == NLU_JSON
+    assert cache.get("third") == NLU_JSON
+    assert cache.stats()['evictions'] == 1
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path, clock):
+    path = str(tmp_path / 'shared.sqlite3')
+    SQLiteNLUCache(path).put("return window", NLU_JSON)
+    assert SQLiteNLUCache(path).get("Return window?") == NLU_JSON
+
+
+def test_create_nlu_cache(tmp_path):
+    assert create_nlu_cache('none', 10, 60) is None
+    assert isinstance(create_nlu_cache('memory', 10, 60), MemoryNLUCache)
+    assert isinstance(create_nlu_cache('sqlite', 10, 60, str(tmp_path / 'sub' / 'c.sqlite3')), SQLiteNLUCache)
+    with pytest.raises(ValueError):
+        create_nlu_cache('sqlite', 10, 60)
+    with pytest.raises(ValueError):
+        create_nlu_cache('redis', 10, 60)
@@ -0,0 +1,61 @@
+import json
+import os
+
+from policy_index import PolicyIndex, PolicyIndexLoader, index_terms
+
+SENTENCES = [
+    "Return shipping is free for orders shipped to Canada and the USA.",
+    "A return transportation fee is deducted from refunds for orders shipped to the UK.",
+    "Face masks and face coverings cannot be returned for hygiene reasons.",
+    "Please read ourPrivacy Policy for details.",
+    "Return shipping is free for orders shipped to Canada and the USA.",
+]
+
+
+def test_index_terms():
+    assert index_terms("Can I return my shoes?") == ['shoe']
+    assert index_terms("Please read ourPrivacy Policy") == ['read', 'privacy', 'policy']
+    assert index_terms("Is the glass box OK?") == ['glass', 'box', 'ok']
+
+
+def test_search_ranks_the_matching_sentence_first():
+    index = PolicyIndex(SENTENCES)
+    assert len(index.sentences) == 4
+    results = index.search("Do I pay a fee for returns from the UK?")
+    assert results[0]['id'] == 1
+    assert results[0]['text'] == SENTENCES[1]
+    assert [r['score'] for r in results] == sorted((r['score'] for r in results), reverse=True)
+
+
+def test_search_limits_and_filters_results():
+    index = PolicyIndex(SENTENCES)
+    assert len(index.search("shipping orders fee masks", k=2)) == 2
+    assert index.search("What's the weather on Mars?") == []
+    assert index.search("face masks", min_score=1000) == []
+    assert PolicyIndex([]).search("face masks") == []
+
+
+def test_from_file_skips_blank_and_non_text_entries(tmp_path):
+    sentences_file = tmp_path / 'kb_sentences.json'
+    sentences_file.write_text(json.dumps(SENTENCES[:2] + ['  ', 7, None]), encoding='utf-8')
+    index = PolicyIndex.from_file(str(sentences_file))
+    assert index.sentences == SENTENCES[:2]
+    assert index.version is not None
+
+
+def test_loader_rebuilds_only_when_the_file_changes(tmp_path):
+    sentences_file = tmp_path / 'kb_sentences.json'
+    loader = PolicyIndexLoader(str(sentences_file))
+    assert loader.current.sentences == []
+    assert loader.refresh() is False
+
+    sentences_file.write_text(json.dumps(SENTENCES[:1]), encoding='utf-8')
+    assert loader.refresh() is True
+    assert loader.refresh() is False
+    assert loader.current.search("free shipping to Canada")[0]['id'] == 0
+
+    sentences_file.write_text(json.dumps(SENTENCES[:3]), encoding='utf-8')
+    stat = os.stat(sentences_file)
+    os.utime(sentences_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert loader.refresh() is True
+    assert len(loader.current.sentences) == 3
@@ -0,0 +1,27 @@
+import threading
+
+import pytest
+
+from prolog_pool import LocalPrologEngine, PrologTimeout
+
+
+def test_overdue_query_is_aborted_and_frees_the_engine(engine):
+    with pytest.raises(PrologTimeout):
+        engine.query("repeat, fail.", timeout=0.2)
+    assert engine.query("get_return_window(Days).", timeout=1) == [{'Days': 30}]
+
+
+def test_deadline_keeps_every_solution(engine):
+    expected = engine.run_plan('get_initiation_method', ['guest'])
+    assert len(expected) == 3
+    assert engine.run_plan('get_initiation_method', ['guest'], timeout=1) == expected
+    assert engine.query("get_initiation_method(guest, Method).", timeout=1) == expected
+
+
+def test_waiting_for_a_busy_engine_times_out():
+    engine = LocalPrologEngine.__new__(LocalPrologEngine)
+    engine.query_timeout, engine.queue_timeout = None, 0.05
+    engine._lock = threading.Lock()
+    with engine._lock:
+        with pytest.raises(PrologTimeout):
+            engine.query("get_return_window(Days).")
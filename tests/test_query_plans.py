@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+from query_plans import QUERY_PLANS, normalize_input, to_term
+
+SAMPLE_ARGS = {
+    'ItemType': 'clothing',
+    'Condition': 'original',
+    'Packaging': 'original_intact',
+    'Tags': 'intact',
+    'DaysSinceDelivery': 10,
+    'Region': 'canada',
+    'UserType': 'general',
+    'PhoneType': 'local',
+    'Items': [['clothing', 'original', 'original_intact', 'intact', 10],
+              ['swimwear', 'original', 'original_intact', 'intact', 5]],
+}
+
+
+@pytest.mark.parametrize('value, term', [
+    ('canada', 'canada'),
+    (True, 'true'),
+    (False, 'false'),
+    (30, 30),
+    (30.0, 30),
+    ([['a', 1.0], 'b'], [['a', 1], 'b']),
+])
+def test_to_term_gives_types_pyswip_can_put(value, term):
+    assert to_term(value) == term
+    assert type(to_term(value)) is type(term)
+
+
+def test_normalize_input_rejects_fractional_numbers():
+    assert normalize_input([2.0, 'x']) == [2, 'x']
+    with pytest.raises(ValueError):
+        normalize_input(2.5)
+
+
+def test_bind_orders_and_checks_inputs():
+    plan = QUERY_PLANS['is_eligible']
+    args = dict(SAMPLE_ARGS, DaysSinceDelivery=10.0)
+    assert plan.bind(args) == ['clothing', 'original', 'original_intact', 'intact', 10]
+    with pytest.raises(ValueError):
+        plan.bind({'ItemType': 'clothing'})
+    with pytest.raises(ValueError):
+        plan.bind(dict(SAMPLE_ARGS, DaysSinceDelivery=1.5))
+
+
+def test_render():
+    assert QUERY_PLANS['get_return_fee'].render(['canada']) == "get_return_fee(canada, Amount, Currency)."
+    assert QUERY_PLANS['get_return_window'].render([]) == "get_return_window(Days)."
+
+
+@pytest.mark.parametrize('predicate_name', sorted(QUERY_PLANS))
+def test_every_plan_runs_like_its_query_text(engine, predicate_name):
+    plan = QUERY_PLANS[predicate_name]
+    input_values = plan.bind(SAMPLE_ARGS)
+    solutions = engine.run_plan(predicate_name, input_values)
+    assert solutions == engine.query(plan.render(input_values))
+
+
+def test_plan_runs_from_another_thread(engine):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(engine.run_plan('get_return_window', [])))
+    thread.start()
+    thread.join()
+    assert results == [engine.run_plan('get_return_window', [])]
+    assert results[0][0]['Days'] > 0
+
+
+def test_compound_result_keeps_its_atom_names(engine):
+    expected = 'includes([candle, fragrance, oil, pressurized_can, electronics_with_battery])'
+    plan = QUERY_PLANS['is_item_excluded']
+    input_values = plan.bind({'ItemType': 'dangerous_good'})
+    assert engine.run_plan('is_item_excluded', input_values) == [{'ReasonStructure': expected}]
+    assert engine.query(plan.render(input_values)) == [{'ReasonStructure': expected}]
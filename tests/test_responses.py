@@ -0,0 +1,62 @@
+import datetime
+import gzip
+
+import pytest
+
+brotli = pytest.importorskip('brotli')
+
+from responses import (accepted_encoding, compile_origins, compress, debug_flag, encode_json,  # noqa: E402
+                       origin_allowed, strip_debug)
+
+
+def test_encode_json():
+    payload = {'response': 'Café', 1: [True, None], 'at': datetime.date(2024, 5, 1)}
+    assert encode_json(payload) == '{"response":"Café","1":[true,null],"at":"2024-05-01"}'.encode('utf-8')
+
+
+def test_encode_json_stringifies_unknown_values():
+    class Version:
+        def __str__(self):
+            return 'v2'
+
+    assert encode_json({'kb': Version()}) == b'{"kb":"v2"}'
+
+
+@pytest.mark.parametrize('header, encoding', [
+    ('gzip, deflate, br', 'br'),
+    ('gzip', 'gzip'),
+    ('br;q=0, gzip;q=0.5', 'gzip'),
+    ('*', 'br'),
+    ('*;q=0', None),
+    ('identity', None),
+    ('gzip;q=bogus', None),
+    ('', None),
+    (None, None),
+])
+def test_accepted_encoding(header, encoding):
+    assert accepted_encoding(header) == encoding
+
+
+def test_compress_round_trips():
+    body = encode_json({'response': 'Return shipping is free. ' * 50})
+    assert gzip.decompress(compress(body, 'gzip')) == body
+    assert brotli.decompress(compress(body, 'br')) == body
+
+
+def test_origins_match_exactly_or_by_regex():
+    patterns = compile_origins(['http://localhost:3000', r'https://.*\.ssense\.com'])
+    assert origin_allowed('HTTP://LOCALHOST:3000', patterns)
+    assert origin_allowed('https://support.ssense.com', patterns)
+    assert not origin_allowed('http://localhost:3001', patterns)
+    assert not origin_allowed('https://ssense.com.evil.example', patterns)
+
+
+@pytest.mark.parametrize('value, enabled', [('1', True), (' TRUE ', True), ('yes', True), ('0', False), ('', False),
+                                            (None, False)])
+def test_debug_flag(value, enabled):
+    assert debug_flag(value) is enabled
+
+
+def test_strip_debug():
+    assert strip_debug({'response': 'ok', 'debug': {'nlu': {}}}, False) == {'response': 'ok'}
+    assert strip_debug({'response': 'ok', 'debug': {'nlu': {}}}, True) == {'response': 'ok', 'debug': {'nlu': {}}}
@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+import session_store
+from session_store import (SessionStore, apply_filled_slots, build_slot_messages, conversation_id_or_new,
+                           fill_slots_locally, parse_slot_output)
+
+PENDING = {
+    'predicate': 'is_eligible',
+    'args': {'ItemType': 'clothing', 'Condition': 'original', 'Packaging': 'original_intact', 'Tags': 'intact'},
+    'missing_args': ['DaysSinceDelivery'],
+    'clarification_question': "When was it delivered?",
+}
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(session_store.time, 'time', fake)
+    return fake
+
+
+@pytest.mark.parametrize('conversation_id, kept', [
+    ('abc-123_X', True),
+    ('', False),
+    ('has space', False),
+    ('x' * 65, False),
+    (42, False),
+    (None, False),
+])
+def test_conversation_id_or_new(conversation_id, kept):
+    result = conversation_id_or_new(conversation_id)
+    assert (result == conversation_id) is kept
+    assert session_store.CONVERSATION_ID_RE.match(result)
+
+
+@pytest.mark.parametrize('reply, filled', [
+    ("It arrived 2 weeks ago", {'DaysSinceDelivery': 14}),
+    ("about 12", {'DaysSinceDelivery': 12}),
+    ("not sure", {}),
+])
+def test_fill_slots_locally(reply, filled):
+    assert fill_slots_locally(PENDING, reply) == filled
+
+
+def test_parse_slot_output_keeps_only_missing_arguments():
+    raw = json.dumps({'args': {'DaysSinceDelivery': '9', 'Region': 'usa'}})
+    assert parse_slot_output(PENDING, raw) == {'DaysSinceDelivery': 9}
+    assert parse_slot_output(PENDING, json.dumps({'args': {'DaysSinceDelivery': 'soon'}})) == {}
+    assert parse_slot_output(PENDING, 'not json') == {}
+
+
+def test_apply_filled_slots():
+    nlu_json = apply_filled_slots(PENDING, {'DaysSinceDelivery': 9}, 'local')
+    assert nlu_json == {'status': 'success', 'predicate': 'is_eligible', 'source': 'local',
+                        'args': dict(PENDING['args'], DaysSinceDelivery=9)}
+    still_missing = apply_filled_slots(PENDING, {}, 'none')
+    assert still_missing['status'] == 'missing_info'
+    assert still_missing['missing_args'] == ['DaysSinceDelivery']
+    assert still_missing['clarification_question'] == session_store.SLOT_QUESTIONS['DaysSinceDelivery']
+
+
+def test_build_slot_messages():
+    messages = build_slot_messages('PROMPT', PENDING, 'yesterday')
+    assert messages[0] == {'role': 'system', 'content': 'PROMPT'}
+    assert json.loads(messages[1]['content'])['reply'] == 'yesterday'
+
+
+def test_store_expires_entries(clock):
+    store = SessionStore(max_entries=10, ttl_seconds=60)
+    store.put('c1', PENDING)
+    clock.now += 59
+    assert store.get('c1') is PENDING
+    clock.now += 2
+    assert store.get('c1') is None
+    assert store.stats()['expirations'] == 1
+
+
+def test_store_evicts_least_recently_used(clock):
+    store = SessionStore(max_entries=2, ttl_seconds=60)
+    store.put('c1', PENDING)
+    store.put('c2', PENDING)
+    store.get('c1')
+    store.put('c3', PENDING)
+    assert store.get('c2') is None
+    assert store.get('c1') is PENDING
+    assert store.stats()['evictions'] == 1
+
+
+def test_store_pop_and_fill_counts(clock):
+    store = SessionStore()
+    store.put('c1', PENDING)
+    store.pop('c1')
+    store.pop('missing')
+    store.record_fill('local')
+    store.record_fill('local')
+    assert store.get('c1') is None
+    assert store.stats()['fills'] == {'local': 2}
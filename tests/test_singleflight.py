@@ -0,0 +1,152 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from singleflight import AsyncSingleFlight, SingleFlight, SingleFlightAbandoned, flight_key
+
+
+def wait_for_leader(flight, key):
+    deadline = time.time() + 5
+    while key not in flight._calls:
+        assert time.time() < deadline, "leader never started"
+        time.sleep(0.001)
+
+
+def start_follower(call):
+    results = []
+
+    def run():
+        try:
+            results.append(call())
+        except Exception as e:
+            results.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, results
+
+
+def test_flight_key_ignores_dict_order():
+    assert flight_key('p', {'a': 1, 'b': 2}) == flight_key('p', {'b': 2, 'a': 1})
+    assert flight_key('p', {'a': 1}) != flight_key('q', {'a': 1})
+
+
+def test_do_coalesces_identical_calls():
+    flight = SingleFlight('test')
+    release = threading.Event()
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        release.wait(5)
+        return {'answer': value}
+
+    leader, leader_results = start_follower(lambda: flight.do('k', slow, 1))
+    wait_for_leader(flight, 'k')
+    follower, follower_results = start_follower(lambda: flight.do('k', slow, 2))
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert calls == [1]
+    assert leader_results == follower_results == [{'answer': 1}]
+    assert follower_results[0] is not leader_results[0]
+    assert flight.do('k', slow, 3) == {'answer': 3}
+
+
+def test_do_reraises_the_leaders_exception():
+    flight = SingleFlight('test')
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise RuntimeError('upstream down')
+
+    leader, leader_results = start_follower(lambda: flight.do('k', failing))
+    wait_for_leader(flight, 'k')
+    follower, follower_results = start_follower(lambda: flight.do('k', failing))
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert [type(r) for r in leader_results + follower_results] == [RuntimeError, RuntimeError]
+
+
+def test_waiter_gives_up_after_timeout():
+    flight = SingleFlight('test', timeout=0.05)
+    release = threading.Event()
+    leader, _ = start_follower(lambda: flight.do('k', release.wait, 5))
+    wait_for_leader(flight, 'k')
+    with pytest.raises(concurrent.futures.TimeoutError):
+        flight.do('k', release.wait, 5)
+    release.set()
+    leader.join()
+
+
+def test_stream_shares_the_leaders_chunks():
+    flight = SingleFlight('test')
+    release = threading.Event()
+
+    def chunks():
+        yield 'Hello'
+        release.wait(5)
+        yield ' world '
+
+    stream = flight.stream('k', chunks)
+    assert next(stream) == 'Hello'
+    follower, follower_results = start_follower(lambda: list(flight.stream('k', chunks)))
+    time.sleep(0.05)
+    release.set()
+    assert list(stream) == [' world ']
+    follower.join()
+
+    assert follower_results == [['Hello world']]
+    assert 'k' not in flight._calls
+
+
+def test_abandoned_stream_releases_its_waiters():
+    flight = SingleFlight('test')
+    stream = flight.stream('k', lambda: iter(['a', 'b']))
+    next(stream)
+    follower, follower_results = start_follower(lambda: flight.do('k', lambda: 'own call'))
+    time.sleep(0.05)
+    stream.close()
+    follower.join()
+
+    assert [type(r) for r in follower_results] == [SingleFlightAbandoned]
+
+
+def test_async_do_coalesces_and_reports_cancellation():
+    async def scenario():
+        flight = AsyncSingleFlight('test')
+        release = asyncio.Event()
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await release.wait()
+            return ['answer']
+
+        leader = asyncio.create_task(flight.do('k', slow))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do('k', slow))
+        await asyncio.sleep(0)
+        release.set()
+        assert await leader == await follower == ['answer']
+        assert calls == [1]
+
+        release.clear()
+        leader = asyncio.create_task(flight.do('k', slow))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do('k', slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(SingleFlightAbandoned):
+            await follower
+
+    asyncio.run(scenario())
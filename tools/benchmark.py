@@ -0,0 +1,296 @@
+# Offline benchmark for the chat API: replays a question corpus at several concurrency levels
+# against a backend wired to tools/mock_openai.py, and compares the results with a saved baseline.
+#
+# Usage (from the repository root):
+#   python tools/benchmark.py --start-mock --start-backend --concurrency 1,8,32 --requests 200 \
+#       --save-baseline bench_baseline.json
+#   python tools/benchmark.py --start-mock --start-backend --concurrency 1,8,32 --requests 200 \
+#       --compare bench_baseline.json
+#
+# --start-mock runs the stub in this process; --start-backend launches backend/app.py (or
+# `uvicorn --factory asgi_app:create_app` with --server asgi) with OPENAI_BASE_URL pointing at it, and by default
+# disables the NLU cache, local router and answer table so every request takes the LLM round-trips.
+# Per-stage timings come from the Server-Timing header of each response.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from metrics import percentile # noqa: E402
+from mock_openai import MockOpenAIServer # noqa: E402
+DEFAULT_CORPUS = os.path.join(BACKEND_DIR, 'router_training.json')
+# Backend settings for a run where every request reaches the (mock) LLM.
+BENCHMARK_BACKEND_ENV = {
+    'OPENAI_API_KEY': 'mock',
+    'NLU_CACHE_BACKEND': 'none',
+    'NLU_ROUTER_ENABLED': 'false',
+    'ANSWER_TABLE_MODE': 'off',
+    'NLG_ENGINE': 'llm',
+    'SINGLE_FLIGHT_ENABLED': 'false',
+    'LOG_LEVEL': 'WARNING',
+}
+# Metrics compared against the baseline; +1 means higher is better, -1 lower is better.
+COMPARED_METRICS = [
+    ('requests_per_second', +1),
+    ('latency_ms.p50', -1),
+    ('latency_ms.p95', -1),
+    ('latency_ms.p99', -1),
+]
+
+
+def load_corpus(path):
+    """Questions from a .txt (one per line), .jsonl or .json file of strings or {"question"/"message": ...} objects."""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.txt'):
+            return [line.strip() for line in f if line.strip()]
+        if path.endswith('.jsonl'):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = json.load(f)
+    questions = []
+    for record in records:
+        if isinstance(record, str):
+            questions.append(record)
+        elif isinstance(record, dict) and (record.get('question') or record.get('message')):
+            questions.append(record.get('question') or record.get('message'))
+    if not questions:
+        raise ValueError(f"No questions found in corpus '{path}'.")
+    return questions
+
+
+def parse_server_timing(header):
+    """'nlu;dur=812.3, prolog;dur=1.2' -> {'nlu': 812.3, 'prolog': 1.2}."""
+    stages = {}
+    for entry in filter(None, (part.strip() for part in header.split(','))):
+        name, *params = [p.strip() for p in entry.split(';')]
+        for param in params:
+            key, _, value = param.partition('=')
+            if key == 'dur':
+                try:
+                    stages[name] = float(value)
+                except ValueError:
+                    pass
+    return stages
+
+
+def summarize_ms(values):
+    return {
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'mean': sum(values) / len(values) if values else 0.0,
+    }
+
+
+async def run_level(client, url, questions, concurrency, total_requests):
+    latencies = []
+    stage_timings = defaultdict(list)
+    statuses = Counter()
+    next_request = 0
+
+    async def worker():
+        nonlocal next_request
+        while next_request < total_requests:
+            question = questions[next_request % len(questions)]
+            next_request += 1
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, json={'message': question})
+                statuses[response.status_code] += 1
+                for name, ms in parse_server_timing(response.headers.get('server-timing', '')).items():
+                    stage_timings[name].append(ms)
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies_ms = [s * 1000 for s in latencies]
+    return {
+        'requests': len(latencies),
+        'concurrency': concurrency,
+        'elapsed_seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'latency_ms': dict(summarize_ms(latencies_ms), max=max(latencies_ms) if latencies_ms else 0.0),
+        'stages_ms': {name: summarize_ms(values) for name, values in sorted(stage_timings.items())},
+        'statuses': {str(k): v for k, v in statuses.items()},
+    }
+
+
+async def run_benchmark(url, questions, levels, total_requests, warmup, timeout):
+    max_connections = max(levels)
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        if warmup:
+            await run_level(client, url, questions, min(warmup, max_connections), warmup)
+        reports = {}
+        for concurrency in levels:
+            reports[str(concurrency)] = await run_level(client, url, questions, concurrency, total_requests)
+            print_level(reports[str(concurrency)])
+        return reports
+
+
+def print_level(report):
+    latency = report['latency_ms']
+    print(f"\nConcurrency {report['concurrency']}: {report['requests']} requests in {report['elapsed_seconds']:.2f}s, "
+          f"{report['requests_per_second']:.1f} req/s")
+    print(f"  Latency: p50 {latency['p50']:.0f} ms, p95 {latency['p95']:.0f} ms, p99 {latency['p99']:.0f} ms, "
+          f"max {latency['max']:.0f} ms")
+    for name, stage in report['stages_ms'].items():
+        print(f"  {name:<12} p50 {stage['p50']:8.1f} ms  p95 {stage['p95']:8.1f} ms  mean {stage['mean']:8.1f} ms")
+    print(f"  Status codes: {report['statuses']}")
+
+
+def metric_value(report, dotted_name):
+    value = report
+    for part in dotted_name.split('.'):
+        value = value[part]
+    return value
+
+
+def compare_with_baseline(levels, baseline, tolerance):
+    """Prints metric deltas per concurrency level. Returns the list of regressions beyond tolerance."""
+    regressions = []
+    print(f"\nComparison with baseline from {baseline.get('created_at', 'unknown date')} (tolerance {tolerance:.0%}):")
+    for level, report in levels.items():
+        base = baseline.get('levels', {}).get(level)
+        if base is None:
+            print(f"  concurrency {level}: no baseline")
+            continue
+        for name, direction in COMPARED_METRICS:
+            current, previous = metric_value(report, name), metric_value(base, name)
+            change = (current - previous) / previous if previous else 0.0
+            regressed = change * direction < -tolerance
+            marker = 'REGRESSION' if regressed else ''
+            print(f"  concurrency {level:>4} {name:<20} {previous:10.1f} -> {current:10.1f} ({change:+.1%}) {marker}")
+            if regressed:
+                regressions.append((level, name, previous, current))
+    return regressions
+
+
+def start_mock(port, latency_ms, jitter_ms):
+    server = MockOpenAIServer(latency_ms, jitter_ms)
+    threading.Thread(target=lambda: asyncio.run(server.serve('127.0.0.1', port)), name="mock-openai", daemon=True).start()
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def start_backend(server_kind, port, openai_base_url, env_overrides):
+    env = dict(os.environ, **BENCHMARK_BACKEND_ENV, OPENAI_BASE_URL=openai_base_url, PORT=str(port))
+    env.update(env_overrides)
+    if server_kind == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', '--factory', 'asgi_app:create_app', '--port', str(port), '--log-level', 'warning']
+    else:
+        command = [sys.executable, 'app.py']
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+
+
+def wait_until_ready(base_url, process, startup_timeout):
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Backend exited during startup with code {process.returncode}.")
+        try:
+            if httpx.get(f"{base_url}/api/chat/welcome", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Backend at {base_url} was not ready after {startup_timeout}s.")
+
+
+def parse_env_overrides(items):
+    overrides = {}
+    for item in items or []:
+        name, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError(f"--backend-env expects NAME=VALUE, got '{item}'.")
+        overrides[name] = value
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for /api/chat against the mock OpenAI server.")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help="Question corpus (.json, .jsonl or .txt)")
+    parser.add_argument('--concurrency', default='1,8,32', help="Comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument('--warmup', type=int, default=20, help="Unmeasured requests sent before the first level")
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--port', type=int, default=5001, help="Backend port")
+    parser.add_argument('--start-mock', action='store_true', help="Run tools/mock_openai.py in this process")
+    parser.add_argument('--mock-port', type=int, default=8100)
+    parser.add_argument('--latency-ms', type=float, default=800, help="Mock OpenAI latency")
+    parser.add_argument('--jitter-ms', type=float, default=100, help="Mock OpenAI latency jitter")
+    parser.add_argument('--start-backend', action='store_true', help="Launch the backend pointed at the mock")
+    parser.add_argument('--server', choices=['flask', 'asgi'], default='flask')
+    parser.add_argument('--backend-env', action='append', metavar='NAME=VALUE',
+                        help="Extra backend environment setting (repeatable), e.g. NLG_ENGINE=template")
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    parser.add_argument('--json', dest='json_out', help="Write the full report to this file")
+    parser.add_argument('--save-baseline', help="Store this run as the baseline file")
+    parser.add_argument('--compare', help="Baseline file to compare this run against")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    questions = load_corpus(args.corpus)
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+    base_url = f"http://127.0.0.1:{args.port}"
+    openai_base_url = os.environ.get('OPENAI_BASE_URL', f"http://127.0.0.1:{args.mock_port}/v1")
+    if args.start_mock:
+        openai_base_url = start_mock(args.mock_port, args.latency_ms, args.jitter_ms)
+
+    process = None
+    try:
+        if args.start_backend:
+            process = start_backend(args.server, args.port, openai_base_url, parse_env_overrides(args.backend_env))
+        wait_until_ready(base_url, process, args.startup_timeout)
+        print(f"Replaying {len(questions)} questions from {args.corpus} against {base_url}/api/chat")
+        reports = asyncio.run(run_benchmark(f"{base_url}/api/chat", questions, levels, args.requests,
+                                            args.warmup, args.timeout))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    result = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {
+            'server': args.server, 'corpus': os.path.basename(args.corpus), 'requests': args.requests,
+            'mock_latency_ms': args.latency_ms if args.start_mock else None,
+            'mock_jitter_ms': args.jitter_ms if args.start_mock else None,
+            'backend_env': parse_env_overrides(args.backend_env), 'python': platform.python_version(),
+        },
+        'levels': reports,
+    }
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('config', {}).get('server') != args.server:
+            print(f"Warning: baseline was recorded against the {baseline.get('config', {}).get('server')} server.")
+        regressions = compare_with_baseline(reports, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed beyond {args.tolerance:.0%}.")
+            sys.exit(1)
+        print("\nNo regressions beyond tolerance.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Concurrent load test for the chat API.
+#
+# Usage:
+#   python tools/load_test.py --url http://127.0.0.1:5001/api/chat --concurrency 200 --requests 2000
+#
+# Point the backend at tools/mock_openai.py so no API credits are spent, and disable the
+# NLU cache, local router and answer table so every request exercises the LLM round-trips:
+#   OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=mock NLU_CACHE_BACKEND=none \
+#   NLU_ROUTER_ENABLED=false ANSWER_TABLE_MODE=off NLG_ENGINE=llm uvicorn --factory asgi_app:create_app --port 5001
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from metrics import percentile # noqa: E402
+
+
+async def run_load(url, questions, concurrency, total_requests, timeout):
+    latencies = []
+    statuses = Counter()
+    next_request = 0
+
+    async def worker(client):
+        nonlocal next_request
+        while next_request < total_requests:
+            question = questions[next_request % len(questions)]
+            next_request += 1
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, json={'message': question})
+                statuses[response.status_code] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'concurrency': concurrency,
+        'elapsed_seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'latency_ms': {
+            'p50': percentile(latencies, 50) * 1000,
+            'p95': percentile(latencies, 95) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'max': max(latencies) * 1000 if latencies else 0.0,
+        },
+        'statuses': {str(k): v for k, v in statuses.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for /api/chat.")
+    parser.add_argument('--url', default='http://127.0.0.1:5001/api/chat')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--question', action='append',
+                        help="Question to send (repeatable); defaults to a return shipping question")
+    parser.add_argument('--json', dest='json_out', help="Write the report to this file")
+    args = parser.parse_args()
+
+    questions = args.question or ["Is return shipping free for me here?"]
+    report = asyncio.run(run_load(args.url, questions, args.concurrency, args.requests, args.timeout))
+
+    latency = report['latency_ms']
+    print(f"{report['requests']} requests at concurrency {report['concurrency']} in {report['elapsed_seconds']:.2f}s")
+    print(f"Throughput: {report['requests_per_second']:.1f} req/s")
+    print(f"Latency: p50 {latency['p50']:.0f} ms, p95 {latency['p95']:.0f} ms, "
+          f"p99 {latency['p99']:.0f} ms, max {latency['max']:.0f} ms")
+    print(f"Status codes: {report['statuses']}")
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
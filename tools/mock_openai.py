@@ -0,0 +1,209 @@
+# Local OpenAI-compatible stub for load tests: serves /v1/chat/completions with canned output.
+#
+# Usage:
+#   python tools/mock_openai.py --port 8100 --latency-ms 800 --jitter-ms 200
+# then start the backend with OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=mock
+#
+# NLU requests get a canned success for the predicate the question's keywords point to (any
+# predicate in ALLOWED_PREDICATES, with fixed argument values), so a varied question corpus
+# exercises every query plan. NLG requests get a canned sentence naming the predicate.
+# --slow-rate/--slow-ms add a latency tail for hedging, and --invalid-nlu-rate makes NLU calls on
+# --invalid-nlu-model return output that fails schema validation, to exercise escalation.
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import zlib
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from intent_router import PREDICATE_KEYWORD_RES # noqa: E402
+from kb_schema import ALLOWED_PREDICATES, PREDICATE_INPUT_ARGS # noqa: E402
+from nlu_cache import normalize_question # noqa: E402
+
+CANNED_ARG_VALUES = {
+    'ItemType': 'shoes',
+    'Condition': 'original',
+    'Packaging': 'original_intact',
+    'Tags': 'intact',
+    'DaysSinceDelivery': 10,
+    'Region': 'uk',
+    'UserType': 'guest',
+    'PhoneType': 'north_america_toll_free',
+}
+CANNED_NLU = {
+    predicate: {"status": "success", "predicate": predicate,
+                "args": {name: CANNED_ARG_VALUES[name] for name in PREDICATE_INPUT_ARGS[predicate]}}
+    for predicate in ALLOWED_PREDICATES
+}
+CANNED_NLG = "Here is what the return policy says about your question."
+INVALID_NLU = {"status": "success", "predicate": "get_refund_status", "args": {}}
+
+
+def pick_predicate(question, forced=None):
+    """Forced predicate, else the first keyword match, else a stable hash of the question."""
+    if forced:
+        return forced
+    text = normalize_question(question)
+    for predicate, pattern in PREDICATE_KEYWORD_RES.items():
+        if pattern.search(text):
+            return predicate
+    return ALLOWED_PREDICATES[zlib.crc32(text.encode('utf-8')) % len(ALLOWED_PREDICATES)]
+
+
+def is_json_request(request):
+    return (request.get('response_format') or {}).get('type') == 'json_object'
+
+
+def parse_json_object(text):
+    try:
+        value = json.loads(text)
+    except (TypeError, ValueError):
+        return {}
+    return value if isinstance(value, dict) else {}
+
+
+class MockOpenAIServer:
+    """Minimal asyncio HTTP/1.1 server answering chat completion requests after a simulated delay."""
+
+    def __init__(self, latency_ms=800, jitter_ms=0, nlu_latency_ms=None, nlg_latency_ms=None, predicate=None,
+                 slow_rate=0.0, slow_ms=0, invalid_nlu_rate=0.0, invalid_nlu_model=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.nlu_latency_ms = latency_ms if nlu_latency_ms is None else nlu_latency_ms
+        self.nlg_latency_ms = latency_ms if nlg_latency_ms is None else nlg_latency_ms
+        self.predicate = predicate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.invalid_nlu_rate = invalid_nlu_rate
+        self.invalid_nlu_model = invalid_nlu_model
+        self.requests_served = 0
+
+    def delay(self, request):
+        latency_ms = self.nlu_latency_ms if is_json_request(request) else self.nlg_latency_ms
+        if self.slow_rate and random.random() < self.slow_rate:
+            latency_ms += self.slow_ms
+        return max(0.0, latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    def completion_content(self, request):
+        user_content = next((m.get('content', '') for m in reversed(request.get('messages', []))
+                             if m.get('role') == 'user'), '')
+        context = parse_json_object(user_content)
+        if is_json_request(request):
+            if 'missing_args' in context and 'reply' in context:
+                # Slot-only clarification call: fill every missing argument with its canned value.
+                return json.dumps({'args': {name: CANNED_ARG_VALUES[name] for name in context['missing_args']
+                                            if name in CANNED_ARG_VALUES}})
+            if (self.invalid_nlu_rate and request.get('model') == (self.invalid_nlu_model or request.get('model'))
+                    and random.random() < self.invalid_nlu_rate):
+                return json.dumps(INVALID_NLU)
+            return json.dumps(CANNED_NLU[pick_predicate(user_content, self.predicate)])
+        predicate = (context.get('kb_query') or {}).get('predicate_called')
+        return f"{CANNED_NLG} ({predicate})" if predicate else CANNED_NLG
+
+    def completion(self, request, content):
+        prompt_tokens = sum(len(str(m.get('content', '')).split()) for m in request.get('messages', []))
+        completion_tokens = len(content.split())
+        return {
+            'id': f"chatcmpl-mock-{self.requests_served}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'mock'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens},
+        }
+
+    def stream_chunks(self, request, content):
+        words = content.split(' ')
+        for i, word in enumerate(words):
+            chunk = {
+                'id': f"chatcmpl-mock-{self.requests_served}",
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': request.get('model', 'mock'),
+                'choices': [{'index': 0, 'delta': {'content': word if i == 0 else f" {word}"}, 'finish_reason': None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode('latin-1').split("\r\n")
+                method, path, _ = request_line.split(' ', 2)
+                headers = {}
+                for line in header_lines:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                await self.respond(method, path, body, writer)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method, path, body, writer):
+        if method != 'POST' or not path.rstrip('/').endswith('/chat/completions'):
+            payload = json.dumps({'error': {'message': 'not found'}}).encode()
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Type: application/json\r\n"
+                         + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+            await writer.drain()
+            return
+
+        request = json.loads(body or b'{}')
+        await asyncio.sleep(self.delay(request))
+        self.requests_served += 1
+        content = self.completion_content(request)
+        if request.get('stream'):
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+            for chunk in self.stream_chunks(request, content):
+                writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+        else:
+            payload = json.dumps(self.completion(request, content)).encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+        await writer.drain()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        print(f"Mock OpenAI server listening on http://{host}:{port}/v1 "
+              f"(NLU latency {self.nlu_latency_ms} ms, NLG latency {self.nlg_latency_ms} ms, jitter {self.jitter_ms} ms)")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub for load tests.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency-ms', type=float, default=800)
+    parser.add_argument('--jitter-ms', type=float, default=0,
+                        help="Each response is delayed by its latency plus a uniform offset in [-jitter, +jitter]")
+    parser.add_argument('--nlu-latency-ms', type=float, help="Latency of JSON-mode (NLU) calls; defaults to --latency-ms")
+    parser.add_argument('--nlg-latency-ms', type=float, help="Latency of text (NLG) calls; defaults to --latency-ms")
+    parser.add_argument('--predicate', choices=ALLOWED_PREDICATES,
+                        help="Answer every NLU call with this predicate instead of picking one per question")
+    parser.add_argument('--slow-rate', type=float, default=0, help="Fraction of responses delayed by an extra --slow-ms")
+    parser.add_argument('--slow-ms', type=float, default=5000)
+    parser.add_argument('--invalid-nlu-rate', type=float, default=0,
+                        help="Fraction of NLU calls answered with a predicate outside the schema")
+    parser.add_argument('--invalid-nlu-model', help="Only return invalid NLU output to this model (default: any model)")
+    args = parser.parse_args()
+    server = MockOpenAIServer(args.latency_ms, args.jitter_ms, args.nlu_latency_ms, args.nlg_latency_ms, args.predicate,
+                              args.slow_rate, args.slow_ms, args.invalid_nlu_rate, args.invalid_nlu_model)
+    asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Local stand-in for the SSENSE return policy page, for testing tools/scrapper.py offline.
+#
+# Usage:
+#   python tools/mock_policy_page.py page.html --port 8200
+#   python tools/scrapper.py --url http://127.0.0.1:8200/ --snapshot /tmp/kb_sentences.json --state /tmp/state.json
+#
+# Serves the saved HTML file (e.g. one written by scrapper.py --save-html) at every path, with an
+# ETag of its content and a Last-Modified of its mtime, and answers matching conditional GETs with
+# 304. The file is re-read on each request, so editing it simulates a policy change.
+import argparse
+import hashlib
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(html_path):
+    class PolicyPageHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with open(html_path, 'rb') as f:
+                body = f.read()
+            mtime = int(os.path.getmtime(html_path))
+            etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+            if self.not_modified(etag, mtime):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', formatdate(mtime, usegmt=True))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def not_modified(self, etag, mtime):
+            # If-None-Match takes precedence over If-Modified-Since (RFC 9110, 13.2.2).
+            if_none_match = self.headers.get('If-None-Match')
+            if if_none_match:
+                return etag in [tag.strip() for tag in if_none_match.split(',')]
+            if_modified_since = self.headers.get('If-Modified-Since')
+            if if_modified_since:
+                try:
+                    return mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+                except (TypeError, ValueError):
+                    return False
+            return False
+
+        def log_message(self, format, *args):
+            print(f"{self.command} {self.path} -> {args[1] if len(args) > 1 else ''}")
+
+    return PolicyPageHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a saved policy page with ETag/Last-Modified support.")
+    parser.add_argument('html', help="Saved HTML of the policy page")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8200)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(os.path.abspath(args.html)))
+    print(f"Serving {args.html} on http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# Offline comparison of the full and narrowed NLU prompts (NLU_PROMPT_MODE=full / narrow).
+#
+# Usage (from the repository root):
+#   python tools/nlu_prompt_eval.py [--corpus backend/router_training.json] [--json report.json] [--verbose]
+#   python tools/nlu_prompt_eval.py --corpus backend/nlu_log.jsonl --llm --model gpt-4o-mini --limit 50
+#
+# Without --llm nothing is sent anywhere: for each question it builds both prompts and reports their
+# estimated size and whether the narrowed prompt still details the expected predicate (recall). The
+# pre-ranker is retrained without the question being scored, so questions from the training file
+# are not ranked in-sample. With --llm each prompt is sent to the model (OPENAI_API_KEY /
+# OPENAI_BASE_URL, so tools/mock_openai.py works too), and the report adds predicate accuracy,
+# latency and the prompt/cached token counts from the API usage field.
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from intent_router import OFF_TOPIC_LABEL, IntentRouter, NaiveBayesIntentModel, load_policy_vocabulary, load_training_examples # noqa: E402
+from kb_schema import ALLOWED_PREDICATES, PREDICATE_INPUT_ARGS, PREDICATE_OUTPUT_VARS # noqa: E402
+from metrics import percentile # noqa: E402
+from nlu_prompt_builder import NLUPromptBuilder # noqa: E402
+
+MODES = ('full', 'narrow')
+
+
+def load_corpus(path):
+    """(question, expected label) pairs from router_training.json or an NLU_LOG_FILE JSONL log."""
+    if path.endswith('.jsonl'):
+        corpus = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                nlu = record.get('nlu') or {}
+                if nlu.get('status') == 'off_topic':
+                    corpus.append((record['question'], OFF_TOPIC_LABEL))
+                elif nlu.get('predicate') in ALLOWED_PREDICATES:
+                    corpus.append((record['question'], nlu['predicate']))
+        return corpus
+    with open(path, encoding='utf-8') as f:
+        return [(item['question'], item['predicate']) for item in json.load(f)]
+
+
+class LeaveOneOutRanker:
+    """IntentRouter.rank_predicates from a model trained without the question being ranked."""
+
+    def __init__(self, examples, policy_vocabulary):
+        self.examples = examples
+        self.policy_vocabulary = policy_vocabulary
+        self.shared = self.router_for(examples)
+
+    def router_for(self, examples):
+        return IntentRouter(NaiveBayesIntentModel().fit(examples), self.policy_vocabulary, PREDICATE_INPUT_ARGS)
+
+    def __call__(self, question):
+        if any(q == question for q, _ in self.examples):
+            return self.router_for([e for e in self.examples if e[0] != question]).rank_predicates(question)
+        return self.shared.rank_predicates(question)
+
+
+def ask_llm(client, model, system_prompt, question):
+    started = time.perf_counter()
+    response = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": question}],
+        temperature=0.1,
+        response_format={"type": "json_object"},
+    )
+    latency_ms = (time.perf_counter() - started) * 1000
+    try:
+        nlu = json.loads(response.choices[0].message.content)
+    except (TypeError, ValueError):
+        nlu = {}
+    label = OFF_TOPIC_LABEL if nlu.get('status') == 'off_topic' else nlu.get('predicate')
+    usage = response.usage
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return label, latency_ms, getattr(usage, 'prompt_tokens', 0) or 0, getattr(details, 'cached_tokens', 0) or 0
+
+
+def evaluate(builder, corpus, client=None, model=None, verbose=False):
+    rows = []
+    for question, expected in corpus:
+        row = {'question': question, 'expected': expected}
+        for mode in MODES:
+            started = time.perf_counter()
+            system_prompt, info = builder.build(question, mode)
+            row[mode] = {
+                'estimated_tokens': info['estimated_tokens'],
+                'predicates': len(info['predicates']),
+                'build_ms': round((time.perf_counter() - started) * 1000, 4),
+                'covers_expected': expected == OFF_TOPIC_LABEL or expected in info['predicates'],
+            }
+            if client:
+                label, latency_ms, prompt_tokens, cached_tokens = ask_llm(client, model, system_prompt, question)
+                row[mode].update({'answer': label, 'correct': label == expected, 'latency_ms': round(latency_ms, 1),
+                                  'prompt_tokens': prompt_tokens, 'cached_tokens': cached_tokens})
+        if verbose:
+            narrow = row['narrow']
+            marker = 'OK ' if narrow['covers_expected'] else 'XX '
+            answers = f" full={row['full']['answer']} narrow={narrow['answer']}" if client else ''
+            print(f"{marker}{narrow['predicates']:>2} predicates ~{narrow['estimated_tokens']} tokens | "
+                  f"{question!r} -> {expected}{answers}")
+        rows.append(row)
+
+    summary = {'questions': len(rows)}
+    on_topic = [r for r in rows if r['expected'] != OFF_TOPIC_LABEL]
+    for mode in MODES:
+        tokens = [r[mode]['estimated_tokens'] for r in rows]
+        build_ms = [r[mode]['build_ms'] for r in rows]
+        mode_summary = {
+            'estimated_tokens': {'mean': statistics.mean(tokens) if tokens else 0.0,
+                                 'p50': percentile(tokens, 50), 'p95': percentile(tokens, 95)},
+            'predicates_mean': statistics.mean(r[mode]['predicates'] for r in rows) if rows else 0.0,
+            'recall': sum(r[mode]['covers_expected'] for r in on_topic) / len(on_topic) if on_topic else 0.0,
+            'build_ms_p95': percentile(build_ms, 95),
+        }
+        if client:
+            latencies = [r[mode]['latency_ms'] for r in rows]
+            mode_summary.update({
+                'accuracy': sum(r[mode]['correct'] for r in rows) / len(rows) if rows else 0.0,
+                'latency_ms': {'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95)},
+                'prompt_tokens_mean': statistics.mean(r[mode]['prompt_tokens'] for r in rows) if rows else 0.0,
+                'cached_tokens_mean': statistics.mean(r[mode]['cached_tokens'] for r in rows) if rows else 0.0,
+            })
+        summary[mode] = mode_summary
+    return summary, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the full and narrowed NLU prompts.")
+    parser.add_argument('--corpus', default=os.path.join(BACKEND_DIR, 'router_training.json'),
+                        help="router_training.json-style list or NLU_LOG_FILE JSONL")
+    parser.add_argument('--training-file', default=os.path.join(BACKEND_DIR, 'router_training.json'))
+    parser.add_argument('--kb-sentences', default=os.path.join(BACKEND_DIR, '..', 'tools', 'kb_sentences.json'))
+    parser.add_argument('--prompt-file', default=os.path.join(BACKEND_DIR, 'nlu_prompt.txt'))
+    parser.add_argument('--max-predicates', type=int, default=4)
+    parser.add_argument('--coverage', type=float, default=0.95)
+    parser.add_argument('--llm', action='store_true', help="Also send both prompts to the model")
+    parser.add_argument('--model', default='gpt-4o-mini')
+    parser.add_argument('--limit', type=int, help="Only use the first N questions")
+    parser.add_argument('--json', dest='json_out', help="Write the summary and per-question rows to this file")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)[:args.limit]
+    ranker = LeaveOneOutRanker(load_training_examples(args.training_file), load_policy_vocabulary(args.kb_sentences))
+    with open(args.prompt_file, encoding='utf-8') as f:
+        builder = NLUPromptBuilder(f.read(), ALLOWED_PREDICATES, PREDICATE_INPUT_ARGS, PREDICATE_OUTPUT_VARS,
+                                   ranker, args.max_predicates, args.coverage)
+    client = None
+    if args.llm:
+        from openai import OpenAI
+        client = OpenAI()
+    summary, rows = evaluate(builder, corpus, client, args.model, args.verbose)
+
+    print(f"Questions: {summary['questions']}  shared prefix: ~{builder.prefix_tokens} tokens")
+    for mode in MODES:
+        s = summary[mode]
+        tokens = s['estimated_tokens']
+        line = (f"{mode:>6}: ~{tokens['mean']:.0f} tokens (p95 {tokens['p95']}), {s['predicates_mean']:.1f} predicates detailed, "
+                f"recall {s['recall']:.1%}, build p95 {s['build_ms_p95']:.3f} ms")
+        if client:
+            line += (f"\n        accuracy {s['accuracy']:.1%}, latency p50 {s['latency_ms']['p50']:.0f} ms / "
+                     f"p95 {s['latency_ms']['p95']:.0f} ms, prompt tokens {s['prompt_tokens_mean']:.0f} "
+                     f"({s['cached_tokens_mean']:.0f} cached)")
+        print(line)
+
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'rows': rows}, f, indent=2)
+        print(f"Report written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
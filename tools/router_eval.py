@@ -0,0 +1,132 @@
+# Offline evaluation of the local intent router against logged LLM NLU decisions.
+#
+# Usage (from the repository root):
+#   python tools/router_eval.py backend/nlu_log.jsonl [--threshold 0.85] [--json report.json] [--verbose]
+#
+# The log is the JSONL written by the backend when NLU_LOG_FILE is set: one
+# {"question": ..., "nlu": {...}} record per LLM NLU call. A router_training.json-style
+# list also works: its entries that carry "args" are checked as labelled cases, e.g.
+#   python tools/router_eval.py backend/router_training.json --verbose
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from intent_router import IntentRouter # noqa: E402
+from kb_schema import PREDICATE_INPUT_ARGS # noqa: E402
+from metrics import percentile # noqa: E402
+
+
+def load_log(path):
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            return [{'question': item['question'],
+                     'nlu': {'status': 'success', 'predicate': item['predicate'], 'args': item['args']}}
+                    for item in json.load(f) if 'args' in item]
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get('nlu', {}).get('status') in ('success', 'off_topic', 'missing_info'):
+                records.append(record)
+    return records
+
+
+def compare(router_nlu, llm_nlu):
+    """Returns (status_match, predicate_match, full_match) between router and LLM decisions."""
+    status_match = router_nlu.get('status') == llm_nlu.get('status')
+    if llm_nlu.get('status') == 'off_topic':
+        return status_match, status_match, status_match
+    predicate_match = router_nlu.get('predicate') == llm_nlu.get('predicate')
+    llm_args = dict(llm_nlu.get('args') or {})
+    full_match = status_match and predicate_match and router_nlu.get('args') == llm_args
+    return status_match, predicate_match, full_match
+
+
+def evaluate(router, records, verbose=False):
+    rows = []
+    latencies_ms = []
+    for record in records:
+        question, llm_nlu = record['question'], record['nlu']
+        started = time.perf_counter()
+        router_nlu, confidence = router.route(question)
+        latency_ms = (time.perf_counter() - started) * 1000
+        latencies_ms.append(latency_ms)
+        accepted = router_nlu is not None and confidence >= router.threshold
+        status_match, predicate_match, full_match = compare(router_nlu or {}, llm_nlu)
+        rows.append({
+            'question': question,
+            'llm_predicate': llm_nlu.get('predicate') if llm_nlu.get('status') != 'off_topic' else 'off_topic',
+            'router_predicate': (router_nlu or {}).get('predicate') or (router_nlu or {}).get('status'),
+            'confidence': round(confidence, 4),
+            'accepted': accepted,
+            'predicate_match': predicate_match,
+            'full_match': full_match,
+            'latency_ms': round(latency_ms, 4),
+        })
+        if verbose:
+            marker = 'OK ' if full_match else ('~  ' if predicate_match else 'XX ')
+            print(f"{marker}{'route' if accepted else 'llm  '} conf={confidence:.3f} {latency_ms:.3f}ms | "
+                  f"{question!r} -> router={rows[-1]['router_predicate']} llm={rows[-1]['llm_predicate']}")
+
+    accepted_rows = [r for r in rows if r['accepted']]
+    summary = {
+        'questions': len(rows),
+        'threshold': router.threshold,
+        'coverage': len(accepted_rows) / len(rows) if rows else 0.0,
+        'predicate_agreement_all': sum(r['predicate_match'] for r in rows) / len(rows) if rows else 0.0,
+        'full_agreement_accepted': sum(r['full_match'] for r in accepted_rows) / len(accepted_rows) if accepted_rows else 0.0,
+        'predicate_agreement_accepted': sum(r['predicate_match'] for r in accepted_rows) / len(accepted_rows) if accepted_rows else 0.0,
+        'latency_ms': {
+            'mean': statistics.mean(latencies_ms) if latencies_ms else 0.0,
+            'p50': percentile(latencies_ms, 50),
+            'p95': percentile(latencies_ms, 95),
+            'max': max(latencies_ms) if latencies_ms else 0.0,
+        },
+    }
+    return summary, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the local intent router against logged LLM NLU output.")
+    parser.add_argument('log_file', help="JSONL file written via NLU_LOG_FILE")
+    parser.add_argument('--threshold', type=float, default=0.85)
+    parser.add_argument('--training-file', default=os.path.join(BACKEND_DIR, 'router_training.json'))
+    parser.add_argument('--kb-sentences', default=os.path.join(BACKEND_DIR, '..', 'tools', 'kb_sentences.json'))
+    parser.add_argument('--train-on-log', action='store_true',
+                        help="Also train on the log itself (in-sample; useful to size the gain from logged data)")
+    parser.add_argument('--json', dest='json_out', help="Write the summary and per-question rows to this file")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    router = IntentRouter.from_files(
+        args.training_file, PREDICATE_INPUT_ARGS, args.kb_sentences,
+        args.log_file if args.train_on_log else None, args.threshold)
+    records = load_log(args.log_file)
+    summary, rows = evaluate(router, records, args.verbose)
+
+    print(f"Questions: {summary['questions']}  threshold: {summary['threshold']}")
+    print(f"Coverage (answered locally): {summary['coverage']:.1%}")
+    print(f"Agreement on locally answered: predicate {summary['predicate_agreement_accepted']:.1%}, "
+          f"predicate+args {summary['full_agreement_accepted']:.1%}")
+    print(f"Predicate agreement over all questions: {summary['predicate_agreement_all']:.1%}")
+    latency = summary['latency_ms']
+    print(f"Router latency: mean {latency['mean']:.3f} ms, p50 {latency['p50']:.3f} ms, "
+          f"p95 {latency['p95']:.3f} ms, max {latency['max']:.3f} ms")
+
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'rows': rows}, f, indent=2)
+        print(f"Report written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,367 @@
-import requests
-from bs4 import BeautifulSoup
-import re
+# Incremental ingestion of the SSENSE return policy page with change detection.
+#
+# Usage (from the repository root):
+#   python tools/scrapper.py                      # report what changed since tools/kb_sentences.json
+#   python tools/scrapper.py --write              # ...and update the snapshot and fetch state
+#   python tools/scrapper.py --verify --json policy_diff.json
+#   python tools/scrapper.py --url http://127.0.0.1:8200/ --save-html page.html
+#
+# The page is fetched with a conditional GET (If-None-Match / If-Modified-Since from the last
+# --write run), so an unchanged page costs one 304. A changed page is parsed as it streams in:
+# <p> text -> sentences -> content hashes. The hashes are diffed against the snapshot, and every
+# added, removed or changed sentence is mapped to the ssense_policy.pl facts it most likely affects
+# and to the tools/prolog_test.py cases that read those facts; --verify runs just those cases.
+# To test without the live site, serve a saved page with tools/mock_policy_page.py.
+import argparse
+import codecs
+import difflib
+import hashlib
 import json
+import math
+import os
+import re
+import sys
+import time
+from html.parser import HTMLParser
+
+import requests
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(TOOLS_DIR, '..', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from intent_router import STOPWORDS # noqa: E402
+from nlu_cache import normalize_question # noqa: E402
 
-url = "https://www.ssense.com/en-ca/customer-service/return-policy"
-headers = {
+DEFAULT_URL = "https://www.ssense.com/en-ca/customer-service/return-policy"
+DEFAULT_SNAPSHOT = os.path.join(TOOLS_DIR, 'kb_sentences.json')
+DEFAULT_STATE = os.path.join(TOOLS_DIR, 'scrape_state.json')
+DEFAULT_KB = os.path.join(BACKEND_DIR, 'ssense_policy.pl')
+HEADERS = {
     "User-Agent": "Mozilla/5.0",
 }
-response = requests.get(url, headers=headers)
-soup = BeautifulSoup(response.content, "html.parser")
+CHUNK_SIZE = 16 * 1024
+SENTENCE_SPLIT_RE = re.compile(r'(?<=\.)\s+(?=[A-Z])')
+
+# --- Fact matching ---
+CLAUSE_CALL_RE = re.compile(r"\b([a-z]\w*)\s*\(")
+ATOM_TOKEN_RE = re.compile(r"[a-z]+|\d+")
+COMMENT_RE = re.compile(r"('(?:[^'\\]|\\.)*')|%.*")
+# Atoms that appear across the KB without saying anything about a specific rule.
+FACT_STOPWORDS = {
+    'p1', 'req', 'crit', 'excl', 'ref', 'ship', 'cc', 'true', 'false', 'not', 'has', 'attribute',
+    'instance', 'region', 'requires', 'rule', 'includes', 'via', 'item', 'return', 'returns',
+}
+# Policy wording that the KB spells differently.
+SYNONYMS = {
+    'prepaid': 'ppl', 'kingdom': 'uk', 'states': 'usa', 'authorization': 'ra', 'korean': 'korea',
+    'refunded': 'refund', 'masks': 'mask', 'coverings': 'covering', 'stickers': 'sticker',
+}
+MIN_FACT_SCORE = 3.0
+# Words that differ between the old and new wording of a changed sentence count this much more.
+CHANGED_WORD_WEIGHT = 3.0
+MAX_FACTS_PER_CHANGE = 5
+
+
+class ParagraphParser(HTMLParser):
+    """
+    Incremental <p> extractor: feed() HTML chunks, then drain() the paragraphs closed so far. Text
+    pieces are stripped and joined without a separator, like BeautifulSoup's get_text(strip=True),
+    so sentences match snapshots taken with the previous scraper.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._depth = 0
+        self._pieces = []
+        self._ready = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'p':
+            self._depth += 1
+
+    def handle_endtag(self, tag):
+        if tag == 'p' and self._depth:
+            self._depth -= 1
+            if not self._depth:
+                self._ready.append(''.join(self._pieces))
+                self._pieces = []
+
+    def handle_data(self, data):
+        if self._depth and data.strip():
+            self._pieces.append(data.strip())
+
+    def drain(self):
+        ready, self._ready = self._ready, []
+        return ready
+
+
+def sentence_hash(sentence):
+    return hashlib.sha256(sentence.encode('utf-8')).hexdigest()[:16]
+
+
+def iter_paragraphs(chunks):
+    parser = ParagraphParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from parser.drain()
+    parser.close()
+    yield from parser.drain()
+
+
+def iter_sentences(paragraphs):
+    for paragraph in paragraphs:
+        for sentence in SENTENCE_SPLIT_RE.split(paragraph):
+            if sentence.strip():
+                yield sentence.strip()
+
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def fetch_page(url, state, save_html=None):
+    """
+    Conditional GET of the policy page. Returns (status, sentences, validators): sentences is None
+    on a 304; validators holds the response's ETag and Last-Modified for the next run.
+    """
+    headers = dict(HEADERS)
+    if state.get('url') == url:
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+    with requests.get(url, headers=headers, stream=True, timeout=30) as response:
+        validators = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+        if response.status_code == 304:
+            return 304, None, dict(state, **{k: v for k, v in validators.items() if v})
+        response.raise_for_status()
+        decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        saved = open(save_html, 'w', encoding='utf-8') if save_html else None
+        try:
+            def chunks():
+                for raw in response.iter_content(CHUNK_SIZE):
+                    text = decoder.decode(raw)
+                    if saved:
+                        saved.write(text)
+                    yield text
+                text = decoder.decode(b'', final=True)
+                if saved:
+                    saved.write(text)
+                yield text
+
+            sentences = list(iter_sentences(iter_paragraphs(chunks())))
+        finally:
+            if saved:
+                saved.close()
+    return response.status_code, sentences, validators
+
+
+def diff_sentences(old_sentences, new_sentences):
+    """Sentence-level diff by content hash. Returns a list of {'op', 'old', 'new'} changes in page order."""
+    old_hashes = [sentence_hash(s) for s in old_sentences]
+    new_hashes = [sentence_hash(s) for s in new_sentences]
+    changes = []
+    matcher = difflib.SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == 'equal':
+            continue
+        old_block, new_block = old_sentences[i1:i2], new_sentences[j1:j2]
+        paired = min(len(old_block), len(new_block))
+        for old, new in zip(old_block, new_block):
+            changes.append({'op': 'changed', 'old': old, 'new': new})
+        changes.extend({'op': 'removed', 'old': old, 'new': None} for old in old_block[paired:])
+        changes.extend({'op': 'added', 'old': None, 'new': new} for new in new_block[paired:])
+    return changes
+
+
+def content_tokens(text):
+    tokens = set()
+    for word in ATOM_TOKEN_RE.findall(normalize_question(text).replace('_', ' ')):
+        word = SYNONYMS.get(word, word)
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        if word not in STOPWORDS and word not in FACT_STOPWORDS and (len(word) > 2 or word.isdigit()):
+            tokens.add(word)
+    return tokens
+
+
+def read_clauses(kb_filename):
+    """Yields (line number, clause text) for every clause in the KB, comments and directives skipped."""
+    with open(kb_filename, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    start, buffer = None, []
+    for number, line in enumerate(lines, 1):
+        code = COMMENT_RE.sub(lambda m: m.group(1) or '', line).strip()
+        if not code and not buffer:
+            continue
+        if start is None:
+            start = number
+        buffer.append(code)
+        if code.endswith('.'):
+            clause = ' '.join(buffer)
+            if not clause.startswith(':-'):
+                yield start, clause
+            start, buffer = None, []
+
+
+class FactIndex:
+    """The KB's facts with their content tokens, and which predicates (transitively) read each fact predicate."""
+
+    def __init__(self, kb_filename):
+        self.facts = []
+        readers = {}
+        for line, clause in read_clauses(kb_filename):
+            head, _, body = clause.partition(':-')
+            name = CLAUSE_CALL_RE.match(head.strip())
+            name = name.group(1) if name else head.strip().rstrip('.')
+            if body:
+                for called in set(CLAUSE_CALL_RE.findall(body)):
+                    readers.setdefault(called, set()).add(name)
+            elif name != 'predicate_explanation':
+                self.facts.append({'line': line, 'fact': clause, 'predicate': name, 'tokens': content_tokens(clause)})
+        document_frequency = {}
+        for fact in self.facts:
+            for token in fact['tokens']:
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+        self.idf = {t: math.log(len(self.facts) / df) for t, df in document_frequency.items()}
+        self.readers = readers
+
+    def matching_facts(self, change):
+        """Facts sharing the change's rarer content words, best first; edited words weigh the most."""
+        old_tokens = content_tokens(change['old'] or '')
+        new_tokens = content_tokens(change['new'] or '')
+        tokens = old_tokens | new_tokens
+        edited = old_tokens ^ new_tokens if change['op'] == 'changed' else set()
+        scored = []
+        for fact in self.facts:
+            shared = tokens & fact['tokens']
+            score = sum(self.idf[t] * (CHANGED_WORD_WEIGHT if t in edited else 1) for t in shared)
+            if score >= MIN_FACT_SCORE:
+                scored.append((score, fact, shared))
+        scored.sort(key=lambda item: -item[0])
+        return [{'line': fact['line'], 'fact': fact['fact'], 'predicate': fact['predicate'],
+                 'score': round(score, 2), 'shared_words': sorted(shared)}
+                for score, fact, shared in scored[:MAX_FACTS_PER_CHANGE]]
+
+    def dependent_predicates(self, predicate_name):
+        """The predicate plus every rule that calls it, directly or through other rules."""
+        seen, pending = {predicate_name}, [predicate_name]
+        while pending:
+            for reader in self.readers.get(pending.pop(), ()):
+                if reader not in seen:
+                    seen.add(reader)
+                    pending.append(reader)
+        return seen
+
+
+def affected_cases(index, fact_predicates):
+    """prolog_test.py cases whose query calls one of the predicates, or a rule that reads them."""
+    import prolog_test
+
+    predicates = set()
+    for predicate_name in fact_predicates:
+        predicates |= index.dependent_predicates(predicate_name)
+    cases = []
+    for _, section_cases in prolog_test.TEST_SECTIONS:
+        for case in section_cases:
+            called = CLAUSE_CALL_RE.match(case[0])
+            if called and called.group(1) in predicates:
+                cases.append(case)
+    return cases
+
+
+def verify_cases(cases, kb_filename):
+    """Runs the selected prolog_test.py cases. Returns the failures as (query, expected, problem)."""
+    import prolog_test
+    from prolog_pool import LocalPrologEngine
+
+    engine = LocalPrologEngine(kb_filename)
+    failures = []
+    for query_str, expected_outcome_desc, expected in cases:
+        try:
+            problem = prolog_test.check_solutions(expected, engine.query(query_str))
+        except Exception as e:
+            problem = f"error: {e}"
+        if problem:
+            failures.append((query_str, expected_outcome_desc, problem))
+    return failures
+
+
+def print_report(report):
+    print(f"{report['url']}: HTTP {report['status']}, {report['sentences']} sentences, {len(report['changes'])} changed")
+    for change in report['changes']:
+        print(f"\n[{change['op']}]")
+        if change['old']:
+            print(f"  - {change['old']}")
+        if change['new']:
+            print(f"  + {change['new']}")
+        for fact in change['facts']:
+            print(f"    ssense_policy.pl:{fact['line']}  {fact['fact']}  ({', '.join(fact['shared_words'])})")
+        if not change['facts']:
+            print("    no matching KB fact")
+    if report['cases']:
+        print(f"\nprolog_test.py cases to re-verify ({len(report['cases'])}):")
+        for query_str in report['cases']:
+            print(f"  {query_str}")
+    for failure in report.get('verify_failures', []):
+        print(f"FAIL: {failure['query']} (expected {failure['expected']}): {failure['problem']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch the return policy page and report sentence-level changes.")
+    parser.add_argument('--url', default=DEFAULT_URL)
+    parser.add_argument('--snapshot', default=DEFAULT_SNAPSHOT, help="Previous sentences (JSON list)")
+    parser.add_argument('--state', default=DEFAULT_STATE, help="ETag/Last-Modified of the last --write run")
+    parser.add_argument('--kb', default=DEFAULT_KB)
+    parser.add_argument('--force', action='store_true', help="Fetch unconditionally")
+    parser.add_argument('--write', action='store_true', help="Update the snapshot and state after a change")
+    parser.add_argument('--verify', action='store_true', help="Run the prolog_test.py cases the changes affect")
+    parser.add_argument('--save-html', help="Also write the fetched page to this file")
+    parser.add_argument('--json', help="Write the report to this file")
+    args = parser.parse_args()
+
+    state = {} if args.force else load_json(args.state, {})
+    started = time.perf_counter()
+    status, sentences, validators = fetch_page(args.url, state, args.save_html)
+    if sentences is None:
+        print(f"{args.url}: not modified since the last run (HTTP 304)")
+        return 0
 
-raw_paragraphs = [p.get_text(strip=True) for p in soup.find_all("p")]
+    index = FactIndex(args.kb)
+    changes = diff_sentences(load_json(args.snapshot, []), sentences)
+    fact_predicates = set()
+    for change in changes:
+        change['facts'] = index.matching_facts(change)
+        fact_predicates.update(fact['predicate'] for fact in change['facts'])
+    cases = affected_cases(index, fact_predicates)
+    report = {
+        'url': args.url,
+        'status': status,
+        'sentences': len(sentences),
+        'changes': changes,
+        'cases': [case[0] for case in cases],
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+    if args.verify and cases:
+        report['verify_failures'] = [{'query': q, 'expected': e, 'problem': p}
+                                     for q, e, p in verify_cases(cases, args.kb)]
+    print_report(report)
 
-cleaned_sentences = []
-for para in raw_paragraphs:
-    split_sents = re.split(r'(?<=\.)\s+(?=[A-Z])', para)
-    cleaned_sentences.extend([s.strip() for s in split_sents if s.strip()])
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.write:
+        with open(args.snapshot, 'w', encoding='utf-8') as f:
+            json.dump(sentences, f, indent=2, ensure_ascii=False)
+        with open(args.state, 'w', encoding='utf-8') as f:
+            json.dump(dict(validators, url=args.url, fetched_at=time.time(), sentences=len(sentences)), f, indent=2)
+        print(f"Saved {len(sentences)} sentences to {args.snapshot}")
+    return 1 if report.get('verify_failures') else 0
 
-with open("cleaned_sentences.json", "w", encoding="utf-8") as f:
-    json.dump(cleaned_sentences, f, indent=2, ensure_ascii=False)
 
-print(f"✅ Extracted {len(cleaned_sentences)} sentences and saved to cleaned_sentences.json")
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())